@@ -0,0 +1,324 @@
+"""
+Ad-hoc read-only queries for the analysts, run safely on the shared server.
+
+Statements come either as SQL or from `build_sql()`, a filter / group-by
+builder over the books table and its publisher and category names. The
+builder only emits identifiers from FIELDS and binds every value.
+
+`Runner` owns a small pool of read-only connections of its own (db_pool)
+and as many worker threads, so ad-hoc queries never take a connection from
+the dashboard's pool and never block a Streamlit script thread:
+- an authorizer only lets a statement read (no writes, PRAGMA, ATTACH or
+  transactions), on top of the `mode=ro` / `query_only` connection
+- a progress handler aborts the statement once its time budget is spent,
+  or as soon as the job is cancelled; `cancel()` also calls `interrupt()`
+- at most `max_rows` rows are fetched; the result says when it was cut
+- `plan()` gives the EXPLAIN QUERY PLAN before anything runs
+
+Usage: python adhoc.py "SELECT ..." [--db books_database.db] [--budget 5] [--max-rows 10000]
+"""
+
+import argparse
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+
+from db_pool import ConnectionPool
+from instrumentation import explain, format_plan, full_scans
+
+
+# Seconds a statement may run, and rows it may return
+TIME_BUDGET = 5.0
+MAX_ROWS = 10_000
+
+# SQLite VM instructions between two checks of the budget and the cancel flag
+PROGRESS_STEPS = 10_000
+
+# Authorizer actions a read-only statement needs: SELECT, reading columns,
+# calling functions (incl. table-valued ones) and recursive CTEs
+ALLOWED_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION, sqlite3.SQLITE_RECURSIVE}
+
+# Builder field label -> SQL expression
+FIELDS = {
+    "Title": "books.book_title",
+    "Authors": "books.book_authors",
+    "Publisher": "p.name",
+    "Category": "c.name",
+    "Year": "books.pub_year",
+    "Format": "CASE books.isEbook WHEN 1 THEN 'eBook' WHEN 0 THEN 'Physical book' END",
+    "Language": "books.language",
+    "Country": "books.country",
+    "Saleability": "books.saleability",
+    "Page Count": "books.pageCount",
+    "Authors Count": "books.author_count",
+    "Average Rating": "books.averageRating",
+    "Ratings Count": "books.ratingsCount",
+    "Price (USD)": "books.price_usd",
+    "Discount %": "books.discount_pct",
+}
+
+NUMERIC_FIELDS = ("Year", "Page Count", "Authors Count", "Average Rating", "Ratings Count",
+                  "Price (USD)", "Discount %")
+
+# Builder operator -> SQL condition over the field expression and one bound value
+OPERATORS = {
+    "=": "{field} = ?",
+    "!=": "{field} != ?",
+    "<": "{field} < ?",
+    "<=": "{field} <= ?",
+    ">": "{field} > ?",
+    ">=": "{field} >= ?",
+    "contains": "instr(lower({field}), lower(?)) > 0",
+}
+
+AGGREGATES = {
+    "Count": "COUNT(*)",
+    "Average": "AVG({field})",
+    "Sum": "TOTAL({field})",
+    "Minimum": "MIN({field})",
+    "Maximum": "MAX({field})",
+}
+
+# `books` keeps its name (no alias), so full scans of it are flagged in the plan
+BUILDER_FROM = """books
+    LEFT JOIN publishers AS p ON p.publisher_id = books.publisher_id
+    LEFT JOIN categories AS c ON c.category_id = books.category_id"""
+
+Filter = namedtuple("Filter", ["field", "op", "value"])
+
+Result = namedtuple("Result", ["columns", "rows", "truncated", "seconds"])
+
+
+class BuilderError(ValueError):
+    pass
+
+
+class QueryTimeout(RuntimeError):
+    pass
+
+
+class QueryCancelled(RuntimeError):
+    pass
+
+
+def _field(label):
+    if label not in FIELDS:
+        raise BuilderError(f"unknown field: {label}")
+    return FIELDS[label]
+
+
+def _alias(label):
+    return '"' + label.replace('"', '""') + '"'
+
+
+# Output column of a group-by query's aggregate
+def aggregate_label(function, of=None):
+    return "Book Count" if function == "Count" else f"{function} {of}"
+
+
+# A builder query as (sql, params). Without `group_by` it lists `columns`;
+# with it, one row per group with the `aggregate`: (AGGREGATES name, field
+# label, None for Count). `order_by` is an output column label.
+def build_sql(columns, filters=(), group_by=(), aggregate=("Count", None), order_by=None, descending=False):
+    if group_by:
+        function, of = aggregate
+        if function not in AGGREGATES:
+            raise BuilderError(f"unknown aggregate: {function}")
+        if function != "Count" and of is None:
+            raise BuilderError(f"{function} needs a field")
+        outputs = [(label, _field(label)) for label in group_by]
+        outputs.append((aggregate_label(function, of), AGGREGATES[function].format(field=_field(of) if of else None)))
+    else:
+        if not columns:
+            raise BuilderError("choose at least one column")
+        outputs = [(label, _field(label)) for label in columns]
+
+    conditions, params = [], []
+    for field, op, value in filters:
+        if op not in OPERATORS:
+            raise BuilderError(f"unknown operator: {op}")
+        if op != "contains" and field in NUMERIC_FIELDS:
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                raise BuilderError(f"{field} {op} needs a number, not {value!r}") from None
+        conditions.append(OPERATORS[op].format(field=_field(field)))
+        params.append(value)
+
+    labels = [label for label, _ in outputs]
+    sql = "SELECT\n    " + ",\n    ".join(f"{expr} AS {_alias(label)}" for label, expr in outputs)
+    sql += f"\nFROM {BUILDER_FROM}"
+    if conditions:
+        sql += "\nWHERE " + "\n    AND ".join(conditions)
+    if group_by:
+        sql += "\nGROUP BY " + ", ".join(str(position) for position in range(1, len(group_by) + 1))
+    if order_by is not None:
+        if order_by not in labels:
+            raise BuilderError(f"cannot order by {order_by}: not an output column")
+        sql += f"\nORDER BY {labels.index(order_by) + 1}{' DESC' if descending else ''}"
+    return sql + ";", tuple(params)
+
+
+def _authorize(action, table, *args):
+    if action in ALLOWED_ACTIONS:
+        return sqlite3.SQLITE_OK
+    # Table-valued functions (json_each, as in queries.scoped_sql) declare
+    # their schema on first use, which is authorized as a sqlite_master
+    # update; the connection itself cannot write
+    if action == sqlite3.SQLITE_UPDATE and table == "sqlite_master":
+        return sqlite3.SQLITE_OK
+    return sqlite3.SQLITE_DENY
+
+
+# Read-only statements only, while the block runs. The connection is pooled,
+# so the authorizer and progress handler are removed afterwards.
+@contextmanager
+def _guarded(conn, progress=None):
+    conn.set_authorizer(_authorize)
+    if progress is not None:
+        conn.set_progress_handler(progress, PROGRESS_STEPS)
+    try:
+        yield conn
+    finally:
+        conn.set_progress_handler(None, PROGRESS_STEPS)
+        conn.set_authorizer(None)
+
+
+class Job:
+    # One submitted statement; `result()` waits for it
+    def __init__(self, sql, params, budget, max_rows):
+        self.sql = sql
+        self.params = params
+        self.budget = budget
+        self.max_rows = max_rows
+        self.submitted = time.monotonic()
+        self.started = None
+        self.future = None
+        self._cancelled = threading.Event()
+        self._deadline = None
+        self._conn = None
+        self._lock = threading.Lock()
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - (self.started or self.submitted)
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def done(self):
+        return self.future.done()
+
+    # Non-zero stops the statement (sqlite3 raises OperationalError "interrupted")
+    def _progress(self):
+        return self._cancelled.is_set() or time.monotonic() > self._deadline
+
+    def cancel(self):
+        self._cancelled.set()
+        with self._lock:
+            # Only while the statement holds the connection: once it is back
+            # in the pool, interrupt() would stop someone else's query
+            if self._conn is not None:
+                self._conn.interrupt()
+
+    def run(self, conn):
+        if self._cancelled.is_set():
+            raise QueryCancelled("cancelled before it started")
+        self.started = time.monotonic()
+        self._deadline = self.started + self.budget
+        with self._lock:
+            self._conn = conn
+        try:
+            with _guarded(conn, self._progress):
+                try:
+                    cursor = conn.execute(self.sql, self.params)
+                    rows = cursor.fetchmany(self.max_rows + 1)
+                except sqlite3.OperationalError as exc:
+                    if self._cancelled.is_set():
+                        raise QueryCancelled(f"cancelled after {self.elapsed:.1f}s") from exc
+                    if time.monotonic() > self._deadline:
+                        raise QueryTimeout(f"stopped after the {self.budget:g}s time budget") from exc
+                    raise
+                columns = [column[0] for column in cursor.description or ()]
+                cursor.close()
+        finally:
+            with self._lock:
+                self._conn = None
+        return Result(columns, rows[:self.max_rows], len(rows) > self.max_rows, self.elapsed)
+
+    def result(self, timeout=None):
+        return self.future.result(timeout)
+
+
+class Runner:
+    # `workers` read-only connections and threads for ad-hoc statements; jobs
+    # beyond that wait in the executor's queue
+    def __init__(self, db_path, workers=2, budget=TIME_BUDGET, max_rows=MAX_ROWS, metrics=None):
+        self.budget = budget
+        self.max_rows = max_rows
+        self.metrics = metrics
+        self.pool = ConnectionPool(db_path, size=workers)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="adhoc")
+
+    def _stage(self, stage):
+        return self.metrics.stage("adhoc", stage) if self.metrics is not None else nullcontext()
+
+    # The statement's query plan as (id, parent, detail) rows, without running it
+    def plan(self, sql, params=()):
+        with self.pool.connection() as conn, _guarded(conn):
+            return explain(conn, sql, params)
+
+    def _run(self, job):
+        with self._stage("connect"), self.pool.connection() as conn:
+            if self.metrics is not None:
+                with _guarded(conn):
+                    self.metrics.capture_plan("adhoc", conn, job.sql, job.params)
+            with self._stage("execute"):
+                result = job.run(conn)
+        if self.metrics is not None:
+            self.metrics.count_rows("adhoc", len(result.rows))
+        return result
+
+    def submit(self, sql, params=()):
+        job = Job(sql, tuple(params), self.budget, self.max_rows)
+        job.future = self._executor.submit(self._run, job)
+        return job
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.pool.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a read-only ad-hoc query with a time budget.")
+    parser.add_argument("sql")
+    parser.add_argument("--db", default="books_database.db")
+    parser.add_argument("--budget", type=float, default=TIME_BUDGET, help="seconds")
+    parser.add_argument("--max-rows", type=int, default=MAX_ROWS)
+    args = parser.parse_args(argv)
+
+    runner = Runner(args.db, workers=1, budget=args.budget, max_rows=args.max_rows)
+    try:
+        plan = runner.plan(args.sql)
+        print(format_plan(plan))
+        for table in full_scans(plan):
+            print(f"warning: reads every row of {table}")
+        print()
+        result = runner.submit(args.sql).result()
+    except (sqlite3.Error, QueryTimeout, QueryCancelled) as exc:
+        raise SystemExit(f"error: {exc}")
+    finally:
+        runner.close()
+    print("\t".join(result.columns))
+    for row in result.rows:
+        print("\t".join("" if value is None else str(value) for value in row))
+    cut = f", cut at {args.max_rows:,}" if result.truncated else ""
+    print(f"\n{len(result.rows):,} rows in {result.seconds * 1e3:.0f} ms{cut}")
+
+
+if __name__ == "__main__":
+    main()
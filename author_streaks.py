@@ -0,0 +1,53 @@
+"""
+Consecutive-year publishing streaks per author.
+
+Works on individual authors (the `book_authors` link table, not the joined
+author string) and the integer `pub_year`. A streak is a run of consecutive
+years in which the author published at least one book; runs are found with the
+gaps-and-islands trick: within one author's sorted distinct years,
+`year - row_number()` is constant exactly along a consecutive run.
+"""
+
+
+# Longest streak per author (latest one on ties), keeping streaks >= ? years
+LONGEST_STREAKS_SQL = """
+    WITH author_years AS (
+        SELECT DISTINCT ba.author_id, b.pub_year
+        FROM book_authors AS ba
+        JOIN books AS b ON b.book_id = ba.book_id
+        WHERE b.pub_year IS NOT NULL
+    ),
+    islands AS (
+        SELECT
+            author_id,
+            pub_year,
+            pub_year - ROW_NUMBER() OVER (PARTITION BY author_id ORDER BY pub_year) AS island
+        FROM author_years
+    ),
+    streaks AS (
+        SELECT
+            author_id,
+            COUNT(*) AS streak_years,
+            MIN(pub_year) AS first_year,
+            MAX(pub_year) AS last_year
+        FROM islands
+        GROUP BY author_id, island
+    ),
+    ranked AS (
+        SELECT
+            *,
+            ROW_NUMBER() OVER (
+                PARTITION BY author_id ORDER BY streak_years DESC, last_year DESC
+            ) AS streak_rank
+        FROM streaks
+    )
+    SELECT
+        a.name,
+        r.streak_years,
+        r.first_year,
+        r.last_year
+    FROM ranked AS r
+    JOIN authors AS a ON a.author_id = r.author_id
+    WHERE r.streak_rank = 1 AND r.streak_years >= ?
+    ORDER BY r.streak_years DESC, r.last_year DESC, a.name;
+"""
@@ -0,0 +1,250 @@
+"""
+Benchmark every dashboard question against synthetic catalogs of growing size.
+
+For each size a synthetic `books` table is generated and run through the
+migrations, like a freshly ingested export. The rows are bootstrapped from the
+real database, so prices, ratings, page counts, formats and title keywords keep
+their real joint distribution. Authors, publishers and categories are drawn
+from Zipf-distributed pools that grow with the catalog:
+- authors are comma-joined
+- most publishers are in the exploded 'O,\\',R,e,i,l,l,y' form
+- `year` is a YYYY / YYYY-MM / YYYY-MM-DD string with about 1% NULLs
+
+Each question is timed in two stages:
+- the query: execute + fetch on a read-only connection with the dashboard's
+  pragmas
+- the frame: DataFrame construction plus, for questions with a chart (a
+  ChartSpec or figures.FIGURES, built as report.py does), the chart data and
+  an uncached matplotlib render
+
+It reports p50/p95 latency, result rows, rows/s and the peak RSS of the process
+measuring each size (each size runs in its own worker process) as JSON.
+
+Usage: python benchmark.py [--sizes 1000 100000] [--repeat 5] [--output results.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+import charts
+import queries
+import report
+from cleaning import decode_publisher
+from db_pool import open_readonly
+from migrations import BOOK_COLUMNS, BOOKS_DDL, migrate, split_authors
+
+
+SIZES = (1_000, 100_000, 1_000_000, 10_000_000)
+
+GENERATE_BATCH = 100_000
+
+# Share of NULL `year` values, and of publishers stored in the exploded form
+NULL_YEAR_RATE = 0.01
+EXPLODED_PUBLISHER_RATE = 0.6
+
+
+def _percentile(timings, q):
+    return float(np.percentile(timings, q) * 1e3) if timings else None
+
+
+# -- synthetic data ------------------------------------------------------
+
+
+def _explode(name):
+    # Inverse of cleaning.decode_publisher: CSV-quote, then comma-join characters
+    if "," in name or '"' in name:
+        name = '"' + name.replace('"', '""') + '"'
+    return ",".join(name)
+
+
+# Name pool of `size` entries: the real names first, then numbered variants
+def _pool(real_names, size):
+    real_names = sorted(set(real_names)) or ["Unknown"]
+    return [
+        real_names[i % len(real_names)] + (f" {i // len(real_names)}" if i >= len(real_names) else "")
+        for i in range(size)
+    ]
+
+
+def _zipf_choice(rng, pool, count, a=1.2):
+    # Zipf ranks folded into the pool, so a few names are very common
+    return pool[(rng.zipf(a, count) - 1) % len(pool)]
+
+
+class Profile:
+    # Columns and name pools sampled from a real books table
+    def __init__(self, db_path):
+        with sqlite3.connect(f"file:{db_path}?mode=ro", uri=True) as conn:
+            self.rows = pd.read_sql_query(f"SELECT {', '.join(BOOK_COLUMNS)} FROM books", conn)
+        self.authors = [a for value in self.rows["book_authors"].dropna() for a in split_authors(value)]
+        self.author_counts = np.array(
+            [len(split_authors(value)) or 1 for value in self.rows["book_authors"].dropna()])
+        self.publishers = [decode_publisher(value) for value in self.rows["book_publisher"].dropna()]
+        self.categories = self.rows["categories"].dropna().tolist()
+
+    # Author, publisher and category pools scaled to a catalog of `size` books
+    def pools(self, size):
+        return (
+            np.asarray(_pool(self.authors, max(50, size // 3)), dtype=object),
+            np.asarray(_pool(self.publishers, max(20, size // 40)), dtype=object),
+            np.asarray(_pool(self.categories, max(20, size // 20)), dtype=object),
+        )
+
+
+def generate_batch(profile, pools, rng, start, count):
+    author_pool, publisher_pool, category_pool = pools
+    batch = profile.rows.iloc[rng.integers(0, len(profile.rows), count)].reset_index(drop=True)
+    batch["book_id"] = [f"syn{i:09d}" for i in range(start, start + count)]
+
+    authors_per_book = profile.author_counts[rng.integers(0, len(profile.author_counts), count)]
+    names = _zipf_choice(rng, author_pool, int(authors_per_book.sum()))
+    bounds = np.concatenate(([0], np.cumsum(authors_per_book)))
+    batch["book_authors"] = [",".join(names[bounds[i]:bounds[i + 1]]) for i in range(count)]
+
+    publishers = _zipf_choice(rng, publisher_pool, count)
+    exploded = rng.random(count) < EXPLODED_PUBLISHER_RATE
+    batch["book_publisher"] = [_explode(p) if e else p for p, e in zip(publishers, exploded)]
+    batch["categories"] = _zipf_choice(rng, category_pool, count)
+
+    # Publication dates skewed towards recent years, in the three export formats
+    years = np.clip(2025 - rng.exponential(8, count).astype(int), 1900, 2025)
+    months, days = rng.integers(1, 13, count), rng.integers(1, 29, count)
+    formats = rng.choice(3, count, p=[0.4, 0.05, 0.55])
+    batch["year"] = [
+        None if null else (f"{y}", f"{y}-{m:02d}", f"{y}-{m:02d}-{d:02d}")[f]
+        for y, m, d, f, null in zip(years, months, days, formats, rng.random(count) < NULL_YEAR_RATE)
+    ]
+    return batch
+
+
+def generate(db_path, size, profile, seed=0):
+    rng = np.random.default_rng(seed)
+    pools = profile.pools(size)
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute(BOOKS_DDL)
+    insert = f"INSERT INTO books ({', '.join(BOOK_COLUMNS)}) VALUES ({', '.join('?' * len(BOOK_COLUMNS))})"
+    for start in range(0, size, GENERATE_BATCH):
+        batch = generate_batch(profile, pools, rng, start, min(GENERATE_BATCH, size - start))
+        batch = batch.astype(object).where(batch.notna(), None)
+        with conn:
+            conn.executemany(insert, batch[list(BOOK_COLUMNS)].itertuples(index=False, name=None))
+    conn.close()
+
+
+# -- measurements --------------------------------------------------------
+
+
+def _frame_stage(question, result, renderer):
+    if not question.one:
+        result = pd.DataFrame(result, columns=question.columns)
+    job = report.chart_job(question.id, result)
+    if job is not None:
+        chart_id, draw, data, figsize, options = job
+        renderer.clear()
+        renderer.render(chart_id, draw, data, figsize, **options)
+
+
+def time_question(conn, question, repeat, renderer, size):
+    query_times, frame_times = [], []
+    for run in range(repeat + 1):
+        started = time.perf_counter()
+        cursor = conn.execute(question.sql, question.params)
+        result = cursor.fetchone() if question.one else cursor.fetchall()
+        fetched = time.perf_counter()
+        _frame_stage(question, result, renderer)
+        finished = time.perf_counter()
+        if run:  # the first run warms the page cache and the statement cache
+            query_times.append(fetched - started)
+            frame_times.append(finished - fetched)
+    rows = (1 if result else 0) if question.one else len(result)
+    query_p50 = _percentile(query_times, 50)
+    return {
+        "rows": rows,
+        "query_ms": {"p50": query_p50, "p95": _percentile(query_times, 95)},
+        "frame_ms": {"p50": _percentile(frame_times, 50), "p95": _percentile(frame_times, 95)},
+        # Result rows, and catalog rows answered, per second of query time
+        "rows_per_sec": rows / (query_p50 / 1e3) if query_p50 else None,
+        "catalog_rows_per_sec": size / (query_p50 / 1e3) if query_p50 else None,
+    }
+
+
+def bench_size(size, workdir, profile_db, repeat, regenerate=False, seed=0):
+    db_path = os.path.join(workdir, f"books_{size}.db")
+    result = {"size": size, "db_path": db_path}
+    if regenerate or not os.path.exists(db_path):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+        started = time.perf_counter()
+        generate(db_path, size, Profile(profile_db), seed)
+        result["generate_s"] = time.perf_counter() - started
+        started = time.perf_counter()
+        migrate(db_path)
+        result["migrate_s"] = time.perf_counter() - started
+    result["db_bytes"] = os.path.getsize(db_path)
+
+    conn = open_readonly(db_path)
+    renderer = charts.ChartRenderer()
+    result["questions"] = {
+        question_id: time_question(conn, question, repeat, renderer, size)
+        for question_id, question in queries.QUESTIONS.items()
+    }
+    conn.close()
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result["peak_rss_bytes"] = peak if sys.platform == "darwin" else peak * 1024
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard questions on synthetic catalogs.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES), help="catalog sizes in rows")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per question")
+    parser.add_argument("--profile-db", default="books_database.db", help="real database to sample from")
+    parser.add_argument("--workdir", default="benchmark_data", help="where generated databases are kept")
+    parser.add_argument("--regenerate", action="store_true", help="rebuild databases that already exist")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.workdir, exist_ok=True)
+    results = []
+    for size in args.sizes:
+        print(f"benchmarking {size:,} rows...", file=sys.stderr, flush=True)
+        # A fresh process per size, so peak RSS belongs to that size alone
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            results.append(pool.submit(
+                bench_size, size, args.workdir, args.profile_db, args.repeat, args.regenerate, args.seed,
+            ).result())
+
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,38 @@
 
 
+import json
+import os
 import pandas as pd
 import sqlite3
-import matplotlib.pyplot as plt
 import streamlit as st
+import time
+from contextlib import nullcontext
+
+import adhoc
+import catalog
+import charts
+import columnar
+import facets
+import figures
+import insights
+import instrumentation
+import outliers
+import pricing
+import queries
+import search
+import similarity
+import views
+from db_pool import ConnectionPool
+from migrations import migrate
+from query_cache import QueryCache
+
+# The database served (BOOKSCAPE_DB, e.g. a copy for tests)
+DB_PATH = os.environ.get("BOOKSCAPE_DB", "books_database.db")
+
+# Optional metrics export: a Prometheus text file rewritten after every page
+# run, and/or a local HTTP endpoint serving /metrics on this port
+METRICS_FILE = os.environ.get("BOOKSCAPE_METRICS_FILE")
+METRICS_PORT = os.environ.get("BOOKSCAPE_METRICS_PORT")
 
 # Streamlit App Layout
 st.title("Books Data Analysis")
@@ -11,406 +40,333 @@ st.title("Books Data Analysis")
 # Floating Recommendations Button
 recommendations_button = st.sidebar.button("Overall Insights and Recommendations")
 
-# Recommendations Content
-recommendations_content = """
-### Overall Insights and Recommendations for the Dataset
-#### Key Insights:
-1. **Physical Books**: Higher page counts and prices, but slightly outnumbered by eBooks.
-2. **Discounts**: Discounts of over 20% are common, potentially signaling competitive pricing strategies.
-3. **Popular Authors and Publishers**: Repeated names like *Michael R. Berthold* and *O'Reilly Media Inc.* dominate the industry.
-4. **Emerging Trends**: Python-related books and academic content show growing demand.
-
----
-
-#### Recommendations:
-1. **Focus Marketing on Emerging Topics**:
-    - Promote Python-related and high-demand categories.
-2. **Enhance eBook Offerings**:
-    - Capitalize on the slightly higher demand for eBooks by expanding digital collections.
-3. **Collaborative Publications**:
-    - Invest in books with multiple authors for complex or academic subjects.
-4. **Price Adjustments**:
-    - Consider optimizing prices for eBooks to compete more effectively with physical books.
-5. **Leverage High-Rated Publishers**:
-    - Highlight top publishers like Springer Nature in marketing campaigns.
-6. **Analyze Low-Rated Books**:
-    - Replace or improve poorly rated books to enhance customer satisfaction.
-7. **Focus on Digital Trends**:
-    - The dominance of eBooks suggests that investment in digital formats will yield better returns.
-8. **Promote Prolific Authors**:
-    - Authors with multiple books in the same year or across different years should be promoted for audience retention.
-9. **Keyword Analysis**:
-    - Invest in Python and Data Science-related books to capitalize on their popularity.
-"""
+# The recommendations are computed from the summary aggregates further down,
+# once the query helpers exist, and shown here above the question
+recommendations_area = st.empty()
+
+# Book lookup: the details of a book and its similar titles, shown here too
+book_lookup = st.sidebar.text_input("Look up a book", placeholder="Title or keywords").strip()
+book_area = st.container()
+
+
+# Dropdown to select a query; the ad-hoc query page comes after the fixed questions
+ADHOC = queries.Question("adhoc", "Ad-hoc query", None, [])
+question_title = st.selectbox("Select a question to see the answer", [*queries.BY_TITLE, ADHOC.title])
+question = queries.BY_TITLE.get(question_title, ADHOC)
+
+# Read-only connections shared by every session of this server process.
+# Pending schema migrations are applied once, before the pool opens.
+@st.cache_resource
+def get_connection_pool():
+    migrate(DB_PATH)
+    return ConnectionPool(DB_PATH, size=4)
+
+
+# Stage timings, row counts and query plans of every session of this server
+# process
+@st.cache_resource
+def get_metrics():
+    metrics = instrumentation.Metrics()
+    if METRICS_PORT:
+        instrumentation.serve_metrics(metrics, int(METRICS_PORT))
+    return metrics
+
+
+# Shared result cache: one per server process, reused by every session and rerun
+@st.cache_resource
+def get_query_cache():
+    return QueryCache(DB_PATH, get_connection_pool().connection, metrics=get_metrics())
+
+
+# In-process columnar copy of the tables, loaded on first use (needs duckdb)
+@st.cache_resource
+def get_columnar_engine():
+    return columnar.ColumnarEngine(DB_PATH)
+
+
+# Compact pandas copy of the catalog (dictionary-encoded columns), loaded on first use
+@st.cache_resource
+def get_catalog():
+    get_connection_pool()  # pending migrations first
+    return catalog.CatalogEngine(DB_PATH)
+
+
+# Query engine: SQLite answers every question; the in-memory catalog answers
+# the single-table aggregates, the columnar engine (when installed) all but
+# the full-text search ones
+query_engines = ["SQLite", "In-memory catalog"]
+if columnar.available():
+    query_engines.append("DuckDB (columnar)")
+query_engine = st.sidebar.radio("Query engine", query_engines)
+
+
+# Worker threads and read-only connections of their own for ad-hoc queries,
+# so a slow one never holds up the dashboard's pool
+@st.cache_resource
+def get_adhoc_runner():
+    get_connection_pool()  # pending migrations first
+    return adhoc.Runner(DB_PATH, metrics=get_metrics())
+
+
+# Bitmap indexes of the catalog filters, rebuilt when the DB file changes
+@st.cache_resource
+def get_facets():
+    get_connection_pool()  # pending migrations first
+    return facets.Facets(DB_PATH)
+
+
+# Sidebar filters over the catalog. Each value is labelled with the number of
+# books it would match given the other filters; the counts are computed from
+# the choices of the current run (already in the session state).
+def facet_filters(index):
+    st.sidebar.subheader("Filter the catalog")
+    counts = index.counts({facet.name: st.session_state.get(f"facet_{facet.name}") for facet in facets.FACETS})
+    selection = {}
+    for facet in facets.FACETS:
+        key = f"facet_{facet.name}"
+        if facet.kind == "values":
+            if index.values[facet.name]:
+                selection[facet.name] = st.sidebar.multiselect(
+                    facet.label, index.values[facet.name], key=key,
+                    format_func=lambda value, matches=counts[facet.name]: f"{value} ({matches[value]:,})",
+                )
+        elif index.ranges[facet.name] is not None:
+            low, high = index.ranges[facet.name]
+            if low.is_integer() and high.is_integer():
+                low, high = int(low), int(high)
+            selection[facet.name] = st.sidebar.slider(facet.label, low, high, (low, high), key=key)
+            st.sidebar.caption(f"{counts[facet.name]:,} books in range")
+    return selection
+
+
+facet_index = get_facets().index()
+scope = facet_index.scope(facet_filters(facet_index))
+if scope is None:
+    st.sidebar.caption(f"All {facet_index.size:,} books")
+else:
+    st.sidebar.caption(f"{scope.count:,} of {facet_index.size:,} books selected")
+
+
+# The columnar copy has no rowids, so filtered questions always run on SQLite
+def use_columnar(question_id):
+    return scope is None and query_engine == "DuckDB (columnar)" and question_id not in columnar.UNSUPPORTED
+
+
+# Same for the in-memory catalog, which answers only the questions it has a
+# pandas implementation of (catalog.ANSWERS)
+def use_catalog(question_id):
+    return scope is None and query_engine == "In-memory catalog" and question_id in catalog.ANSWERS
+
+
+# A question's statement and parameters over the books selected by the
+# sidebar filters (unchanged when nothing is filtered)
+def scoped(sql, params):
+    if scope is None:
+        return sql, params
+    return queries.scoped_sql(sql), (scope.rowids, *params)
+
+
+# Execute a registered question (with its default parameters unless given), or
+# serve it from the cache if the DB is unchanged
+def run_query(question, params=None):
+    params = question.params if params is None else params
+    if use_columnar(question.id):
+        with get_metrics().stage(question.id, "execute"):
+            result = get_columnar_engine().fetch(question.id, question.sql, params, one=question.one)
+    elif use_catalog(question.id):
+        with get_metrics().stage(question.id, "execute"):
+            result = get_catalog().fetch(question.id, params, one=question.one)
+    else:
+        sql, params = scoped(question.sql, params)
+        result = get_query_cache().fetch(question.id, sql, params, one=question.one)
+    get_metrics().count_rows(question.id, (1 if result else 0) if question.one else len(result))
+    return result
+
+
+# Execute a question into a DataFrame with its result columns. The columnar
+# engine builds it straight from Arrow buffers, without row tuples.
+def run_frame(question, params=None):
+    if use_columnar(question.id):
+        params = question.params if params is None else params
+        with get_metrics().stage(question.id, "execute"):
+            frame = get_columnar_engine().frame(question.id, question.sql, params, question.columns)
+        get_metrics().count_rows(question.id, len(frame))
+        return frame
+    if use_catalog(question.id):
+        params = question.params if params is None else params
+        with get_metrics().stage(question.id, "execute"):
+            frame = get_catalog().frame(question.id, params, question.columns)
+        get_metrics().count_rows(question.id, len(frame))
+        return frame
+    result = run_query(question, params)
+    with get_metrics().stage(question.id, "frame"):
+        return pd.DataFrame(result, columns=question.columns)
+
+
+# Rendered chart images, shared like the query cache and keyed by the plotted data
+@st.cache_resource
+def get_chart_renderer():
+    return charts.ChartRenderer()
+
+
+# Draw a chart with `draw(fig, ax, data, **options)`, or reuse the cached image
+def show_chart(chart_id, draw, data, figsize=None, **options):
+    with get_metrics().stage(chart_id, "plot"):
+        image = get_chart_renderer().render(chart_id, draw, data, figsize, **options)
+    with get_metrics().stage(chart_id, "display"):
+        st.image(image, width="stretch")
+
+
+# Chart backends for charts described by a charts.ChartSpec
+def show_static_chart(chart_id, spec, data, figsize=None):
+    show_chart(chart_id, charts.draw_spec, data, figsize, spec=spec)
+
+
+def show_interactive_chart(chart_id, spec, data, figsize=None):
+    with get_metrics().stage(chart_id, "plot"):
+        vega_lite = charts.vega_lite_spec(spec, data)
+    with get_metrics().stage(chart_id, "display"):
+        st.vega_lite_chart(data, vega_lite, width="stretch")
+
+
+CHART_BACKENDS = {
+    "Static (matplotlib)": show_static_chart,
+    "Interactive (Vega-Lite)": show_interactive_chart,
+}
+
+# Rendering settings: large results are aggregated down to `point_budget` marks
+# before they reach either backend
+chart_backend = CHART_BACKENDS[st.sidebar.radio("Chart rendering", list(CHART_BACKENDS))]
+point_budget = st.sidebar.slider("Max points per chart", 10, 500, charts.DEFAULT_POINT_BUDGET, step=10)
+
+
+# Draw a question's registered chart from its result DataFrame
+def show_question_chart(question, frame, figsize=None):
+    with get_metrics().stage(question.id, "plot"):
+        data = question.chart_data(frame, point_budget)
+    chart_backend(question.id, question.chart, data, figsize)
 
-# Display Recommendations if Button is Clicked
-if recommendations_button:
-    st.markdown(recommendations_content)
-
-
-# Dropdown to select a query
-question = st.selectbox(
-    "Select a question to see the answer",
-    ["1. Check Availability of eBooks vs Physical Books",
-     "2. Publisher with the Most Books Published",
-     "3. Identify the Publisher with the Highest Average Rating",
-     "4. Top 5 Most Expensive Books by Retail Price",
-     "5. Books Published After 2010 with at Least 500 Pages",
-     "6. List Books with Discounts Greater than 20%",
-     "7. Average Page Count for eBooks vs Physical Books",
-     "8. Top 3 Authors with the Most Books",
-     "9. List Publishers with More than 10 Books",
-     "10. Average Page Count for Each Category",
-     "11. Books with More than 3 Authors",
-     "12. Books with Ratings Count Greater Than the Average",
-     "13. Books with the Same Author Published in the Same Year",
-     "14. Books with a Specific Keyword in the Title",
-     "15. Year with the Highest Average Book Price",
-     "16. Count Authors Who Published 3 Consecutive Years",
-     "17. Authors Who Have Published Books in the Same Year but Under Different Publishers",
-     "18. Average Amount of Retail Price for eBooks and Physical Books",
-     "19. Books with Average Rating More Than Two Standard Deviations Away from the Average",
-     "20. Publisher with the Highest Average Rating Among Publishers with More than 10 Books"]
-)
-
-# Connect to the database to execute the selected query
-conn = sqlite3.connect("books_database.db")
-cursor = conn.cursor()
 
 # 1. Check Availability of eBooks vs Physical Books
-if question == "1. Check Availability of eBooks vs Physical Books":
-    cursor.execute('''
-    SELECT
-        isEbook,
-        COUNT(*) AS book_count
-    FROM books
-    GROUP BY isEbook;
-    ''')
-    result = cursor.fetchall()
+def show_q1(question):
+    page = views.view("q1", run_query(question))
 
     # Extract the counts
-    ebooks_count = next((row[1] for row in result if row[0] == 1), 0)
-    physical_books_count = next((row[1] for row in result if row[0] == 0), 0)
+    data = page.data
 
     # Display the counts
-    st.write(f"Number of EBooks: {ebooks_count}")
-    st.write(f"Number of Physical Books: {physical_books_count}")
+    st.write(f"Number of EBooks: {data['EBooks']}")
+    st.write(f"Number of Physical Books: {data['Physical Books']}")
 
     # Visualization (Pie Chart)
-    data = {'EBooks': ebooks_count, 'Physical Books': physical_books_count}
-    labels = list(data.keys())
-    sizes = data.values()
-
-    # Create a figure
-    fig, ax = plt.subplots()
-    ax.pie(sizes, labels=labels, autopct='%1.1f%%', startangle=90)
-    ax.axis('equal')  # Equal aspect ratio ensures the pie is drawn as a circle.
-
-    # Display the plot in Streamlit
-    st.pyplot(fig)
-    st.markdown("""
-    ### Analysis
-    - **Insight:** There are 665 eBooks (51.7%) and 622 physical books (48.3%). A pie chart is used for visualization.
-    - **Interpretation:** EBooks slightly outnumber physical books, indicating a growing trend in digital reading.
-    """)
+    show_chart("q1", figures.draw_ebook_share, data)
+    st.markdown(page.text)
 
 # 2. Find the Publisher with the Most Books Published
-elif question == "2. Publisher with the Most Books Published":
-    cursor.execute('''
-    SELECT
-        book_publisher,
-        COUNT(*) AS book_count
-    FROM books
-    GROUP BY book_publisher
-    ORDER BY book_count DESC
-    LIMIT 1 OFFSET 1;
-    ''')
-    result = cursor.fetchone()
+def show_q2(question):
+    result = run_query(question)
     if result:
-        publisher, book_count = result
-        publisher = publisher.strip().replace(",", '').replace('"', '').strip()
-        st.markdown("""
-    ### Analysis
-    - **Insight:**""")
-        st.write(f"\t The publisher '{publisher}' has published the highest number of books.")
-        st.write(f"\t Total books published: {book_count}")
-        st.markdown("""
-      - **Business Interpretation:** 
-      \n O'Reilly Media is a key player in the publishing industry, especially in technical and professional books.
-    """)
+        st.markdown(views.view("q2", result).text)
 
 
 # 3. Identify the Publisher with the Highest Average Rating
-elif question == "3. Identify the Publisher with the Highest Average Rating":
-    cursor.execute('''
-    SELECT
-        book_publisher,
-        AVG(averageRating) AS avg_rating
-    FROM books
-    GROUP BY book_publisher
-    ORDER BY avg_rating DESC
-    LIMIT 1;
-    ''')
-    result = cursor.fetchone()
+def show_q3(question):
+    result = run_query(question)
     if result:
-        publisher, avg_rating = result
-        publisher = publisher.strip().replace(",", '').replace('"', '').strip()
-        st.markdown("""
-    ### Analysis
-    - **Insight:**
-    """)
-        st.write(f"The publisher with the highest average rating is: {publisher}")
-        st.write(f"Average rating: {avg_rating}")
-        st.markdown("""
-    - **Interpretation:**
-    \n This indicates that books from Springer Nature are highly rated, suggesting quality content and positive user reception.
-    """)
+        st.markdown(views.view("q3", result).text)
 
 
 # 4. Get the Top 5 Most Expensive Books by Retail Price
-elif question == "4. Top 5 Most Expensive Books by Retail Price":
-    cursor.execute('''
-    SELECT
-        book_title,
-        amount_retailPrice
-    FROM books
-    ORDER BY amount_retailPrice DESC
-    LIMIT 5;
-    ''')
-    result = cursor.fetchall()
-    most_expensive_books = pd.DataFrame(result, columns=["Book Title", "Retail Price"])
+def show_q4(question):
+    page = views.view("q4", run_frame(question))
+    most_expensive_books = page.table
     st.write(most_expensive_books)
 
     # Visualization (Bar Chart)
     st.bar_chart(most_expensive_books, x="Book Title", y="Retail Price", use_container_width=True)
-    st.markdown("""
-    ### Analysis
-    - **Insight:** The top book is "Encyclopedia of Mathematical Geosciences" priced at $519.20.
-    - **Interpretation:** The highest-priced books are academic or professional, reflecting their niche audience and high-value content.
-    """)
+    st.markdown(page.text)
+
+    # Where the rest of the catalog sits: books per price band, in USD
+    st.write("Books per retail price band (USD):")
+    st.dataframe(pricing.bands(run_frame(queries.QUESTIONS["price_bands"]), "$"), hide_index=True)
 
 #  5. Find Books Published After 2010 with at Least 500 Pages
-elif question == "5. Books Published After 2010 with at Least 500 Pages":
-    cursor.execute('''
-    SELECT
-        book_title,
-        strftime('%Y', year) AS year,
-        pageCount
-    FROM books
-    WHERE
-        strftime('%Y', year) > '2010' 
-        AND pageCount >= 500;
-    ''')
-    result = cursor.fetchall()
-
-    # Create a DataFrame from the query result
-    books_after_2010 = pd.DataFrame(result, columns=["Book Title", "Year", "Page Count"])
+def show_q5(question):
+    page = views.view("q5", run_frame(question))
+    books_after_2010 = page.table
     st.write(books_after_2010)  # Show the books with titles in Streamlit
 
-    # Count the number of books published in each year after 2010
-    books_count_per_year = books_after_2010.groupby('Year').size().reset_index(name='Book Count')
-    
-    # Visualization (Bar Chart)
-    fig, ax = plt.subplots(figsize=(10, 6))  # Create a new figure and axes
-
-    # Plot the bar chart showing the number of books per year
-    ax.bar(books_count_per_year["Year"], books_count_per_year["Book Count"], color="blue")
-
-    # Adding the counts as labels on top of the bars
-    for i, count in enumerate(books_count_per_year["Book Count"]):
-        ax.text(books_count_per_year["Year"].iloc[i], count + 1, str(count), ha='center', fontsize=12)
-
-    ax.set_xlabel("Year of Publication", fontsize=12)
-    ax.set_ylabel("Number of Books", fontsize=12)
-    ax.set_title("Number of Books Published After 2010 with At Least 500 Pages", fontsize=14)
-
-    # Display the plot in Streamlit with book counts on the bars
-    st.pyplot(fig)
-    st.markdown("""
-    ### Analysis
-    - **Insight:** 156 books meet the criteria.
-    - **Interpretation:** Indicates that publishers are still investing in substantial content post-2010, possibly reflecting increased demand for comprehensive material. After 2021 there shows a dicline in bar chart which may be the influence of lack of readers, made publishers reduce the number of books they publish.
-    """)
+    # Visualization (Bar Chart) of the number of books per year, with the
+    # counts on the bars
+    show_question_chart(question, books_after_2010, figsize=(10, 6))
+    st.markdown(page.text)
 
 # 6. List Books with Discounts Greater than 20%
-elif question == "6. List Books with Discounts Greater than 20%":
-    cursor.execute('''
-    SELECT
-        book_title,
-        amount_retailPrice,
-        (amount_listPrice - amount_retailPrice) / amount_listPrice * 100 AS discount_percent
-    FROM books
-    WHERE (amount_listPrice - amount_retailPrice) / amount_listPrice * 100 > 21;
-    ''')
-    result = cursor.fetchall()
-    books_with_discount = pd.DataFrame(result, columns=["Book Title", "Retail Price", "Discount"])
+def show_q6(question):
+    min_discount, = question.params
+    page = views.view("q6", run_frame(question, (min_discount,)), min_discount)
+    books_with_discount = page.table
 
     # Display the table
     st.write(books_with_discount)
 
     # Add sentence
-    st.write(f"{len(books_with_discount)} Books are given a discount above 20%")
-
-    # Sort data by discount percentage in descending order
-    books_with_discount.sort_values(by="Discount", ascending=False, inplace=True)
+    st.write(f"{len(books_with_discount)} Books are given a discount above {min_discount}%")
 
-    # Visualization (Scatter Plot for Discounts)
-    fig, ax = plt.subplots(figsize=(10, 6))  # Create a new figure and axes
-    scatter = ax.scatter(
-        range(len(books_with_discount)), books_with_discount["Discount"], color="green", s=50
-    )
-    ax.set_xlabel("Books (Ordered by Discount)", fontsize=12)
-    ax.set_ylabel("Discount Percentage", fontsize=12)
-    ax.set_title("Discount Percentage for Books (Above 20%)", fontsize=14)
-    ax.grid(True, alpha=0.5)
+    # Visualization (Scatter Plot for Discounts), averaged over runs of
+    # neighbouring ranks when there are more books than points
+    show_question_chart(question, books_with_discount, figsize=(10, 6))
+    st.markdown(page.text)
 
-    # Display the plot in Streamlit
-    st.pyplot(fig)
-    st.markdown("""
-    ### Analysis
-    - **Insight:** 130 books are offered at a discount above 20%.
-    - **Interpretation:** Discounts are likely used as a strategy to boost sales or clear inventory.
-    """)
+    # Discounts of every priced book, in bands
+    st.write("Books per discount band:")
+    st.dataframe(pricing.bands(run_frame(queries.QUESTIONS["discount_bands"]), "%"), hide_index=True)
 
 
 # 7. Find the Average Page Count for eBooks vs Physical Books
-elif question == "7. Average Page Count for eBooks vs Physical Books":
-    cursor.execute('''
-    SELECT
-        isEbook,
-        AVG(pageCount) AS avg_page_count
-    FROM books
-    GROUP BY isEbook;
-    ''')
-    result = cursor.fetchall()
-    average_page_count = pd.DataFrame(result, columns=["Book Type", "Average Page Count"])
-    average_page_count["Book Type"] = average_page_count["Book Type"].replace({0: "Physical Book", 1: "EBook"})
+def show_q7(question):
+    page = views.view("q7", run_frame(question))
+    average_page_count = page.table
 
     st.write("Average Page Count for eBooks vs Physical Books:")
     st.write(average_page_count)
 
     # Visualization (Bar Chart)
-    fig, ax = plt.subplots(figsize=(4, 4))  # Create a new figure and axes
-    ax.bar(average_page_count["Book Type"], average_page_count["Average Page Count"], color='cyan')
-    ax.set_xlabel('Book Type', fontsize=13)
-    ax.set_ylabel('Average Page Count', fontsize=13)
-    ax.set_title('Average Page Count for eBooks vs Physical Books', fontsize=15)
-
-    # Display the plot
-    st.pyplot(fig)
-    st.markdown("""
-    ### Analysis
-    - **Insight:** 	
-    \n Physical Books: 465 pages on average.
-	\n eBooks: 382 pages on average.
-    - **Interpretation:** 
-    \n Physical books generally have higher page counts than eBooks, possibly reflecting their preference for detailed, comprehensive content. This could also suggest that eBooks are designed to be concise and easier to consume digitally.
-    """)
+    show_chart("q7", figures.draw_page_counts_by_type, average_page_count, figsize=(4, 4))
+    st.markdown(page.text)
 
 # 8. Find the Top 3 Authors with the Most Books
-elif question == "8. Top 3 Authors with the Most Books":
-    cursor.execute('''
-    SELECT
-        book_authors,
-        COUNT(*) AS book_count
-    FROM books
-    GROUP BY book_authors
-    ORDER BY book_count DESC
-    LIMIT 3 OFFSET 1;
-    ''')
-    result = cursor.fetchall()
-    authors_with_most_books = pd.DataFrame(result, columns=["Authors", "Book Count"])
+def show_q8(question):
+    page = views.view("q8", run_frame(question))
+    authors_with_most_books = page.table
     st.write("Top 3 Authors with the Most Books:")
     st.write(authors_with_most_books)
 
     # Visualization (Bar Chart)
-    fig, ax = plt.subplots(figsize=(8, 4))  # Create a new figure and axes
-    ax.bar(authors_with_most_books["Authors"], authors_with_most_books["Book Count"], color='magenta')
-    ax.set_xlabel('Authors', fontsize=12)
-    ax.set_ylabel('Number of Books', fontsize=12)
-    ax.set_title('Top 3 Authors with the Most Books', fontsize=14)
-    ax.tick_params(axis='x', rotation=45)  # Rotate x-axis labels for better readability
-
-    # Display the plot
-    st.pyplot(fig)
-    st.markdown("""
-    ### Analysis
-    - **Insight:** 
-    \n 	Top authors:
-        \n 1.	Michael R. Berthold (5 books).
-        \n 2.	Christian Borgelt (5 books).
-        \n 3.	Frank Höppner (5 books).
-
-    - **Interpretation:** 
-    \n These authors are prolific contributors, likely in technical or academic domains. Their consistent presence could indicate high demand for their expertise.
-    """)
+    show_chart("q8", figures.draw_top_authors, authors_with_most_books, figsize=(8, 4))
+    st.markdown(page.text)
 
 # 9. List Publishers with More than 10 Books
-elif question == "9. List Publishers with More than 10 Books":
-    cursor.execute('''
-    SELECT
-        book_publisher,
-        COUNT(*) AS book_count
-    FROM books
-    WHERE book_publisher IS NOT NULL AND book_publisher != ''
-    GROUP BY book_publisher
-    HAVING book_count > 10;
-    ''')
-    result = cursor.fetchall()
-
-    publisher_data = []
-    for row in result:
-        publisher, book_count = row
-        publisher = publisher.strip().replace(",", '').replace('"', '').strip()  # Clean up the publisher name
-        publisher_data.append([publisher, book_count])
-
-    if publisher_data:
-        publisher_with_more_than_10_books = pd.DataFrame(publisher_data, columns=["Publisher", "Book Count"])
+def show_q9(question):
+    page = views.view("q9", run_frame(question))
+    publisher_with_more_than_10_books = page.table
+
+    if not publisher_with_more_than_10_books.empty:
         st.write("Publishers with More than 10 Books:")
         st.write(publisher_with_more_than_10_books)
 
         # Visualization (Bar Chart)
-        fig, ax = plt.subplots(figsize=(11, 6))  # Create a new figure and axes
-        ax.bar(
-            publisher_with_more_than_10_books["Publisher"],
-            publisher_with_more_than_10_books["Book Count"],
-            color='yellow'
-        )
-        ax.set_xlabel('Publisher', fontsize=13)
-        ax.set_ylabel('Number of Books', fontsize=12)
-        ax.set_title('Publishers with More than 10 Books', fontsize=14)
-        ax.tick_params(axis='x', rotation=90)  # Rotate x-axis labels for better readability
-
-        # Display the plot
-        st.pyplot(fig)
+        show_chart("q9", figures.draw_prolific_publishers, publisher_with_more_than_10_books, figsize=(11, 6))
     else:
         st.write("No publishers with more than 10 books found.")
 
-    st.markdown("""
-    ### Analysis
-    - **Insight:** 
-    \n 23 publishers have more than 10 books.
-    \n O’Reilly Media, Springer Nature, and Packt Publishing are notable leaders.
-
-    - **Interpretation:** 
-     \n These publishers are dominant forces in the industry, producing high volumes of content that cater to a wide range of readers.
-    """)
+    st.markdown(page.text)
 
 
 # 10. Find the Average Page Count for Each Category
-elif question == "10. Average Page Count for Each Category":
-    cursor.execute('''
-    SELECT
-        categories,
-        AVG(pageCount) AS avg_page_count
-    FROM books
-    WHERE categories IS NOT NULL AND TRIM(categories) != ''
-    GROUP BY categories;
-    ''')
-    result = cursor.fetchall()
-
-    # Create a DataFrame from the result
-    average_page_count = pd.DataFrame(result, columns=["Category", "Average Page Count"])
+def show_q10(question):
+    page = views.view("q10", run_frame(question))
+    average_page_count = page.table
 
     # Display the data table
     st.write("Average Page Count for Each Category:")
@@ -420,365 +376,131 @@ elif question == "10. Average Page Count for Each Category":
     total_categories = len(average_page_count)
     st.write(f"Total number of categories : {total_categories}")
 
-    # Find categories with highest and lowest average page counts
-    max_category = average_page_count.iloc[average_page_count["Average Page Count"].idxmax()]
-    min_category = average_page_count.iloc[average_page_count["Average Page Count"].idxmin()]
-
-    # Visualization (Line Chart)
-    fig, ax = plt.subplots(figsize=(12, 6))
-    ax.plot(
-        average_page_count["Category"],
-        average_page_count["Average Page Count"],
-        marker='o', linestyle='-', color='blue', label='Average Page Count'
-    )
-
-    # Highlight high and low points
-    ax.scatter(max_category["Category"], max_category["Average Page Count"], color='red',
-               label=f"Highest: {max_category['Category']}")
-    ax.scatter(min_category["Category"], min_category["Average Page Count"], color='green',
-               label=f"Lowest: {min_category['Category']}")
-
-    # Add annotations for the highest and lowest points
-    ax.text(
-        max_category["Category"], max_category["Average Page Count"] + 5, f"{max_category['Category']}",
-        color='red', ha='center', fontsize=10
-    )
-    ax.text(
-        min_category["Category"], min_category["Average Page Count"] - 5, f"{min_category['Category']}",
-        color='green', ha='center', fontsize=10
-    )
-
-    # Set axis labels and title
-    ax.set_xlabel("Category", fontsize=12)
-    ax.set_ylabel("Average Page Count", fontsize=12)
-    ax.set_title("Average Page Count for Each Category", fontsize=14)
-
-    # Hide x-axis labels and add a legend
-    ax.set_xticklabels([])
-    ax.legend()
-
-    # Display the plot
-    st.pyplot(fig)
-    st.markdown("""
-    ### Analysis
-    - **Insight:** Categories like "American Medical Association" (2296 pages) and "Administrative agencies" (1546 pages) have the highest average page counts.
-    - **Interpretation:** Certain categories, such as medical and administrative, have significantly higher page counts, likely due to the technical or reference nature of these books.
-    """)
+    # Visualization (Line Chart), highest and lowest categories highlighted
+    show_chart("q10", figures.draw_category_page_counts, average_page_count, figsize=(12, 6))
+    st.markdown(page.text)
 
 # 11. Retrieve Books with More than 3 Authors
-elif question == "11. Books with More than 3 Authors":
-    cursor.execute('''
-    SELECT
-        book_title,
-        book_authors
-    FROM books
-    WHERE book_authors IS NOT NULL
-    AND LENGTH(book_authors) - LENGTH(REPLACE(book_authors, ',', '')) + 1 > 3;
-    ''')
-    result = cursor.fetchall()
-      
+def show_q11(question):
+    page = views.view("q11", run_frame(question))
+    book_author_3 = page.table
 
     # Check if the query returned any results
-    if result:
-        # Convert query result to a DataFrame
-        book_author_3 = pd.DataFrame(result, columns=["Book Title", "Authors"])
+    if not book_author_3.empty:
 
         
         # Display the table in Streamlit
         st.write(book_author_3)
 
-        # Visualization: Scatter Plot for Author Count
-        book_author_3['Author Count'] = book_author_3['Authors'].apply(lambda x: len(x.split(',')))
-
-        # Create a scatter plot
-        fig, ax = plt.subplots(figsize=(14, 8))
-        scatter = ax.scatter(
-             book_author_3['Book Title'],
-             book_author_3['Author Count'],
-             c=book_author_3['Author Count'],
-             cmap='cool',
-             s=book_author_3['Author Count'] * 50,  # Adjust marker size based on Author Count
-             alpha=0.7,
-            )
-        plt.colorbar(scatter, label="Author Count")
-        ax.set_xlabel("Book Title", fontsize=14)
-        ax.set_ylabel("Number of Authors", fontsize=14)
-        ax.set_title("Books with More than 3 Authors", fontsize=16)
-        plt.xticks(rotation=90, ha="right")
-        plt.tight_layout()
-
-        # Display the plot
-        st.pyplot(fig)
+        # Visualization: Scatter Plot for Author Count (the books with the most
+        # authors; the rest are shown as one averaged "Other" point)
+        show_question_chart(question, book_author_3, figsize=(14, 8))
     else:
         st.write("No books found with more than 3 authors.")
     
-    st.markdown("""
-    ### Analysis
-    - **Insight:** 74 books have more than 3 authors.
-    - **Interpretation:** These books are likely collaborative efforts in fields such as research, academia, or specialized industries where multiple contributors bring diverse expertise.
-    """)
+    st.markdown(page.text)
 
 
 # 12.Books with Ratings Count Greater Than the Average
 
-elif question == "12. Books with Ratings Count Greater Than the Average":
-    cursor.execute('''
-        SELECT
-            book_title,
-            CASE 
-                WHEN ratingsCount > 10 THEN ratingsCount / 10
-                ELSE ratingsCount
-            END AS adjusted_ratingsCount
-        FROM books;
-    ''')
-    result = cursor.fetchall()
-    ratings_df = pd.DataFrame(result, columns=["Book Title", "Rating Count"]) 
-
-    # Calculate the average of adjusted ratings
-    average_adjusted_rating = ratings_df["Rating Count"].mean()
-
-    # Filter books with adjusted ratings above average
-    books_above_average = ratings_df[ratings_df["Rating Count"] > average_adjusted_rating]
+def show_q12(question):
+    ratings_df = run_frame(question)
+
+    # The books with adjusted ratings above the average of adjusted ratings
+    page = views.view("q12", ratings_df)
+    books_above_average, average_adjusted_rating = page.table, page.data
 
     st.write("Books with Ratings Above Average:")
     st.write(books_above_average)
     st.write(f"Average Rating Count: {average_adjusted_rating:.2f}")
 
-    # Visualization (Bar Chart)
-    fig, ax = plt.subplots(figsize=(20, 10))  # Increase width further
-    ax.bar(books_above_average["Book Title"], books_above_average["Rating Count"], color='green', width=0.8)  # Increase bar width
-    ax.set_xlabel('Book Title', fontsize=18)  
-    ax.set_ylabel('Ratings Count', fontsize=18)  
-    ax.set_title('Books with Ratings Count Above Average', fontsize=20)  
-    ax.tick_params(axis='both', which='major', labelsize=16)  
-
-    # Rotate x-axis labels for better readability if needed
-    ax.set_xticklabels(books_above_average["Book Title"], rotation=90, ha="right")
-
-    # Adjust spacing between x-axis labels
-    plt.tight_layout() 
+    # Visualization (Bar Chart) of the most rated books, the rest averaged into "Other"
+    show_question_chart(question, ratings_df, figsize=(14, 7))
 
-    st.pyplot(fig)
-
-    st.markdown("""
-    ### Analysis
-    - **Insight:** 22 Books with a rating count higher than the average (1.97) indicate higher popularity or audience engagement.
-    \n Examples include:
-    \n •	"Natural Language Processing with Python": 4
-    \n •	"Python in a Nutshell": 8
-    \n •	"Programming Python": 4
-    \n •	"Patterns of Enterprise Application Architecture": 8
-
-    - **Interpretation:** Books with ratings higher than the average are more likely to be considered useful, engaging, or well-written. These books are strong candidates for marketing or promotional campaigns.
-    """)
+    st.markdown(page.text)
 
 # 13. Books with the Same Author Published in the Same Year
-elif question == "13. Books with the Same Author Published in the Same Year":
-    cursor.execute('''
-    SELECT
-        book_authors,
-        CASE
-            WHEN year LIKE '____-__-__' THEN strftime('%Y', year)
-            ELSE year
-        END AS processed_year,
-        COUNT(*) AS book_count
-    FROM books
-    WHERE book_authors IS NOT NULL AND TRIM(book_authors) != ''
-    GROUP BY book_authors, processed_year
-    HAVING book_count > 1;
-    ''')
-    result = cursor.fetchall()
-
-    # Convert to DataFrame
-    author_year = pd.DataFrame(result, columns=["Authors", "Year", "Book Count"])
-
-    # Drop rows with None values
-    author_year = author_year.dropna(subset=["Authors", "Year"])
-
-    # Initialize the figure to avoid "undefined" error
-    fig, ax = plt.subplots(figsize=(12, 6))
+def show_q13(question):
+    # Rows with None values are dropped
+    page = views.view("q13", run_frame(question))
+    author_year = page.table
 
     if not author_year.empty:
         st.write(author_year)
 
-        # Normalize sizes for better visualization
-        sizes = author_year["Book Count"] * 50  # Adjust scaling factor as needed
-
-        # Scatter Plot
-        scatter = ax.scatter(
-            x=author_year["Authors"],
-            y=author_year["Year"],
-            s=sizes,  # Use sizes based on "Book Count"
-            alpha=0.7,
-            c=author_year["Book Count"],
-            cmap='viridis'
-        )
-        ax.set_xlabel('Authors')
-        ax.set_ylabel('Year')
-        ax.set_title('Books with the Same Author Published in the Same Year')
-        ax.tick_params(axis='x', rotation=90, labelsize=8)  # Rotate x-axis labels
-        fig.colorbar(scatter, ax=ax, label='Book Count')  # Add color bar for scale
+        # Scatter Plot of the most prolific authors; everyone else is folded
+        # into one "Other" column with a point per year
+        show_question_chart(question, author_year, figsize=(12, 6))
     else:
         st.write("No records with valid authors and the same publication year found.")
-        ax.text(0.5, 0.5, 'No Data Available', fontsize=16, ha='center', va='center', transform=ax.transAxes)
 
-    # Pass the figure to st.pyplot
-    st.pyplot(fig)
-
-    st.markdown("""
-    ### Analysis
-    - **Insight:**  Authors like Al Sweigart, Alex Martelli, and many others published multiple books in a given year.	Most authors have published 2 books in the same year, and a few have published 3.
-    - **Interpretation:** 	Publishing multiple books in the same year indicates that these authors are either prolific writers or their works are split into multiple volumes.
-    - **Recommendation:** 	For marketing, highlight such authors to boost sales and readership by promoting their complete collection.
-    """)
+    st.markdown(page.text)
 
 # 14. Books with a Specific Keyword in the Title
-elif question == "14. Books with a Specific Keyword in the Title":
+def show_q14(question):
     # Create a sidebar for user input
     st.sidebar.title("Select Keyword")
-    selected_keyword = st.sidebar.radio("Choose Keyword", ["Python", "Data Science", "Python & Data Science"])
-
-    # Define the query based on user selection
-    if selected_keyword == "Python":
-        keyword1 = "python"
-        keyword2 = None  # Only looking for "python" in the title
-        exclude_keyword = "data science"  # Exclude books that have "data science"
-    elif selected_keyword == "Data Science":
-        keyword1 = "data science"
-        keyword2 = None  # Only looking for "data science" in the title
-        exclude_keyword = "python"  # Exclude books that have "python"
-    elif selected_keyword == "Python & Data Science":
-        keyword1 = "data science"
-        keyword2 = "python"  # Both "data science" and "python" need to be in the title
-        exclude_keyword = None  # No exclusion needed for this case
-
-    # Construct the query based on the selected keywords
-    if keyword2 is None:  # If only one keyword is needed
-        # Exclude books that contain the other keyword if necessary
-        if exclude_keyword:
-            cursor.execute(f'''
-            SELECT
-                book_title
-            FROM books
-            WHERE LOWER(book_title) LIKE '%{keyword1.lower()}%'
-            AND LOWER(book_title) NOT LIKE '%{exclude_keyword.lower()}%';
-            ''')
-        else:
-            cursor.execute(f'''
-            SELECT
-                book_title
-            FROM books
-            WHERE LOWER(book_title) LIKE '%{keyword1.lower()}%';
-            ''')
-    else:  # If both keywords are needed, regardless of order or words in between
-        cursor.execute(f'''
-        SELECT
-            book_title
-        FROM books
-        WHERE LOWER(book_title) LIKE '%{keyword1.lower()}%' 
-        AND LOWER(book_title) LIKE '%{keyword2.lower()}%';
-        ''')
-
-    # Fetch the results
-    result = cursor.fetchall()
-    keyword_books = pd.DataFrame(result, columns=["Book Title"])
+    selected_keyword = st.sidebar.radio("Choose Keyword", [*search.KEYWORD_PRESETS, "Custom search"])
 
-    # Display the results
-    st.write(f"Books related to: {selected_keyword}")
-    st.write(keyword_books)
-    
-    data = {
-        "Keywords": ["Python", "Data Science", "Both", "Others"],
-        "Book Count": [329, 226, 20, 669]  # Replace with your actual counts
-    }
-    
-    # Convert data to a DataFrame
-    keyword_df = pd.DataFrame(data)
-     # Visualization (Bar Chart)
-    fig, ax = plt.subplots(figsize=(8, 6))  # Create a new figure and axis
-    ax.bar(keyword_df["Keywords"], keyword_df["Book Count"], color=["blue", "green", "orange", "indigo"])
-    ax.set_xlabel("Keywords", fontsize=12)
-    ax.set_ylabel("Book Count", fontsize=12)
-    ax.set_title("Books with Specific Keywords in the Title", fontsize=14)
-    ax.bar_label(ax.containers[0], fmt='%d')  # Add value labels on bars
-    
-    # Display chart in Streamlit
-    st.pyplot(fig)
+    # Presets search the title only; a custom search accepts any FTS5 query
+    # (words, "exact phrases", prefix*, AND / OR / NOT) over the whole record
+    if selected_keyword == "Custom search":
+        match_query = st.sidebar.text_input("Search query", value="machine learning").strip()
+    else:
+        match_query = search.KEYWORD_PRESETS[selected_keyword]
+    result_limit = st.sidebar.slider("Maximum results", 10, 1000, 500, step=10)
+
+    result = ()
+    if match_query:
+        try:
+            result = run_query(question, (match_query, result_limit))
+        except sqlite3.OperationalError as exc:
+            if not search.is_syntax_error(exc):
+                raise
+            # Not valid FTS5 syntax: search for the words literally instead
+            result = run_query(question, (search.quote_terms(match_query), result_limit))
+    # Live keyword counts, computed from the index in one pass
+    counts = run_query(queries.QUESTIONS["q14_counts"])
+    page = views.view("q14", pd.DataFrame(result, columns=question.columns), counts)
 
-    st.markdown("""
-    ### Analysis
-    - **Insight:** 
-    	\n Total books: 1286.
-        \n Python keyword: 329 books.
-        \n Data Science keyword: 226 books.
-        \n Both keywords: 20 books.
+    # Display the results
+    st.write(f"Books related to: {match_query if selected_keyword == 'Custom search' else selected_keyword}")
+    st.write(page.table)
 
-    - **Interpretation:** Python is a prominent keyword, reflecting its widespread use in programming. Data Science also has substantial representation, aligning with its growing industry relevance.
+    # Visualization (Bar Chart)
+    keyword_df = figures.keyword_counts(counts)
+    show_chart("q14", figures.draw_keyword_counts, keyword_df, figsize=(8, 6))
 
-    """)
+    st.markdown(page.text)
 
 # 15. Year with the Highest Average Book Price
-elif question == "15. Year with the Highest Average Book Price":
-    cursor.execute('''
-    SELECT
-        CASE
-            WHEN year LIKE '____-__-__' THEN strftime('%Y', year)
-            ELSE year
-        END AS processed_year,
-        AVG(amount_retailPrice) AS avg_price
-    FROM books
-    GROUP BY year
-    ORDER BY avg_price DESC
-    LIMIT 3;
-    ''')
-    result = cursor.fetchall()
-    high_avg_price_year = pd.DataFrame(result, columns=["Year", "Average Price"])
-    st.write(high_avg_price_year)
+def show_q15(question):
+    page = views.view("q15", run_frame(question))
+    st.write(page.table)
 
-    st.markdown("""
-    ### Analysis
-    - **Insight:** The year 2023 has the highest average book price at $519.2. Other high-price years include 2021 ($376) and 2018 ($351.2).
-
-    - **Interpretation:** 	Books published in recent years are priced higher, reflecting the demand for updated and relevant content. Academic and niche content might contribute to these higher prices.
-
-    """)
+    st.markdown(page.text)
 
 
 
 # 16. Count Authors Who Published 3 Consecutive Years
-elif question == "16. Count Authors Who Published 3 Consecutive Years":
-    cursor.execute('''
-        WITH consecutive_years AS (
-            SELECT
-                book_authors,
-                strftime('%Y', COALESCE(year, '0000-00-00')) AS year 
-            FROM books
-            GROUP BY book_authors, year
-            HAVING COUNT(DISTINCT year) >= 3
-        )
-        SELECT
-            book_authors,
-            COUNT(DISTINCT year) AS consecutive_year_count
-        FROM consecutive_years
-        GROUP BY book_authors;
-    ''')
-    result = cursor.fetchall()
-    if result:
-        author_year = pd.DataFrame(result, columns=["Authors", "Consecutive Year Count"])
+def show_q16(question):
+    # Minimum streak length, in consecutive publishing years
+    min_years = st.sidebar.slider("Minimum consecutive years", 2, 10, 3)
+    page = views.view("q16", run_frame(question, (min_years,)), min_years)
+    author_year = page.table
+    if not author_year.empty:
+        st.write(f"{len(author_year)} authors published in at least {min_years} consecutive years:")
         st.write(author_year)
 
-        # Visualization (Bar Chart)
-        plt.bar(author_year["Authors"], author_year["Consecutive Year Count"], color='purple')
-        plt.xlabel('Authors')
-        plt.ylabel('Consecutive Year Count')
-        plt.xticks(rotation=45, ha="right")
-        st.pyplot()
+        # Visualization (Bar Chart) of the longest streaks
+        show_chart("q16", figures.draw_streaks, author_year.head(30), figsize=(10, 5))
+        st.markdown(page.text)
     else:
         st.markdown("""
         ### Analysis
         - **Insight:**
         """)
-        st.write("No authors have published in 3 consecutive years.")
+        st.write(f"No authors have published in {min_years} consecutive years.")
     
         st.markdown("""
         - **Interpretation:**
@@ -788,163 +510,327 @@ elif question == "16. Count Authors Who Published 3 Consecutive Years":
         """)
 
 # 17. Authors Who Have Published Books in the Same Year but Under Different Publishers
-elif question == "17. Authors Who Have Published Books in the Same Year but Under Different Publishers":
-   
-    #cursor.execute('''
-     #   SELECT
-          #  book_authors,
-         #   strftime('%Y', year) AS year,
-        #    GROUP_CONCAT(DISTINCT book_publisher) AS publishers
-       # FROM books
-      #  GROUP BY book_authors, year
-     #   HAVING COUNT(DISTINCT book_publisher) > 1;
-    #''')
-    #result = cursor.fetchall()
-    #if result:
-      #  author_publisher_df = pd.DataFrame(result, columns=["Authors", "Year", "Publishers"]) 
-      #  author_publisher_df["Publishers"] = author_publisher_df["Publishers"].str.strip().str.replace(",", "").str.replace('"', '').str.strip()
-     #   st.write(author_publisher_df)
-         
-    #else:
-        
-    #st.write("No authors have published with more than one publisher in the same year.")
-
-    st.markdown("""
-    ### Analysis
-    - **Insight:** 	No authors published books with more than one publisher in the same year.
-
-    - **Interpretation:** 	Authors might be following exclusivity agreements with publishers or focusing on building their reputation with a single publishing house.
-    """)
+def show_q17(question):
+    page = views.view("q17", run_frame(question))
+    author_publisher_df = page.table
+    if not author_publisher_df.empty:
+        st.write(author_publisher_df)
+    else:
+        st.write("No authors have published with more than one publisher in the same year.")
+    st.markdown(page.text)
 
 
 # 18. Average Amount of Retail Price for eBooks and Physical Books
-elif question == "18. Average Amount of Retail Price for eBooks and Physical Books":
-    cursor.execute('''
-    SELECT
-        AVG(CASE WHEN isEbook = 1 THEN amount_retailPrice END) AS avg_ebook_price,
-        AVG(CASE WHEN isEbook = 0 THEN amount_retailPrice END) AS avg_physical_price
-    FROM books;
-    ''')
-    result = cursor.fetchall()
-    avg_book_price = pd.DataFrame(result, columns=["Average Ebook Price", "Average Physical Book Price"])
+def show_q18(question):
+    page = views.view("q18", run_frame(question))
+    avg_book_price = page.table
     st.write(avg_book_price)
     #st.write("No Pysical Books are Priced")
 
-    st.markdown("""
-### Analysis
-- **Insight:**
-  - No physical books are priced.
-  - The average retail price for eBooks is $50.20.
-
-- **Interpretation:**
-  - eBooks dominate the market, and the pricing aligns with the affordability and accessibility of digital formats.
+    # The two formats' prices (USD) side by side, per price band
+    st.write("Books per retail price band (USD), by format:")
+    st.dataframe(pricing.format_bands(run_frame(queries.QUESTIONS["format_price_bands"])), hide_index=True)
 
-- **Recommendation:**
-  - Evaluate strategies for introducing affordable physical books for audiences who prefer traditional reading formats.
-""")
+    st.markdown(page.text)
 
 
    
 
 # 19. Books with Average Rating More Than Two Standard Deviations Away from the Average
-elif question == "19. Books with Average Rating More Than Two Standard Deviations Away from the Average":
-    cursor.execute('''
-    WITH avg_and_variance AS (
-        SELECT
-            AVG(averageRating) AS avg_rating,
-            SUM((averageRating - (SELECT AVG(averageRating) FROM books)) *
-                (averageRating - (SELECT AVG(averageRating) FROM books))) / COUNT(averageRating) AS variance
-        FROM books
-    )
-    SELECT
-        book_title,
-        averageRating,
-        ratingsCount
-    FROM books, avg_and_variance
-    WHERE ABS(averageRating - avg_rating) > 2 * SQRT(variance);
-    ''')
-    result = cursor.fetchall()
-
-    if result:
-        # Create a DataFrame from the result
-        std_above_2 = pd.DataFrame(result, columns=["Title", "Average Rating", "Ratings Count"])
-        st.write("Books with Average Ratings More Than Two Standard Deviations Away:")
+def show_q19(question):
+    # Outlier rule and grouping, defaulting to the classic two-sigma test
+    st.sidebar.title("Outlier Settings")
+    outlier_methods = {"Standard deviations": "zscore", "Median absolute deviation": "mad", "Interquartile range": "iqr"}
+    method_label = st.sidebar.radio("Method", list(outlier_methods))
+    method = outlier_methods[method_label]
+    k = st.sidebar.slider("Threshold (k)", 0.5, 5.0, float(outliers.DEFAULT_K[method]), step=0.5)
+    group_by = st.sidebar.selectbox("Compare within", ["All books", "Category", "Publisher"])
+
+    page = views.view("q19", run_frame(question), method, k, None if group_by == "All books" else group_by)
+
+    if not page.table.empty:
+        std_above_2 = page.table
+        st.write(f"Books with Average Ratings Outside {k:g} x {method_label} (compared within: {group_by}):")
         st.write(std_above_2)
 
-        # Scatter plot visualization
-        fig, ax = plt.subplots(figsize=(10, 6))
-        # Scatter plot for all books
-        ax.scatter(
-            std_above_2.index,
-            std_above_2["Average Rating"],
-            c="red",
-            s=std_above_2["Ratings Count"] * 2,  # Adjust the size based on Ratings Count
-            alpha=1,
-            label="Outliers"
-        )
-        ax.axhline(
-            std_above_2["Average Rating"].mean(), 
-            color="blue", 
-            linestyle="--", 
-            label="Mean Rating"
+        # Scatter plot visualization.
+        # A single reference line only makes sense when comparing against all books
+        center = page.data
+        show_chart(
+            "q19", figures.draw_rating_outliers, std_above_2[["Average Rating", "Ratings Count"]], figsize=(10, 6),
+            center=center, center_label="Mean Rating" if method == "zscore" else "Median Rating",
         )
+        st.markdown(page.text)
+
+    else:
+        st.write(f"No books have average ratings outside {k:g} x {method_label} of the {'average' if group_by == 'All books' else group_by.lower() + ' average'}.")
+
+
+
+# 20. Publisher with the Highest Average Rating Among Publishers with More than 10 Books
+def show_q20(question):
+    result = run_query(question)
+    if not result:
+        st.write("No publishers with more than 10 books found.")
+    st.markdown(views.view("q20", result).text)
+
+
+ADHOC_EXAMPLE = """SELECT language, COUNT(*) AS books
+FROM books
+GROUP BY language
+ORDER BY books DESC"""
 
-        # Adding plot details
-        ax.set_xlabel("Books (Index)", fontsize=12)
-        ax.set_ylabel("Average Rating", fontsize=12)
-        ax.set_title("Scatter Plot of Average Ratings with Outliers Highlighted", fontsize=14)
-        ax.legend()
-        st.pyplot(fig)
 
+# Filter / group-by builder for the ad-hoc page, as (sql, params)
+def build_adhoc_query():
+    fields = list(adhoc.FIELDS)
+    group_by = st.multiselect("Group by", fields, key="adhoc_group_by")
+    function, of = "Count", None
+    if group_by:
+        function = st.selectbox("Aggregate", list(adhoc.AGGREGATES), key="adhoc_aggregate")
+        if function != "Count":
+            of = st.selectbox("Of", adhoc.NUMERIC_FIELDS, key="adhoc_aggregate_of")
+        columns, outputs = (), [*group_by, adhoc.aggregate_label(function, of)]
     else:
-        st.write("No books have average ratings more than two standard deviations away from the average.")
-    
-    st.markdown("""
-### Analysis
-- **Insight:**
-  - Books like "Learning Python," "Python Web Programming," and others deviate significantly from the average.
-  - These deviations are primarily negative, with low ratings across several titles.
-
-- **Interpretation:**
-  - The low ratings could indicate outdated content, lack of relevance, or poor execution.
-
-- **Recommendation:**
-  - Analyze customer feedback for poorly rated books and update or replace them with improved editions.
-""")
-
-
-
-    # 20. Publisher with the Highest Average Rating Among Publishers with More than 10 Books
-elif question == "20. Publisher with the Highest Average Rating Among Publishers with More than 10 Books":
-    cursor.execute('''
-    SELECT
-        book_publisher,
-        AVG(averageRating) AS avg_rating,
-        COUNT(*) AS book_count
-    FROM books
-    GROUP BY book_publisher
-    HAVING book_count > 10
-    ORDER BY avg_rating DESC
-    LIMIT 1;
-    ''')
-    result = cursor.fetchall()
-    if result:
-        book_publisher, avg_rating, book_count = result[0]
-        book_publisher = book_publisher.strip().replace(",", '').replace('"', '').strip()
-        #st.write(f"The publisher with the highest average rating is '{book_publisher}'. "
-         #        f"Number of books: {book_count}. Average rating: {avg_rating:.2f}.")
+        columns = st.multiselect("Columns", fields, default=["Title", "Authors", "Year"], key="adhoc_columns")
+        outputs = columns
+
+    st.write("Filters (all must match):")
+    rows = st.data_editor(
+        pd.DataFrame({"Field": pd.Series(dtype=object), "Operator": pd.Series(dtype=object),
+                      "Value": pd.Series(dtype=object)}),
+        column_config={
+            "Field": st.column_config.SelectboxColumn(options=fields, required=True),
+            "Operator": st.column_config.SelectboxColumn(options=list(adhoc.OPERATORS), required=True),
+        },
+        num_rows="dynamic", hide_index=True, key="adhoc_filters",
+    )
+    filters = [adhoc.Filter(field, op, value) for field, op, value in rows.itertuples(index=False)
+               if isinstance(field, str) and isinstance(op, str) and value is not None]
+
+    order_by = st.selectbox("Order by", [None, *outputs], format_func=lambda label: label or "(unordered)",
+                            key="adhoc_order_by")
+    descending = st.checkbox("Descending", key="adhoc_descending")
+    return adhoc.build_sql(columns, filters, group_by, (function, of), order_by, descending)
+
+
+# Ad-hoc query: SQL or the builder, shown as a query plan first and run on a
+# worker thread with a time budget and a row cap
+def show_adhoc(question):
+    runner = get_adhoc_runner()
+    st.caption(f"Read-only. A query may run for {runner.budget:g}s and return up to {runner.max_rows:,} rows.")
+    mode = st.radio("Query with", ["Builder", "SQL"], horizontal=True, key="adhoc_mode")
+    if mode == "SQL":
+        sql, params = st.text_area("SQL (one statement)", ADHOC_EXAMPLE, height=150, key="adhoc_sql"), ()
+        if scope is not None:
+            st.caption("SQL queries read every book; the sidebar filters apply to the builder.")
     else:
-        st.write("No publishers with more than 10 books found.")
-    
-    st.markdown("""
-### Analysis
-- **Insight:**
-  - Springer Nature has the highest average rating of 5.00.
-  - Number of books: 43.
+        try:
+            sql, params = scoped(*build_adhoc_query())
+        except adhoc.BuilderError as exc:
+            st.warning(str(exc))
+            return
+        st.code(sql, language="sql")
+
+    try:
+        plan = runner.plan(sql, params)
+    except sqlite3.Error as exc:
+        st.error(f"This query cannot run: {exc}")
+        return
+    st.write("Query plan:")
+    for table in instrumentation.full_scans(plan):
+        st.warning(f"The query plan reads every row of `{table}` (SCAN {table}).")
+    st.code(instrumentation.format_plan(plan), language="text")
+
+    run_column, cancel_column = st.columns(2)
+    run = run_column.button("Run query", type="primary")
+    cancel = cancel_column.button("Cancel")
+    job = st.session_state.get("adhoc_job")
+    if job is not None and (job.sql, job.params) != (sql, tuple(params)):
+        # Started for a query since edited (or another filter scope): its
+        # result would not answer the one shown above
+        job.cancel()
+        job = st.session_state["adhoc_job"] = None
+    if job is not None and cancel:
+        job.cancel()
+    if run:
+        if job is not None:
+            job.cancel()  # one query per session at a time
+        job = st.session_state["adhoc_job"] = runner.submit(sql, params)
+    if job is None:
+        return
+
+    # The query runs on a worker; a Cancel click reruns the page out of this loop
+    status = st.empty()
+    while not job.done():
+        status.info(f"Running for {job.elapsed:.1f}s...")
+        time.sleep(0.1)
+    status.empty()
+    try:
+        result = job.result()
+    except adhoc.QueryCancelled as exc:
+        st.warning(f"Query {exc}.")
+    except adhoc.QueryTimeout as exc:
+        st.error(f"Query {exc}: narrow it down with filters or a LIMIT.")
+    except sqlite3.Error as exc:
+        st.error(f"Query failed: {exc}")
+    else:
+        st.dataframe(pd.DataFrame(result.rows, columns=result.columns), hide_index=True)
+        cut = f", cut at {runner.max_rows:,} rows" if result.truncated else ""
+        st.caption(f"{len(result.rows):,} rows in {result.seconds * 1e3:.0f} ms{cut}")
+
+
+# Question id -> page; only the selected question's page runs
+PAGES = {
+    "q1": show_q1,
+    "q2": show_q2,
+    "q3": show_q3,
+    "q4": show_q4,
+    "q5": show_q5,
+    "q6": show_q6,
+    "q7": show_q7,
+    "q8": show_q8,
+    "q9": show_q9,
+    "q10": show_q10,
+    "q11": show_q11,
+    "q12": show_q12,
+    "q13": show_q13,
+    "q14": show_q14,
+    "q15": show_q15,
+    "q16": show_q16,
+    "q17": show_q17,
+    "q18": show_q18,
+    "q19": show_q19,
+    "q20": show_q20,
+    "adhoc": show_adhoc,
+}
+
+
+# Debug panel: where this page run spent its time, what it returned, and the
+# query plan of the question's statement
+def show_debug_panel(question, trace, profiler=None):
+    with st.expander("Debug panel", expanded=True):
+        stages = pd.DataFrame(trace.stages, columns=["Question", "Stage", "Seconds"])
+        stages["Milliseconds"] = stages.pop("Seconds") * 1e3
+        st.write(stages)
+        totals = {stage: trace.total(stage) * 1e3 for stage in instrumentation.STAGES if trace.total(stage)}
+        st.write("Milliseconds per stage:", totals)
+        st.write("Rows returned:", trace.rows, "Query cache:", dict(trace.cache))
+
+        plan = get_metrics().plans.get(question.id)
+        if plan is None and question.sql is not None and not use_columnar(question.id) and not use_catalog(question.id):
+            # Served from the cache since the server started: explain it now
+            with get_connection_pool().connection() as conn:
+                get_metrics().capture_plan(question.id, conn, *scoped(question.sql, question.params))
+            plan = get_metrics().plans.get(question.id)
+        if plan is not None:
+            steps, scans = plan
+            for table in scans:
+                st.warning(f"The query plan reads every row of `{table}` (SCAN {table}).")
+            st.code(instrumentation.format_plan(steps), language="text")
+        elif question.sql is None:
+            st.write("No ad-hoc query has run yet.")
+        else:
+            st.write(f"No SQLite query plan (answered by the {query_engine} engine).")
+
+        if profiler is not None:
+            st.write(f"Sampling profile: {profiler.samples} samples over {profiler.elapsed:.3f}s")
+            st.write(pd.DataFrame(profiler.top(), columns=["Function", "Self samples", "Total samples", "Share"]))
+            st.download_button("Collapsed stacks (flame graph input)", profiler.collapsed(),
+                               file_name=f"{question.id}.folded", mime="text/plain")
+
+
+# Books matching the lookup text, best first; text that is not valid FTS5
+# syntax is searched for word by word
+def lookup_books(text, limit=20):
+    with get_connection_pool().connection() as conn:
+        try:
+            return conn.execute(search.LOOKUP_SQL, (text, limit)).fetchall()
+        except sqlite3.OperationalError as exc:
+            if not search.is_syntax_error(exc):
+                raise
+            return conn.execute(search.LOOKUP_SQL, (search.quote_terms(text), limit)).fetchall()
+
+
+def book_details(book_ids):
+    with get_connection_pool().connection() as conn:
+        cursor = conn.execute(similarity.BOOKS_SQL, (json.dumps(book_ids),))
+        return pd.DataFrame(cursor.fetchall(), columns=[column[0] for column in cursor.description])
+
+
+# Detail view of a book and its precomputed similar titles
+def show_book(book_id):
+    started = time.perf_counter()
+    neighbours = similarity.similar(DB_PATH, book_id)
+    scores = dict(neighbours or [])
+    details = book_details([book_id, *scores])
+    lookup_ms = (time.perf_counter() - started) * 1e3
+    book = {column: None if pd.isna(value) else value for column, value in details.iloc[0].items()}
+
+    image, text = st.columns([1, 4])
+    links = json.loads(book["imageLinks"]) if book["imageLinks"] else {}
+    if links.get("thumbnail"):
+        image.image(links["thumbnail"])
+    text.markdown(f"**{book['book_title']}**" + (f": {book['book_subtitle']}" if book["book_subtitle"] else ""))
+    text.write(" · ".join(str(value) for value in (
+        book["book_authors"], book["book_publisher"], book["year"], book["categories"],
+        f"{book['pageCount']} pages" if book["pageCount"] else None,
+        f"rated {book['averageRating']} ({book['ratingsCount']})" if book["averageRating"] else None,
+        f"{book['amount_retailPrice']} {book['currencyCode_retailPrice']}" if book["amount_retailPrice"] else None,
+    ) if value))
+    if book["book_description"]:
+        with st.expander("Description"):
+            st.write(book["book_description"])
+
+    st.subheader("Similar titles")
+    if neighbours is None:
+        st.info("The similar books index has not been built yet: run `python similarity.py`.")
+    elif len(details) == 1:
+        st.write("No similar titles found.")
+    else:
+        similar = details.iloc[1:][["book_id", "book_title", "book_authors", "year"]]
+        similar["Similarity"] = similar.pop("book_id").map(scores)
+        st.dataframe(
+            similar.rename(columns={"book_title": "Title", "book_authors": "Authors", "year": "Published"}),
+            hide_index=True,
+        )
+        st.caption(f"Looked up in {lookup_ms:.1f} ms")
 
-- **Interpretation:**
-  - Springer Nature maintains a consistent reputation for quality, possibly due to its focus on academic and scientific content.
-""")
 
+# Display the looked-up book if there is a lookup
+if book_lookup:
+    matches = lookup_books(book_lookup)
+    with book_area:
+        if not matches:
+            st.write(f"No books match: {book_lookup}")
+        else:
+            labels = {}
+            for book_id, title, authors, year in matches:
+                label = f"{title} ({authors or 'unknown author'}, {(year or '?')[:4]})"
+                labels[book_id] = f"{label} [{book_id}]" if label in labels.values() else label
+            show_book(st.selectbox("Book", list(labels), format_func=labels.get))
+            st.divider()
 
-conn.close()
\ No newline at end of file
+# Display Recommendations if Button is Clicked
+if recommendations_button:
+    recommendations_area.markdown(insights.overview(
+        run_frame(queries.QUESTIONS["summary"]),
+        run_frame(queries.QUESTIONS["q8"]),
+        run_query(queries.QUESTIONS["q14_counts"]),
+    ))
+
+debug = st.sidebar.checkbox("Debug panel")
+profile = debug and st.sidebar.checkbox("Sampling profiler")
+
+if scope is not None:
+    st.caption(f"Answers cover the {scope.count:,} books selected by the sidebar filters.")
+
+with instrumentation.Trace() as trace:
+    with instrumentation.SamplingProfiler() if profile else nullcontext() as profiler:
+        with get_metrics().stage(question.id, "page"):
+            PAGES[question.id](question)
+
+if METRICS_FILE:
+    get_metrics().write_textfile(METRICS_FILE)
+if debug:
+    show_debug_panel(question, trace, profiler)
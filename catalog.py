@@ -0,0 +1,340 @@
+"""
+Compact in-memory catalog of the books table, shared by every session.
+
+The rows are read once into one DataFrame of compact columns:
+- low-cardinality text (publisher, category, language, country,
+  saleability, currency codes) is dictionary-encoded as pandas `category`,
+  i.e. small integer codes plus one copy of each distinct value. Publisher and
+  category take their codes from the dimension tables, in id order.
+- titles and author lists are dictionary-encoded too when their values
+  repeat (at most TEXT_CATEGORY_RATIO distinct values per row), and kept as
+  strings otherwise
+- numbers are contiguous NumPy arrays: floats with NaN for missing values,
+  counts, flags and years as narrow nullable integers (Int8/16/32)
+
+Questions that only read the books table and its dimensions are answered by
+`ANSWERS` from column views of that frame (copy-on-write: nothing is copied
+unless written). They group on the integer codes rather than on strings.
+`CatalogEngine` keeps the catalog of the current database file and reloads
+it when the file changes (query_cache.Snapshot).
+
+Usage: python catalog.py [--db books_database.db] [--repeat 20]
+    compares the catalog's memory with the same rows materialised from SQLite,
+    checks every answer against its SQL and prints the timings.
+"""
+
+import argparse
+import sqlite3
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+import pricing
+import queries
+from instrumentation import timed
+from migrations import migrate
+from query_cache import Snapshot
+
+
+# Rows read (and encoded) at a time while loading
+LOAD_CHUNK = 100_000
+
+# Titles and author lists are dictionary-encoded when they repeat this much
+TEXT_CATEGORY_RATIO = 0.5
+
+# Catalog column -> storage: "category" (dictionary-encoded), "text"
+# (dictionary-encoded if repetitive), a dimension table (codes from its ids),
+# or a NumPy / pandas nullable dtype
+COLUMNS = {
+    "rowid": "int64",
+    "book_title": "text",
+    "book_authors": "text",
+    "publisher": "publishers",
+    "category": "categories",
+    "language": "category",
+    "country": "category",
+    "saleability": "category",
+    "currencyCode_listPrice": "category",
+    "currencyCode_retailPrice": "category",
+    "isEbook": "Int8",
+    "pageCount": "Int32",
+    "ratingsCount": "Int32",
+    "author_count": "Int16",
+    "pub_year": "Int16",
+    "averageRating": "float64",
+    "price_usd": "float64",
+    "discount_pct": "float64",
+}
+
+# The books columns behind COLUMNS, in the same order
+CATALOG_SQL = """
+    SELECT
+        rowid, book_title, book_authors, publisher_id, category_id, language, country, saleability,
+        currencyCode_listPrice, currencyCode_retailPrice, isEbook, pageCount, ratingsCount,
+        author_count, pub_year, averageRating, price_usd, discount_pct
+    FROM books
+    ORDER BY rowid;
+"""
+
+DIMENSION_SQL = {
+    "publishers": "SELECT publisher_id, name FROM publishers ORDER BY publisher_id",
+    "categories": "SELECT category_id, name FROM categories ORDER BY category_id",
+}
+
+
+def _numbers(values, dtype):
+    numbers = pd.to_numeric(pd.Series(values, dtype=object), errors="coerce")
+    if dtype == "float64":
+        return numbers.to_numpy(dtype=np.float64, na_value=np.nan)
+    return pd.array(numbers.astype("Float64").round(), dtype=dtype)
+
+
+# A dimension table's ids as the codes of a Categorical over its names
+def _dimension(conn, table, ids):
+    rows = conn.execute(DIMENSION_SQL[table]).fetchall()
+    names = [name for _, name in rows]
+    known = np.array([dimension_id for dimension_id, _ in rows], dtype=np.int64)
+    ids = np.asarray(ids, dtype=np.float64)
+    codes = np.full(len(ids), -1, dtype=np.int32)
+    present = ~np.isnan(ids)
+    positions = np.searchsorted(known, ids[present].astype(np.int64))
+    found = positions < len(known)
+    found[found] = known[positions[found]] == ids[present][found]
+    codes[np.flatnonzero(present)[found]] = positions[found]
+    return pd.Categorical.from_codes(codes, categories=pd.Index(names, dtype=object))
+
+
+def _combine(conn, storage, parts):
+    if storage in ("category", "text"):
+        values = union_categoricals(parts, sort_categories=True) if parts else pd.Categorical([])
+        if storage == "text" and len(values.categories) > TEXT_CATEGORY_RATIO * len(values):
+            return pd.array(values.astype(object), dtype="str")
+        return values
+    if storage in DIMENSION_SQL:
+        return _dimension(conn, storage, np.concatenate(parts) if parts else [])
+    if storage == "float64":
+        return np.concatenate(parts) if parts else np.zeros(0)
+    return pd.concat([pd.Series(part) for part in parts], ignore_index=True).array if parts else pd.array([], dtype=storage)
+
+
+class Catalog:
+    def __init__(self, frame):
+        self.frame = frame
+        self.size = len(frame)
+
+    @classmethod
+    def load(cls, conn):
+        # Encode a chunk of rows at a time, so the Python objects of only one
+        # chunk are alive at once
+        pieces = {column: [] for column in COLUMNS}
+        cursor = conn.execute(CATALOG_SQL)
+        while True:
+            rows = cursor.fetchmany(LOAD_CHUNK)
+            if not rows:
+                break
+            for (column, storage), values in zip(COLUMNS.items(), zip(*rows)):
+                if storage in ("category", "text"):
+                    values = pd.Categorical(pd.Series(values, dtype=object))
+                elif storage in DIMENSION_SQL:
+                    values = np.array(values, dtype=np.float64)
+                else:
+                    values = _numbers(values, storage)
+                pieces[column].append(values)
+        return cls(pd.DataFrame(
+            {column: _combine(conn, storage, pieces.pop(column)) for column, storage in COLUMNS.items()},
+            copy=False,
+        ))
+
+    # A DataFrame of some columns, sharing the catalog's data
+    def view(self, *columns):
+        return self.frame[list(columns)]
+
+    def memory_usage(self):
+        return int(self.frame.memory_usage(deep=True).sum())
+
+
+# -- answers --------------------------------------------------------------
+
+# Descending with ties in group order and missing values last, as SQLite's
+# ORDER BY ... DESC LIMIT n over a GROUP BY
+def _top(values, n=None):
+    ranked = values.sort_values(ascending=False, kind="stable", na_position="last")
+    return (ranked if n is None else ranked.head(n)).reset_index()
+
+
+def top_publisher(catalog):
+    return _top(catalog.view("publisher").groupby("publisher", observed=True).size(), 1)
+
+
+def top_rated_publisher(catalog):
+    books = catalog.view("publisher", "averageRating")
+    return _top(books.groupby("publisher", observed=True)["averageRating"].mean(), 1)
+
+
+def most_expensive(catalog):
+    books = catalog.view("book_title", "price_usd")
+    top = books.nlargest(5, "price_usd")
+    if len(top) < 5:  # unpriced books come last
+        top = pd.concat([top, books[books["price_usd"].isna()].head(5 - len(top))])
+    return top
+
+
+def long_recent_books(catalog):
+    books = catalog.view("book_title", "pub_year", "pageCount")
+    return books[((books["pub_year"] > 2010) & (books["pageCount"] >= 500)).fillna(False)]
+
+
+def discounted_books(catalog, min_discount=pricing.MIN_DISCOUNT):
+    books = catalog.view("book_title", "price_usd", "discount_pct")
+    discounted = books[books["discount_pct"] > min_discount]
+    return discounted.sort_values("discount_pct", ascending=False, kind="stable")
+
+
+def prolific_publishers(catalog):
+    counts = catalog.view("publisher").groupby("publisher", observed=True).size()
+    return _top(counts[counts > 10])
+
+
+def category_page_counts(catalog):
+    averages = catalog.view("category", "pageCount").groupby("category", observed=True)["pageCount"].mean()
+    return averages.reset_index().sort_values("category", key=lambda names: names.astype(str), kind="stable")
+
+
+def multi_author_books(catalog):
+    books = catalog.view("book_title", "book_authors", "author_count")
+    return books[(books["author_count"] > 3).fillna(False)]
+
+
+def ratings_counts(catalog):
+    books = catalog.view("book_title", "ratingsCount")
+    counts = books.pop("ratingsCount")
+    books["adjusted_ratingsCount"] = counts.where(~(counts > 10).fillna(False), counts // 10)
+    return books
+
+
+def top_price_years(catalog):
+    return _top(catalog.view("pub_year", "price_usd").groupby("pub_year")["price_usd"].mean(), 3)
+
+
+def rated_books(catalog):
+    books = catalog.view("book_title", "averageRating", "ratingsCount", "category", "publisher")
+    return books[books["averageRating"].notna()]
+
+
+def top_rated_large_publisher(catalog):
+    groups = catalog.view("publisher", "averageRating").groupby("publisher", observed=True)["averageRating"]
+    stats = pd.DataFrame({"avg_rating": groups.mean(), "book_count": groups.size()})
+    large = stats[stats["book_count"] > 10]
+    return large.iloc[np.argsort(-large["avg_rating"].to_numpy(na_value=-np.inf), kind="stable")[:1]].reset_index()
+
+
+# Question id -> answer(catalog, *params): a DataFrame with the rows of the
+# question's SQL for the same parameters, in its column order. Questions read from book_summary (precomputed
+# aggregates) and the ones joining authors stay on SQLite.
+ANSWERS = {
+    "q2": top_publisher,
+    "q3": top_rated_publisher,
+    "q4": most_expensive,
+    "q5": long_recent_books,
+    "q6": discounted_books,
+    "q9": prolific_publishers,
+    "q10": category_page_counts,
+    "q11": multi_author_books,
+    "q12": ratings_counts,
+    "q15": top_price_years,
+    "q19": rated_books,
+    "q20": top_rated_large_publisher,
+}
+
+
+class UnsupportedQuestion(RuntimeError):
+    pass
+
+
+def _python(value):
+    if pd.isna(value):
+        return None
+    return value.item() if isinstance(value, np.generic) else value
+
+
+class CatalogEngine:
+    # The Catalog of the database file, reloaded when the file changes. The
+    # fingerprint is re-checked at most every `check_interval` seconds.
+    def __init__(self, db_path, check_interval=1.0):
+        self.db_path = db_path
+        self._snapshot = Snapshot(db_path, Catalog.load, check_interval)
+
+    def load(self):
+        self._snapshot.load()
+
+    def catalog(self):
+        return self._snapshot.get()
+
+    def frame(self, question_id, params=(), columns=None):
+        if question_id not in ANSWERS:
+            raise UnsupportedQuestion(f"{question_id} is not answered from the catalog")
+        frame = ANSWERS[question_id](self.catalog(), *params)
+        frame = frame.reset_index(drop=True)
+        if columns is not None:
+            frame.columns = columns
+        return frame
+
+    # Row tuples, for the pages that read rows; missing values are None
+    def fetch(self, question_id, params=(), one=False):
+        frame = self.frame(question_id, params)
+        rows = [tuple(map(_python, row)) for row in frame.itertuples(index=False, name=None)]
+        if one:
+            return rows[0] if rows else None
+        return rows
+
+
+def main(argv=None):
+    from columnar import results_match
+
+    parser = argparse.ArgumentParser(description="Check the in-memory catalog against SQLite and time it.")
+    parser.add_argument("--db", default="books_database.db")
+    parser.add_argument("--repeat", type=int, default=20, help="runs per question (median is reported)")
+    args = parser.parse_args(argv)
+
+    migrate(args.db)
+    conn = sqlite3.connect(f"file:{args.db}?mode=ro", uri=True)
+    engine = CatalogEngine(args.db)
+    started = time.perf_counter()
+    catalog = engine.catalog()
+    print(f"loaded {catalog.size:,} books in {time.perf_counter() - started:.2f}s")
+
+    # The same columns as rows from SQLite (what the result cache holds) and
+    # as the DataFrame built from them
+    tracemalloc.start()
+    rows = conn.execute(CATALOG_SQL).fetchall()
+    rows_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    frame_bytes = int(pd.DataFrame(rows, columns=list(COLUMNS)).memory_usage(deep=True).sum())
+    del rows
+    catalog_bytes = catalog.memory_usage()
+    print(f"rows from SQLite {rows_bytes / 1e6:,.1f} MB, DataFrame of them {frame_bytes / 1e6:,.1f} MB, "
+          f"catalog {catalog_bytes / 1e6:,.1f} MB ({rows_bytes / catalog_bytes:.1f}x / "
+          f"{frame_bytes / catalog_bytes:.1f}x smaller)")
+    for column, values in catalog.frame.items():
+        print(f"  {column:<26}{str(values.dtype):<18}{values.memory_usage(deep=True, index=False) / 1e6:>9.2f} MB")
+
+    mismatches = 0
+    print(f"{'question':<12}{'sqlite ms':>11}{'catalog ms':>12}{'speedup':>9}  parity")
+    for question_id in ANSWERS:
+        question = queries.QUESTIONS[question_id]
+        expected, sqlite_time = timed(
+            lambda: pd.DataFrame(conn.execute(question.sql, question.params).fetchall()), args.repeat)
+        actual, catalog_time = timed(lambda: engine.frame(question_id, question.params), args.repeat)
+        ok = results_match(expected, engine.fetch(question_id, question.params))
+        mismatches += not ok
+        print(f"{question_id:<12}{sqlite_time * 1e3:>11.2f}{catalog_time * 1e3:>12.2f}"
+              f"{sqlite_time / catalog_time:>8.1f}x  {'ok' if ok else 'MISMATCH'}")
+    if mismatches:
+        parser.exit(1, f"{mismatches} question(s) differ between SQLite and the catalog\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+Cached, leak-free chart rendering for the dashboard.
+
+Charts are drawn on a bare `matplotlib.figure.Figure` attached to an Agg
+canvas: nothing goes through pyplot, so no figure is ever registered in
+pyplot's global figure manager and a figure is garbage once rendered. The
+rendered PNG/SVG bytes are cached in a bounded LRU keyed by chart id, a
+content hash of the data being plotted and the chart options, so a rerun with
+the same result skips drawing and rasterizing entirely.
+
+A draw function receives `(fig, ax, data, **options)` and must depend only on
+those arguments: everything that changes the picture belongs in `data` or
+`options`, otherwise a cached image of a different chart would be served.
+
+Simple bar/scatter/line charts can instead be described by a `ChartSpec`,
+which renders either as a static matplotlib image (`draw_spec`) or as an
+interactive Vega-Lite chart drawn in the browser (`vega_lite_spec`). `top_n_other()` and
+`bin_rows()` shrink a result to a point budget on the server first, so the
+cost of a chart is bounded by the budget rather than by the row count.
+"""
+
+import hashlib
+import io
+import pickle
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from query_cache import LRUCache
+
+
+FORMATS = {"png": "image/png", "svg": "image/svg+xml"}
+
+# Most marks a chart draws once downsampled (bars, points or x-axis labels)
+DEFAULT_POINT_BUDGET = 50
+
+# Declarative chart: `kind` is "bar", "scatter" or "line"; `x`/`y`/`color`/`size`
+# name data columns. `size_scale` multiplies `size` into matplotlib marker areas,
+# `labels` writes the y value above each bar and `x_labels=False` hides x ticks.
+ChartSpec = namedtuple(
+    "ChartSpec",
+    ["kind", "x", "y", "title", "x_title", "y_title", "color", "size", "size_scale",
+     "mark_color", "cmap", "labels", "x_labels", "label_rotation"],
+    defaults=[None, None, None, None, None, 1, "steelblue", "viridis", False, True, 0],
+)
+
+
+# Content hash of the plotted data, independent of object identity
+def data_hash(data):
+    digest = hashlib.blake2b(digest_size=16)
+    if isinstance(data, pd.Series):
+        data = data.to_frame()
+    if isinstance(data, pd.DataFrame):
+        digest.update(repr((list(data.columns), [str(t) for t in data.dtypes])).encode())
+        digest.update(pd.util.hash_pandas_object(data, index=True).to_numpy().tobytes())
+    else:
+        digest.update(pickle.dumps(data, protocol=4))
+    return digest.hexdigest()
+
+
+def _options_key(options):
+    return tuple(sorted((name, repr(value)) for name, value in options.items()))
+
+
+class ChartRenderer:
+    # `max_bytes` bounds the summed size of the cached images
+    def __init__(self, max_entries=256, max_bytes=64 << 20, fmt="png", dpi=200):
+        if fmt not in FORMATS:
+            raise ValueError(f"unknown image format {fmt!r}; expected one of {tuple(FORMATS)}")
+        self.fmt = fmt
+        self.dpi = dpi
+        self._cache = LRUCache(max_entries, max_weight=max_bytes)
+
+    def render(self, chart_id, draw, data, figsize=None, fmt=None, **options):
+        fmt = fmt or self.fmt
+        key = (chart_id, data_hash(data), figsize, fmt, self.dpi, _options_key(options))
+        image = self._cache.get(key)
+        if image is None:
+            image = self._draw(draw, data, figsize, fmt, options)
+            self._cache.put(key, image, weight=len(image))
+        return image
+
+    def _draw(self, draw, data, figsize, fmt, options):
+        fig = Figure(figsize=figsize)
+        FigureCanvasAgg(fig)
+        try:
+            ax = fig.add_subplot()
+            draw(fig, ax, data, **options)
+            buffer = io.BytesIO()
+            fig.savefig(buffer, format=fmt, dpi=self.dpi, bbox_inches="tight")
+            return buffer.getvalue()
+        finally:
+            # Break the figure <-> artist reference cycles right away instead of
+            # waiting for the cyclic garbage collector
+            fig.clear()
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        return self._cache.stats()
+
+
+# -- downsampling --------------------------------------------------------
+
+
+# Keep the n - 1 labels with the largest aggregated `value` and fold all other
+# rows into one "Other (k)" label, aggregated per `by` column if given (e.g. one
+# "Other" point per year). Kept labels are aggregated the same way (so repeated
+# labels are one mark) and stay in their original order.
+def top_n_other(data, label, value, n=DEFAULT_POINT_BUDGET, agg="sum", by=None, other="Other"):
+    keys = [label] if by is None else [label, by]
+    totals = data.groupby(label, sort=False)[value].agg(agg)
+    if len(totals) <= n:
+        return data.groupby(keys, sort=False, as_index=False)[value].agg(agg)
+    keep = totals.nlargest(max(n - 1, 1), keep="first").index
+    kept = data[data[label].isin(keep)].groupby(keys, sort=False, as_index=False)[value].agg(agg)
+    rest = data[~data[label].isin(keep)]
+    other_label = f"{other} ({rest[label].nunique()})"
+    if by is None:
+        folded = pd.DataFrame({label: [other_label], value: [rest[value].agg(agg)]})
+    else:
+        folded = rest.groupby(by, as_index=False)[value].agg(agg)
+        folded.insert(0, label, other_label)
+    return pd.concat([kept[folded.columns], folded], ignore_index=True)
+
+
+# Bin consecutive rows into at most `n` equal-width buckets of row positions,
+# e.g. a ranked series; each bucket becomes its first position and mean `value`
+def bin_rows(data, value, n=DEFAULT_POINT_BUDGET, position="Position"):
+    if len(data) <= n:
+        return pd.DataFrame({position: np.arange(len(data)), value: data[value].to_numpy()})
+    buckets = np.arange(len(data)) * n // len(data)
+    binned = data[value].groupby(buckets).mean()
+    starts = np.searchsorted(buckets, binned.index)
+    return pd.DataFrame({position: starts, value: binned.to_numpy()})
+
+
+# -- backends ------------------------------------------------------------
+
+
+def draw_spec(fig, ax, data, spec):
+    x = data[spec.x].astype(str) if spec.kind == "bar" else data[spec.x]
+    if spec.kind == "bar":
+        bars = ax.bar(x, data[spec.y], color=spec.mark_color)
+        if spec.labels:
+            ax.bar_label(bars, fmt="%g")
+    elif spec.kind == "line":
+        ax.plot(x, data[spec.y], marker="o", color=spec.mark_color)
+    else:
+        scatter = ax.scatter(
+            x, data[spec.y],
+            c=data[spec.color] if spec.color else spec.mark_color,
+            cmap=spec.cmap if spec.color else None,
+            s=data[spec.size] * spec.size_scale if spec.size else None,
+            alpha=0.7,
+        )
+        if spec.color:
+            fig.colorbar(scatter, ax=ax, label=spec.color)
+    ax.set_xlabel(spec.x_title or spec.x)
+    ax.set_ylabel(spec.y_title or spec.y)
+    if spec.title:
+        ax.set_title(spec.title)
+    if not spec.x_labels:
+        ax.set_xticklabels([])
+    elif spec.label_rotation:
+        ax.tick_params(axis="x", rotation=spec.label_rotation)
+
+
+def _field_type(series):
+    return "quantitative" if pd.api.types.is_numeric_dtype(series) else "nominal"
+
+
+# Vega-Lite spec for st.vega_lite_chart(data, spec); rendered in the browser
+def vega_lite_spec(spec, data):
+    x_type = "ordinal" if spec.kind == "bar" else _field_type(data[spec.x])
+    encoding = {
+        # Keep the row order the query (or the downsampling) produced
+        "x": {"field": spec.x, "type": x_type, "title": spec.x_title or spec.x, "sort": None,
+              "axis": {"labelAngle": -spec.label_rotation, "labels": spec.x_labels}},
+        "y": {"field": spec.y, "type": "quantitative", "title": spec.y_title or spec.y},
+        "tooltip": [{"field": c, "type": _field_type(data[c])} for c in dict.fromkeys(
+            c for c in (spec.x, spec.y, spec.color, spec.size) if c)],
+    }
+    if spec.color:
+        encoding["color"] = {"field": spec.color, "type": "quantitative", "scale": {"scheme": spec.cmap}}
+    if spec.size:
+        encoding["size"] = {"field": spec.size, "type": "quantitative"}
+    if spec.kind == "scatter":
+        encoding["y"]["scale"] = {"zero": False}
+    mark = {"type": {"bar": "bar", "line": "line", "scatter": "circle"}[spec.kind]}
+    if spec.kind == "line":
+        mark["point"] = True
+    if not spec.color:
+        mark["color"] = spec.mark_color
+    layers = [{"mark": mark, "encoding": encoding}]
+    if spec.kind == "bar" and spec.labels:
+        text = {"x": encoding["x"], "y": encoding["y"], "text": {"field": spec.y, "type": "quantitative"}}
+        layers.append({"mark": {"type": "text", "dy": -6}, "encoding": text})
+    chart = {"layer": layers}
+    if spec.title:
+        chart["title"] = spec.title
+    return chart
@@ -0,0 +1,40 @@
+"""
+Cleanup stage applied to raw Google Books values at ingest time.
+
+The original export stored `book_publisher` as the characters of the name
+joined by commas, after CSV-quoting names that contain a comma:
+
+    'J,o,h,n, ,W,i,l,e,y'                       -> 'John Wiley'
+    '",O,\',R,e,i,l,l,y, ,M,e,d,i,a,,, ,I,n,c,.,"' -> "O'Reilly Media, Inc."
+
+Decoding takes every other character and then undoes the CSV quoting, so
+commas that belong to the real name survive.
+"""
+
+from functools import lru_cache
+
+
+def is_exploded(value):
+    # Every odd position is a separator comma: 'a,b,c', 'a,,,b' ('a', ',', 'b')
+    return len(value) >= 3 and len(value) % 2 == 1 and value[1::2] == "," * (len(value) // 2)
+
+
+def unquote_csv(value):
+    if len(value) >= 2 and value[0] == '"' and value[-1] == '"':
+        return value[1:-1].replace('""', '"')
+    return value
+
+
+# Canonical publisher name for a raw `book_publisher` value, None when empty
+@lru_cache(maxsize=65536)
+def decode_publisher(raw):
+    if raw is None:
+        return None
+    # Trailing spaces may themselves be exploded characters ('a,b, ')
+    value = raw
+    for candidate in (raw, raw.strip()):
+        if is_exploded(candidate):
+            value = candidate[::2]
+            break
+    value = " ".join(unquote_csv(value.strip()).split())
+    return value or None
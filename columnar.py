@@ -0,0 +1,197 @@
+"""
+In-process columnar copy of the database for the analysis questions.
+
+The tables the questions read are loaded once into DuckDB (via Arrow) and the
+same question SQL runs against that copy. Results come back as Arrow tables
+and DataFrames built straight from the column buffers, with no per-row Python
+tuples in between. The copy is reloaded whenever the SQLite file changes.
+
+DuckDB and pyarrow are optional; `available()` says whether this backend can
+be used.
+Full-text search (question 14) needs SQLite's FTS5 and is not supported here.
+
+Usage: python columnar.py [--db books_database.db] [--repeat 20]
+    runs every question on both backends, checks the results match and
+    prints the per-question timings.
+"""
+
+import argparse
+import math
+import sqlite3
+import time
+
+import pandas as pd
+
+import queries
+from instrumentation import timed
+from migrations import migrate
+from query_cache import Snapshot
+
+try:
+    import duckdb
+    import pyarrow as pa
+except ImportError:  # optional backend
+    duckdb = pa = None
+
+
+TABLES = ("books", "publishers", "categories", "authors", "book_authors", "book_summary")
+
+# Questions that rely on SQLite-only features
+UNSUPPORTED = {"q14", "q14_counts"}
+
+# Dialect differences, as (SQLite, DuckDB) rewrites of the question SQL:
+# SQLite divides integers with `/` (DuckDB needs `//`), and DuckDB only orders
+# GROUP_CONCAT input when asked to in the aggregate itself
+DIALECT_REWRITES = [
+    ("ratingsCount / 10", "ratingsCount // 10"),
+    ("GROUP_CONCAT(publisher, '; ')", "STRING_AGG(publisher, '; ' ORDER BY publisher)"),
+]
+
+
+class UnsupportedQuestion(RuntimeError):
+    pass
+
+
+def available():
+    return duckdb is not None
+
+
+# SQLite question SQL as DuckDB runs it
+def duckdb_sql(sql):
+    for sqlite_text, duckdb_text in DIALECT_REWRITES:
+        sql = sql.replace(sqlite_text, duckdb_text)
+    return sql
+
+
+# One SQLite table as an Arrow table. Integer columns stay integers (nullable)
+# and columns mixing integers and reals (SQLite is dynamically typed) become
+# doubles.
+def _read_table(conn, table):
+    frame = pd.read_sql_query(f"SELECT * FROM {table}", conn, dtype_backend="pyarrow")
+    return pa.Table.from_pandas(frame, preserve_index=False)
+
+
+class ColumnarEngine:
+    # The tables in DuckDB, reloaded when the database file changes
+    def __init__(self, db_path, tables=TABLES, check_interval=1.0):
+        if duckdb is None:
+            raise RuntimeError("the columnar backend needs the 'duckdb' and 'pyarrow' packages")
+        self.db_path = db_path
+        self.tables = tables
+        self._snapshot = Snapshot(db_path, self._copy, check_interval, discard=duckdb.DuckDBPyConnection.close)
+
+    def _copy(self, source):
+        conn = duckdb.connect(":memory:")
+        for table in self.tables:
+            arrow_table = _read_table(source, table)
+            conn.register("_staging", arrow_table)
+            conn.execute(f"CREATE TABLE {table} AS SELECT * FROM _staging")
+            conn.unregister("_staging")
+        return conn
+
+    def load(self):
+        self._snapshot.load()
+
+    # A cursor is an independent connection to the same database, so
+    # concurrent sessions do not share statement state
+    def _connection(self):
+        return self._snapshot.get(duckdb.DuckDBPyConnection.cursor)
+
+    def query(self, question_id, sql, params=()):
+        if question_id in UNSUPPORTED:
+            raise UnsupportedQuestion(f"{question_id} is not supported by the columnar backend")
+        cursor = self._connection()
+        try:
+            result = cursor.execute(duckdb_sql(sql), list(params))
+            # fetch_arrow_table() was renamed in DuckDB 1.4
+            return result.to_arrow_table() if hasattr(result, "to_arrow_table") else result.fetch_arrow_table()
+        finally:
+            cursor.close()
+
+    def frame(self, question_id, sql, params=(), columns=None):
+        frame = self.query(question_id, sql, params).to_pandas()
+        if columns is not None:
+            frame.columns = columns
+        return frame
+
+    # Row tuples, for the few questions that read single values
+    def fetch(self, question_id, sql, params=(), one=False):
+        rows = list(zip(*(column.to_pylist() for column in self.query(question_id, sql, params).columns)))
+        if one:
+            return rows[0] if rows else None
+        return rows
+
+    def close(self):
+        self._snapshot.close()
+
+
+# Rows as tuples, with missing values (None/NaN/NA) of DataFrame rows as None
+def _rows(result):
+    if not isinstance(result, pd.DataFrame):
+        return list(result)
+    return [tuple(None if pd.isna(v) else v for v in row) for row in result.itertuples(index=False, name=None)]
+
+
+def _same(a, b):
+    if isinstance(a, float) or isinstance(b, float):
+        if a is None or b is None:
+            return a is b
+        return math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-9)
+    return a == b
+
+
+def _sort_key(row):
+    return tuple(
+        (0, round(value, 6), "") if isinstance(value, (int, float)) else (1, 0, str(value))
+        for value in row
+    )
+
+
+# Compare as multisets: questions without ORDER BY may return rows in any
+# order. Either result may be row tuples or a DataFrame.
+def results_match(expected, actual):
+    expected, actual = _rows(expected), _rows(actual)
+    if len(expected) != len(actual):
+        return False
+    return all(
+        len(x) == len(y) and all(_same(a, b) for a, b in zip(x, y))
+        for x, y in zip(sorted(expected, key=_sort_key), sorted(actual, key=_sort_key))
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check and time the columnar backend against SQLite.")
+    parser.add_argument("--db", default="books_database.db")
+    parser.add_argument("--repeat", type=int, default=20, help="runs per question (median is reported)")
+    args = parser.parse_args(argv)
+
+    migrate(args.db)
+    engine = ColumnarEngine(args.db)
+    started = time.perf_counter()
+    engine.load()
+    print(f"loaded {', '.join(engine.tables)} in {time.perf_counter() - started:.3f}s")
+
+    conn = sqlite3.connect(f"file:{args.db}?mode=ro", uri=True)
+    mismatches = 0
+    print(f"{'question':<12}{'sqlite ms':>11}{'duckdb ms':>11}{'speedup':>9}  parity")
+    for question_id, question in queries.QUESTIONS.items():
+        sql, params = question.sql, question.params
+        if question_id in UNSUPPORTED:
+            print(f"{question_id:<12}{'':>31}  skipped (SQLite only)")
+            continue
+        # Both sides produce a DataFrame, as the dashboard consumes them
+        expected, sqlite_time = timed(
+            lambda: pd.DataFrame(conn.execute(sql, params).fetchall()), args.repeat)
+        actual, duckdb_time = timed(lambda: engine.frame(question_id, sql, params), args.repeat)
+        ok = results_match(expected, actual)
+        mismatches += not ok
+        print(f"{question_id:<12}{sqlite_time * 1e3:>11.2f}{duckdb_time * 1e3:>11.2f}"
+              f"{sqlite_time / duckdb_time:>8.1f}x  {'ok' if ok else 'MISMATCH'}")
+    conn.close()
+    engine.close()
+    if mismatches:
+        parser.exit(1, f"{mismatches} question(s) differ between backends\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Small pool of shared read-only SQLite connections.
+
+The dashboard only reads the database, so every Streamlit session can share a
+handful of `mode=ro` connections opened once per server process instead of
+opening (and leaking) one per rerun. Connections are health-checked when they
+are handed out and all of them are closed on shutdown.
+"""
+
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Read-side tuning applied to every pooled connection
+DEFAULT_PRAGMAS = {
+    "query_only": 1,
+    "mmap_size": 256 * 1024 * 1024,  # map up to 256 MB of the file
+    "cache_size": -32 * 1024,        # 32 MB page cache per connection
+    "temp_store": "MEMORY",
+}
+
+
+class PoolClosedError(RuntimeError):
+    pass
+
+
+class PoolTimeoutError(RuntimeError):
+    pass
+
+
+def open_readonly(db_path, pragmas=None, cached_statements=128):
+    uri = "file:{}?mode=ro".format(os.path.abspath(db_path))
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=False, cached_statements=cached_statements)
+    for name, value in (DEFAULT_PRAGMAS if pragmas is None else pragmas).items():
+        conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+
+class ConnectionPool:
+    # `size` connections at most; they are opened lazily on first use.
+    # Connections idle for longer than `health_check_after` seconds are
+    # pinged before being handed out and replaced if the ping fails.
+    def __init__(self, db_path, size=4, timeout=10.0, pragmas=None, health_check_after=30.0):
+        if not os.path.exists(db_path):
+            raise FileNotFoundError(db_path)
+        self.db_path = db_path
+        self.size = size
+        self.timeout = timeout
+        self.pragmas = pragmas
+        self.health_check_after = health_check_after
+        self._idle = queue.LifoQueue()
+        self._all = set()
+        self._lock = threading.Lock()
+        self._closed = False
+        self.journal_mode = None
+        atexit.register(self.close)
+
+    def _open(self):
+        conn = open_readonly(self.db_path, self.pragmas)
+        # A WAL database keeps serving readers while a writer appends to the
+        # log; each read transaction then sees the latest committed snapshot
+        if self.journal_mode is None:
+            self.journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+        return conn
+
+    def _acquire(self):
+        if self._closed:
+            raise PoolClosedError("connection pool is closed")
+        try:
+            conn, last_used = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                if len(self._all) < self.size:
+                    conn = self._open()
+                    self._all.add(conn)
+                    return conn
+            try:
+                conn, last_used = self._idle.get(timeout=self.timeout)
+            except queue.Empty:
+                raise PoolTimeoutError(
+                    f"no database connection available after {self.timeout}s"
+                ) from None
+        if time.monotonic() - last_used > self.health_check_after and not self._healthy(conn):
+            conn = self._replace(conn)
+        return conn
+
+    def _release(self, conn):
+        if self._closed:
+            self._discard(conn)
+            return
+        # Never hand a connection with an open read transaction to the next user
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put((conn, time.monotonic()))
+
+    @staticmethod
+    def _healthy(conn):
+        try:
+            conn.execute("SELECT 1").fetchone()
+        except sqlite3.Error:
+            return False
+        return True
+
+    def _discard(self, conn):
+        with self._lock:
+            self._all.discard(conn)
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def _replace(self, conn):
+        self._discard(conn)
+        new_conn = self._open()
+        with self._lock:
+            self._all.add(new_conn)
+        return new_conn
+
+    @contextmanager
+    def connection(self):
+        conn = self._acquire()
+        try:
+            yield conn
+        except sqlite3.DatabaseError:
+            # The connection may be unusable (e.g. the file was replaced)
+            if not self._healthy(conn):
+                self._discard(conn)
+                conn = None
+            raise
+        finally:
+            if conn is not None:
+                self._release(conn)
+
+    def health_check(self):
+        # Ping every idle connection, replacing dead ones; returns the stats
+        checked = []
+        while True:
+            try:
+                checked.append(self._idle.get_nowait())
+            except queue.Empty:
+                break
+        for conn, last_used in checked:
+            if not self._healthy(conn):
+                conn, last_used = self._replace(conn), time.monotonic()
+            self._idle.put((conn, last_used))
+        return self.stats()
+
+    def stats(self):
+        return {
+            "size": self.size,
+            "open": len(self._all),
+            "idle": self._idle.qsize(),
+            "journal_mode": self.journal_mode,
+        }
+
+    def close(self):
+        self._closed = True
+        with self._lock:
+            conns, self._all = self._all, set()
+        for conn in conns:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        atexit.unregister(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,194 @@
+"""
+Faceted filtering of the catalog on precomputed bitmap indexes.
+
+`FacetIndex` keeps one entry per book, in rowid order:
+- categorical facets (language, category, country, saleability, format): the
+  value code of every book, plus a packed bitmap (`np.packbits`, one bit per
+  book) for each of the MAX_BITMAPS most frequent values of the facet
+- range facets (publication year, page count, retail price in USD): the
+  value of every book as a float, NaN when missing
+
+A selection maps facets to the chosen values, or to (low, high) bounds. The
+values of one facet are ORed and the facets are ANDed, as bitwise operations
+on the packed bitmaps (1M books are 125 KB per bitmap). The selected rowids
+then scope every question (queries.scoped_sql).
+
+`counts()` gives the live counts shown next to each facet: how many books
+each value would match given the filters of the *other* facets, so choosing
+a value never hides its siblings.
+
+`Facets` keeps the index of the current database file and rebuilds it when
+the file changes (query_cache.Snapshot).
+"""
+
+import json
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from query_cache import LRUCache, Snapshot
+
+
+# `kind` is "values" (pick any of the values) or "range" (low..high bounds)
+Facet = namedtuple("Facet", ["name", "label", "kind"])
+
+FACETS = [
+    Facet("language", "Language", "values"),
+    Facet("category", "Category", "values"),
+    Facet("country", "Country", "values"),
+    Facet("saleability", "Saleability", "values"),
+    Facet("format", "Format", "values"),
+    Facet("year", "Publication year", "range"),
+    Facet("pages", "Page count", "range"),
+    Facet("price", "Retail price", "range"),
+]
+
+# One row per book, in rowid order, with a column per facet
+INDEX_SQL = """
+    SELECT
+        b.rowid,
+        b.language,
+        c.name AS category,
+        b.country,
+        b.saleability,
+        CASE b.isEbook WHEN 1 THEN 'eBook' WHEN 0 THEN 'Physical book' END AS format,
+        b.pub_year AS year,
+        b.pageCount AS pages,
+        b.price_usd AS price
+    FROM books AS b
+    LEFT JOIN categories AS c ON c.category_id = b.category_id
+    ORDER BY b.rowid;
+"""
+
+# Precomputed bitmaps per categorical facet; rarer values are matched on the
+# value codes when selected
+MAX_BITMAPS = 256
+
+# The rowids of a selection, as the JSON array bound by queries.scoped_sql
+Scope = namedtuple("Scope", ["key", "count", "rowids"])
+
+
+class FacetIndex:
+    def __init__(self, frame):
+        self.rowids = frame["rowid"].to_numpy(dtype=np.int64)
+        self.size = len(self.rowids)
+        self._everything = np.packbits(np.ones(self.size, dtype=bool))
+        self.values, self._codes, self._positions, self._bitmaps = {}, {}, {}, {}
+        self.ranges, self._numbers = {}, {}
+        for facet in FACETS:
+            if facet.kind == "values":
+                codes, values = pd.factorize(frame[facet.name], sort=True)  # -1 when missing
+                self.values[facet.name] = [str(value) for value in values]
+                self._codes[facet.name] = codes
+                self._positions[facet.name] = {value: code for code, value in enumerate(self.values[facet.name])}
+                frequent = np.argsort(-np.bincount(codes[codes >= 0], minlength=len(values)), kind="stable")
+                self._bitmaps[facet.name] = {
+                    int(code): np.packbits(codes == code) for code in frequent[:MAX_BITMAPS]
+                }
+            else:
+                numbers = pd.to_numeric(frame[facet.name], errors="coerce").to_numpy(dtype=np.float64)
+                self._numbers[facet.name] = numbers
+                present = numbers[~np.isnan(numbers)]
+                self.ranges[facet.name] = (float(present.min()), float(present.max())) if len(present) else None
+        self._scopes = LRUCache(max_entries=16)
+
+    @classmethod
+    def load(cls, conn):
+        return cls(pd.read_sql_query(INDEX_SQL, conn))
+
+    # The facets of a selection that filter anything, as a hashable key:
+    # ((name, values or (low, high)), ...)
+    def key(self, selection):
+        active = []
+        for facet in FACETS:
+            choice = selection.get(facet.name)
+            if not choice:
+                continue
+            if facet.kind == "values":
+                active.append((facet.name, tuple(sorted(choice))))
+            elif self.ranges.get(facet.name) is not None:
+                low, high = choice
+                full_low, full_high = self.ranges[facet.name]
+                if low > full_low or high < full_high:
+                    active.append((facet.name, (low, high)))
+        return tuple(active)
+
+    def _value_bitmap(self, name, value):
+        code = self._positions[name].get(value)
+        if code is None:
+            return np.zeros_like(self._everything)
+        bitmap = self._bitmaps[name].get(code)
+        return bitmap if bitmap is not None else np.packbits(self._codes[name] == code)
+
+    def _facet_bitmap(self, name, choice):
+        if name in self._codes:
+            bitmap = np.zeros_like(self._everything)
+            for value in choice:
+                bitmap |= self._value_bitmap(name, value)
+            return bitmap
+        # Books without a value are outside every narrowed range
+        low, high = choice
+        numbers = self._numbers[name]
+        return np.packbits((numbers >= low) & (numbers <= high))
+
+    def _mask(self, bitmap):
+        return np.unpackbits(bitmap, count=self.size).view(bool)
+
+    # Packed bitmap of the books a selection keeps
+    def select(self, selection):
+        bitmap = self._everything
+        for name, choice in self.key(selection):
+            bitmap = bitmap & self._facet_bitmap(name, choice)
+        return bitmap
+
+    def count(self, selection):
+        return int(np.bitwise_count(self.select(selection)).sum())
+
+    # Per facet, the books each value would match under the other facets'
+    # filters (value -> count), or the books in the range facet's bounds
+    def counts(self, selection):
+        bitmaps = {name: self._facet_bitmap(name, choice) for name, choice in self.key(selection)}
+        counts = {}
+        for facet in FACETS:
+            others = self._everything
+            for name, bitmap in bitmaps.items():
+                if name != facet.name:
+                    others = others & bitmap
+            if facet.kind == "values":
+                codes = self._codes[facet.name][self._mask(others)]
+                per_code = np.bincount(codes[codes >= 0], minlength=len(self.values[facet.name]))
+                counts[facet.name] = dict(zip(self.values[facet.name], per_code.tolist()))
+            else:
+                if facet.name in bitmaps:
+                    others = others & bitmaps[facet.name]
+                counts[facet.name] = int(np.bitwise_count(others).sum())
+        return counts
+
+    # The selected rowids for queries.scoped_sql, or None when the selection
+    # filters nothing (questions then run unscoped, on their indexes and
+    # precomputed aggregates)
+    def scope(self, selection):
+        key = self.key(selection)
+        if not key:
+            return None
+        scope = self._scopes.get(key)
+        if scope is None:
+            rowids = self.rowids[self._mask(self.select(selection))]
+            scope = Scope(key, len(rowids), json.dumps(rowids.tolist()))
+            self._scopes.put(key, scope)
+        return scope
+
+
+class Facets:
+    # The FacetIndex of the database file, rebuilt when the file changes. The
+    # fingerprint is re-checked at most every `check_interval` seconds.
+    def __init__(self, db_path, check_interval=1.0):
+        self.db_path = db_path
+        self._snapshot = Snapshot(db_path, FacetIndex.load, check_interval)
+
+    def load(self):
+        self._snapshot.load()
+
+    def index(self):
+        return self._snapshot.get()
@@ -0,0 +1,175 @@
+"""
+Hand-drawn charts of the dashboard questions (the ones not described by a
+charts.ChartSpec).
+
+Each `draw_*` function has the charts.ChartRenderer signature
+`(fig, ax, data, **options)`. They are module-level, so a chart can be drawn
+in a worker process (report.py) as well as in the dashboard. `FIGURES` says
+how each chart is built from the default result of its question.
+"""
+
+from collections import namedtuple
+
+import pandas as pd
+
+import outliers
+
+
+# 1. eBooks vs physical books, from the (isEbook, count) rows
+def ebook_counts(result):
+    return {
+        'EBooks': next((row[1] for row in result if row[0] == 1), 0),
+        'Physical Books': next((row[1] for row in result if row[0] == 0), 0),
+    }
+
+
+def draw_ebook_share(fig, ax, data):
+    ax.pie(data.values(), labels=list(data.keys()), autopct='%1.1f%%', startangle=90)
+    ax.axis('equal')  # Equal aspect ratio ensures the pie is drawn as a circle.
+
+
+# 7. Average page count per book type
+def label_book_types(frame):
+    frame = frame.copy()
+    frame["Book Type"] = frame["Book Type"].replace({0: "Physical Book", 1: "EBook"})
+    return frame
+
+
+def draw_page_counts_by_type(fig, ax, data):
+    ax.bar(data["Book Type"], data["Average Page Count"], color='cyan')
+    ax.set_xlabel('Book Type', fontsize=13)
+    ax.set_ylabel('Average Page Count', fontsize=13)
+    ax.set_title('Average Page Count for eBooks vs Physical Books', fontsize=15)
+
+
+# 8. Top authors
+def draw_top_authors(fig, ax, data):
+    ax.bar(data["Authors"], data["Book Count"], color='magenta')
+    ax.set_xlabel('Authors', fontsize=12)
+    ax.set_ylabel('Number of Books', fontsize=12)
+    ax.set_title('Top 3 Authors with the Most Books', fontsize=14)
+    ax.tick_params(axis='x', rotation=45)  # Rotate x-axis labels for better readability
+
+
+# 9. Publishers with more than 10 books
+def draw_prolific_publishers(fig, ax, data):
+    ax.bar(data["Publisher"], data["Book Count"], color='yellow')
+    ax.set_xlabel('Publisher', fontsize=13)
+    ax.set_ylabel('Number of Books', fontsize=12)
+    ax.set_title('Publishers with More than 10 Books', fontsize=14)
+    ax.tick_params(axis='x', rotation=90)  # Rotate x-axis labels for better readability
+
+
+# 10. Average page count per category, highest and lowest highlighted
+def draw_category_page_counts(fig, ax, data):
+    # Find categories with highest and lowest average page counts
+    max_category = data.iloc[data["Average Page Count"].idxmax()]
+    min_category = data.iloc[data["Average Page Count"].idxmin()]
+
+    ax.plot(
+        data["Category"],
+        data["Average Page Count"],
+        marker='o', linestyle='-', color='blue', label='Average Page Count'
+    )
+
+    # Highlight high and low points
+    ax.scatter(max_category["Category"], max_category["Average Page Count"], color='red',
+               label=f"Highest: {max_category['Category']}")
+    ax.scatter(min_category["Category"], min_category["Average Page Count"], color='green',
+               label=f"Lowest: {min_category['Category']}")
+
+    # Add annotations for the highest and lowest points
+    ax.text(
+        max_category["Category"], max_category["Average Page Count"] + 5, f"{max_category['Category']}",
+        color='red', ha='center', fontsize=10
+    )
+    ax.text(
+        min_category["Category"], min_category["Average Page Count"] - 5, f"{min_category['Category']}",
+        color='green', ha='center', fontsize=10
+    )
+
+    # Set axis labels and title
+    ax.set_xlabel("Category", fontsize=12)
+    ax.set_ylabel("Average Page Count", fontsize=12)
+    ax.set_title("Average Page Count for Each Category", fontsize=14)
+
+    # Hide x-axis labels and add a legend
+    ax.set_xticklabels([])
+    ax.legend()
+
+
+# 14. Keyword counts, from the q14_counts row
+def keyword_counts(counts):
+    return pd.DataFrame({
+        "Keywords": ["Python", "Data Science", "Both", "Others"],
+        "Book Count": list(counts),
+    })
+
+
+def draw_keyword_counts(fig, ax, data):
+    ax.bar(data["Keywords"], data["Book Count"], color=["blue", "green", "orange", "indigo"])
+    ax.set_xlabel("Keywords", fontsize=12)
+    ax.set_ylabel("Book Count", fontsize=12)
+    ax.set_title("Books with Specific Keywords in the Title", fontsize=14)
+    ax.bar_label(ax.containers[0], fmt='%d')  # Add value labels on bars
+
+
+# 16. The longest publishing streaks
+def draw_streaks(fig, ax, data):
+    ax.bar(data["Author"], data["Consecutive Year Count"], color='purple')
+    ax.set_xlabel('Authors')
+    ax.set_ylabel('Consecutive Year Count')
+    ax.tick_params(axis='x', rotation=45)
+    for label in ax.get_xticklabels():
+        label.set_horizontalalignment("right")
+
+
+# 19. Rating outliers, with the reference rating they were compared against
+def rating_outliers(frame, method="zscore", k=None):
+    detected = outliers.detect_outliers(frame["Average Rating"].to_numpy(dtype=float), method, k)
+    options = {
+        "center": float(detected.center[0]) if len(detected.center) else None,
+        "center_label": "Mean Rating" if method == "zscore" else "Median Rating",
+    }
+    return frame[detected.mask].reset_index(drop=True)[["Average Rating", "Ratings Count"]], options
+
+
+def draw_rating_outliers(fig, ax, data, center=None, center_label=None):
+    # Scatter plot for all books
+    ax.scatter(
+        data.index,
+        data["Average Rating"],
+        c="red",
+        s=data["Ratings Count"] * 2,  # Adjust the size based on Ratings Count
+        alpha=1,
+        label="Outliers"
+    )
+    if center is not None:
+        ax.axhline(center, color="blue", linestyle="--", label=center_label)
+
+    # Adding plot details
+    ax.set_xlabel("Books (Index)", fontsize=12)
+    ax.set_ylabel("Average Rating", fontsize=12)
+    ax.set_title("Scatter Plot of Average Ratings with Outliers Highlighted", fontsize=14)
+    ax.legend()
+
+
+# A chart of the question `section`, drawn from the default result of the
+# keyed question: `data(result)` returns the plotted data and the draw options
+Figure = namedtuple("Figure", ["section", "draw", "figsize", "data"])
+
+
+def _as_is(frame):
+    return frame, {}
+
+
+FIGURES = {
+    "q1": Figure("q1", draw_ebook_share, None, lambda frame: (ebook_counts(list(frame.itertuples(index=False))), {})),
+    "q7": Figure("q7", draw_page_counts_by_type, (4, 4), lambda frame: (label_book_types(frame), {})),
+    "q8": Figure("q8", draw_top_authors, (8, 4), _as_is),
+    "q9": Figure("q9", draw_prolific_publishers, (11, 6), _as_is),
+    "q10": Figure("q10", draw_category_page_counts, (12, 6), _as_is),
+    "q14_counts": Figure("q14", draw_keyword_counts, (8, 6), lambda counts: (keyword_counts(counts), {})),
+    "q16": Figure("q16", draw_streaks, (10, 5), lambda frame: (frame.head(30), {})),
+    "q19": Figure("q19", draw_rating_outliers, (10, 6), rating_outliers),
+}
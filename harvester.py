@@ -0,0 +1,416 @@
+"""
+Harvest Google Books volumes for new search keys into books_database.db.
+
+The catalog is a dump of the Google Books API `volumes` search. This fetches
+more of it, search key by search key:
+
+- Pages of up to 40 volumes are fetched by a fixed pool of asyncio workers.
+  The first page of a key tells how many results it has. The remaining pages,
+  up to `--max-items`, are then queued and fetched concurrently.
+- A token bucket caps the request rate across all workers. Throughput grows
+  with the number of workers until it reaches that rate.
+- Connection and protocol errors, 429 and 5xx responses are retried with
+  exponential backoff and jitter, honouring `Retry-After`. A page that still
+  fails, or whose response cannot be converted, is reported and skipped.
+- Volumes are converted to `books` rows and handed to a single writer through
+  a bounded queue. When the database falls behind, the workers wait instead of
+  buffering pages. The writer batches rows into ingest.Loader (delta upserts,
+  dimension refresh) on a thread of its own. Books already in the database
+  keep their search key, so a volume found again by another key is neither
+  moved nor counted as updated. The similar-books index, when built, is
+  updated at the end of the run.
+
+Requests go through a transport, an async callable `url -> Response`:
+- `UrllibTransport` fetches over HTTP (the real API, or a local fixture server
+  with `--base-url`).
+- `RecordingTransport` saves every response to a directory.
+- `ReplayTransport` serves saved responses without touching the network.
+
+Usage: python harvester.py "machine learning" statistics [--db books_database.db]
+           [--concurrency 8] [--rate 10] [--max-items 400] [--record DIR | --replay DIR]
+"""
+
+import argparse
+import asyncio
+import functools
+import gzip
+import hashlib
+import http.client
+import json
+import os
+import random
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from ingest import DEFAULT_BATCH_SIZE, Loader, Progress
+import similarity
+from migrations import BOOK_COLUMNS
+
+
+API_URL = "https://www.googleapis.com/books/v1/volumes"
+
+# maxResults cap of the volumes search
+PAGE_SIZE = 40
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_RATE = 10.0  # requests per second
+DEFAULT_MAX_ITEMS = 400  # per search key
+DEFAULT_RETRIES = 5
+DEFAULT_BACKOFF = 0.5  # seconds before the first retry
+
+# Statuses worth retrying; any other non-200 status fails the page
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+Response = namedtuple("Response", ["status", "headers", "body"])
+
+
+class HarvestError(RuntimeError):
+    pass
+
+
+# -- volumes -> books rows ------------------------------------------------
+
+
+def _json_text(value):
+    return json.dumps(value) if value is not None else None
+
+
+# A `books` row (BOOK_COLUMNS order) from a volume of the search results, in
+# the layout of the original dump: nested objects as JSON text, authors
+# comma-joined
+def volume_row(volume, search_key):
+    info = volume.get("volumeInfo", {})
+    sale = volume.get("saleInfo", {})
+    reading_modes = info.get("readingModes", {})
+    list_price = sale.get("listPrice", {})
+    retail_price = sale.get("retailPrice", {})
+    record = {
+        "book_id": volume.get("id"),
+        "search_key": search_key,
+        "book_title": info.get("title"),
+        "book_subtitle": info.get("subtitle"),
+        "book_authors": ",".join(info.get("authors", [])) or None,
+        "book_publisher": info.get("publisher"),
+        "book_description": info.get("description"),
+        "industryIdentifiers": _json_text(info.get("industryIdentifiers")),
+        "text_readingModes": reading_modes.get("text"),
+        "image_readingModes": reading_modes.get("image"),
+        "pageCount": info.get("pageCount"),
+        "categories": ", ".join(info.get("categories", [])) or None,
+        "language": info.get("language"),
+        "imageLinks": _json_text(info.get("imageLinks")),
+        "ratingsCount": info.get("ratingsCount"),
+        "averageRating": info.get("averageRating"),
+        "country": sale.get("country"),
+        "saleability": sale.get("saleability"),
+        "isEbook": sale.get("isEbook"),
+        "amount_listPrice": list_price.get("amount"),
+        "currencyCode_listPrice": list_price.get("currencyCode"),
+        "amount_retailPrice": retail_price.get("amount"),
+        "currencyCode_retailPrice": retail_price.get("currencyCode"),
+        "buyLink": sale.get("buyLink"),
+        "year": info.get("publishedDate"),
+    }
+    return tuple(record[column] for column in BOOK_COLUMNS)
+
+
+# -- transports -----------------------------------------------------------
+
+
+class UrllibTransport:
+    # Blocking urllib requests on a thread pool of `threads` (the standard
+    # library has no async HTTP client); size it to the harvester concurrency
+    def __init__(self, threads=DEFAULT_CONCURRENCY, timeout=30.0):
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(threads, thread_name_prefix="harvest-http")
+
+    async def __call__(self, url):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._get, url)
+
+    def _get(self, url):
+        request = urllib.request.Request(url, headers={
+            "Accept-Encoding": "gzip", "User-Agent": "bookscape-harvester (gzip)",
+        })
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                body = response.read()
+                if response.headers.get("Content-Encoding") == "gzip":
+                    body = gzip.decompress(body)
+                return Response(response.status, dict(response.headers), body)
+        except urllib.error.HTTPError as exc:
+            return Response(exc.code, dict(exc.headers or {}), exc.read())
+
+    def close(self):
+        self._executor.shutdown()
+
+
+# `url` with its query sorted and without the API key, so recordings neither
+# depend on the key nor store it
+def _canonical_url(url):
+    parts = urllib.parse.urlsplit(url)
+    query = sorted((k, v) for k, v in urllib.parse.parse_qsl(parts.query) if k != "key")
+    return f"{parts.path}?{urllib.parse.urlencode(query)}"
+
+
+def _recording_name(url):
+    return hashlib.sha1(_canonical_url(url).encode()).hexdigest() + ".json"
+
+
+class RecordingTransport:
+    # Passes requests to `transport` and saves the successful responses
+    def __init__(self, transport, directory):
+        self.transport = transport
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    async def __call__(self, url):
+        response = await self.transport(url)
+        if response.status == 200:
+            path = os.path.join(self.directory, _recording_name(url))
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"url": _canonical_url(url), "status": response.status,
+                           "body": response.body.decode("utf-8")}, f)
+        return response
+
+    def close(self):
+        self.transport.close()
+
+
+class ReplayTransport:
+    # Serves the responses saved by RecordingTransport; never touches the network
+    def __init__(self, directory):
+        self.directory = directory
+
+    async def __call__(self, url):
+        path = os.path.join(self.directory, _recording_name(url))
+        try:
+            with open(path, encoding="utf-8") as f:
+                recording = json.load(f)
+        except FileNotFoundError:
+            raise HarvestError(f"no recorded response for {url}") from None
+        return Response(recording["status"], {}, recording["body"].encode("utf-8"))
+
+    def close(self):
+        pass
+
+
+# -- rate limiting ---------------------------------------------------------
+
+
+class TokenBucket:
+    # At most `rate` acquisitions per second on average and `burst` at once;
+    # waiters are served in order
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self._updated = None
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            while True:
+                now = loop.time()
+                if self._updated is not None:
+                    self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def _retry_after(headers):
+    value = next((v for k, v in headers.items() if k.lower() == "retry-after"), None)
+    try:
+        return max(float(value), 0.0) if value is not None else None
+    except ValueError:  # an HTTP date: fall back to the backoff
+        return None
+
+
+# -- harvesting ------------------------------------------------------------
+
+
+class Harvester:
+    def __init__(self, db_path, transport, concurrency=DEFAULT_CONCURRENCY, rate=DEFAULT_RATE,
+                 max_items=DEFAULT_MAX_ITEMS, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF,
+                 batch_size=DEFAULT_BATCH_SIZE, api_key=None, base_url=API_URL, progress=None):
+        self.db_path = db_path
+        self.transport = transport
+        self.concurrency = concurrency
+        self.rate = rate
+        self.max_items = max_items
+        self.retries = retries
+        self.backoff = backoff
+        self.batch_size = batch_size
+        self.api_key = api_key
+        self.base_url = base_url
+        self.progress = progress or (lambda *args, **kwargs: None)
+        # requests, retries, pages and volumes fetched, rows written
+        self.stats = Counter()
+        self.errors = []
+        self.counts = Counter()
+
+    def page_url(self, search_key, start):
+        params = {
+            "q": search_key, "startIndex": start,
+            "maxResults": min(PAGE_SIZE, self.max_items - start), "printType": "books",
+        }
+        if self.api_key:
+            params["key"] = self.api_key
+        return f"{self.base_url}?{urllib.parse.urlencode(params)}"
+
+    async def _fetch(self, url):
+        error, delay = None, None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.stats["retries"] += 1
+                await asyncio.sleep(delay if delay is not None
+                                    else self.backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+            await self._bucket.acquire()
+            self.stats["requests"] += 1
+            try:
+                response = await self.transport(url)
+            except (OSError, http.client.HTTPException, asyncio.TimeoutError) as exc:
+                error, delay = f"{type(exc).__name__}: {exc}", None
+                continue
+            if response.status == 200:
+                try:
+                    return json.loads(response.body)
+                except ValueError as exc:
+                    raise HarvestError(f"bad JSON response: {exc}") from None
+            if response.status not in RETRY_STATUSES:
+                raise HarvestError(f"HTTP {response.status}")
+            error, delay = f"HTTP {response.status}", _retry_after(response.headers)
+        raise HarvestError(f"{error} after {self.retries + 1} attempts")
+
+    async def _work(self, pages, rows):
+        while True:
+            search_key, start = await pages.get()
+            try:
+                result = await self._fetch(self.page_url(search_key, start))
+                if start == 0:
+                    # The rest of the key's pages can now be fetched in parallel
+                    total = min(result.get("totalItems", 0), self.max_items)
+                    for next_start in range(PAGE_SIZE, total, PAGE_SIZE):
+                        pages.put_nowait((search_key, next_start))
+                volumes = result.get("items") or []
+                self.stats["pages"] += 1
+                self.stats["volumes"] += len(volumes)
+                # Waits while the writer is behind
+                await rows.put([volume_row(volume, search_key) for volume in volumes if volume.get("id")])
+                self.progress("harvested", self.stats["volumes"])
+            except Exception as exc:
+                # Reported and skipped, whatever went wrong: a worker that died
+                # here would leave its page unfinished and pages.join() waiting
+                message = str(exc) if isinstance(exc, HarvestError) else f"{type(exc).__name__}: {exc}"
+                self.errors.append(f"{search_key!r} from {start}: {message}")
+            finally:
+                pages.task_done()
+
+    async def _write(self, rows):
+        loop = asyncio.get_running_loop()
+        batch = []
+        while True:
+            page = await rows.get()
+            if page is not None:
+                batch += page
+            if batch and (page is None or len(batch) >= self.batch_size):
+                self.stats["written"] += await loop.run_in_executor(self._db, self._loader.write_rows, batch)
+                batch = []
+            if page is None:
+                return
+
+    async def run(self, search_keys):
+        loop = asyncio.get_running_loop()
+        self._bucket = TokenBucket(self.rate)
+        # SQLite connections stay on the thread that opened them
+        self._db = ThreadPoolExecutor(1, thread_name_prefix="harvest-db")
+        # A volume already stored (e.g. found by another key) keeps its search key
+        self._loader = await loop.run_in_executor(
+            self._db, functools.partial(Loader, self.db_path, self.batch_size, keep_search_keys=True))
+        try:
+            pages = asyncio.Queue()
+            for search_key in dict.fromkeys(search_keys):
+                pages.put_nowait((search_key, 0))
+            # Pages converted but not yet written: about two per worker
+            rows = asyncio.Queue(maxsize=2 * self.concurrency)
+            writer = asyncio.create_task(self._write(rows))
+            workers = [asyncio.create_task(self._work(pages, rows)) for _ in range(self.concurrency)]
+            # Stop early if the writer fails; otherwise when every page is done
+            done, _ = await asyncio.wait([writer, asyncio.create_task(pages.join())],
+                                         return_when=asyncio.FIRST_COMPLETED)
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            if writer not in done:
+                await rows.put(None)
+            await writer
+            self.counts = self._loader.counts
+        finally:
+            await loop.run_in_executor(self._db, self._loader.close)
+            self._db.shutdown()
+        return self.stats
+
+
+def harvest(search_keys, db_path="books_database.db", transport=None, **options):
+    transport = transport or UrllibTransport(options.get("concurrency", DEFAULT_CONCURRENCY))
+    harvester = Harvester(db_path, transport, **options)
+    try:
+        asyncio.run(harvester.run(search_keys))
+    finally:
+        transport.close()
+    return harvester
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Harvest Google Books volumes for search keys into SQLite.")
+    parser.add_argument("search_keys", nargs="+", help="search terms (the `q` of the volumes search)")
+    parser.add_argument("--db", default="books_database.db", help="target database (created if missing)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="requests in flight")
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE, help="requests per second")
+    parser.add_argument("--max-items", type=int, default=DEFAULT_MAX_ITEMS, help="volumes per search key")
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--base-url", default=API_URL, help="volumes endpoint (e.g. a local fixture server)")
+    parser.add_argument("--api-key", default=os.environ.get("GOOGLE_BOOKS_API_KEY"),
+                        help="API key (default: $GOOGLE_BOOKS_API_KEY)")
+    recordings = parser.add_mutually_exclusive_group()
+    recordings.add_argument("--record", metavar="DIR", help="save every response to DIR")
+    recordings.add_argument("--replay", metavar="DIR", help="serve responses saved with --record from DIR")
+    args = parser.parse_args(argv)
+
+    if args.replay:
+        transport = ReplayTransport(args.replay)
+    else:
+        transport = UrllibTransport(args.concurrency)
+        if args.record:
+            transport = RecordingTransport(transport, args.record)
+    started = time.perf_counter()
+    harvester = harvest(
+        args.search_keys, args.db, transport, concurrency=args.concurrency, rate=args.rate,
+        max_items=args.max_items, retries=args.retries, batch_size=args.batch_size,
+        api_key=args.api_key, base_url=args.base_url, progress=Progress(),
+    )
+    stats, counts = harvester.stats, harvester.counts
+    elapsed = time.perf_counter() - started
+    print(f"\n{stats['volumes']} volumes from {stats['pages']} pages in {elapsed:.1f}s "
+          f"({stats['requests']} requests, {stats['retries']} retries, {stats['requests'] / elapsed:.1f} req/s); "
+          f"{counts['inserted']} new, {counts['updated']} changed, {counts['unchanged']} unchanged",
+          file=sys.stderr)
+    for error in harvester.errors:
+        print(f"failed: {error}", file=sys.stderr)
+    if similarity.available(args.db) and counts["inserted"] + counts["updated"]:
+        similarity.update(args.db, progress=Progress())
+    if harvester.errors:
+        parser.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,429 @@
+"""
+Streaming loader for Google Books exports into books_database.db.
+
+Two input layouts are accepted:
+
+- JSON Lines (`.jsonl` / `.ndjson`): one book object per line. Rows are
+  streamed straight into `books`.
+- pandas column-oriented JSON (`{"book_id": {"0": ...}, ...}`, as in
+  cleaned_books_data.json). It is parsed incrementally with ijson, one column
+  at a time, into a staging table keyed by row index. Staged rows are then
+  moved into `books`. This needs the optional `ijson` package. The staging
+  table and its checkpoints live in a sidecar file next to the database
+  (books_database.staging.db), removed once the load finishes, so staging
+  never writes to the database itself.
+
+Rows are written in batches of `executemany` upserts, one transaction per
+batch. The batch also refreshes the derived author/publisher/category data
+for its rows and records a checkpoint. Memory stays flat whatever the file
+size, and an interrupted load resumes after the last committed batch.
+
+Loads are deltas: each record is hashed (migrations.content_hash) and only
+new books and books whose hash differs from the stored one are upserted, so
+the triggers, dimension refreshes and summary updates run for changed rows
+only. A batch with no changes writes nothing, not even its checkpoint, and a
+re-delivered file that changes nothing leaves the database file untouched,
+so the dashboard's caches (keyed on the file) stay valid.
+
+While it writes, the loader runs the database in WAL mode (synchronous =
+NORMAL) and `close()` restores the journal mode it found, so the shipped
+database stays a single rollback-journal file. When the similar
+books index has been built (similarity.py), the command line brings it up to
+date with the loaded books.
+
+Usage: python ingest.py cleaned_books_data.json [--db books_database.db] [--batch-size 5000]
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from collections import Counter
+
+import similarity
+from migrations import BOOK_COLUMNS, content_hash, migrate, refresh_dimensions
+
+try:
+    import ijson
+except ImportError:  # only needed for the column-oriented layout
+    ijson = None
+
+
+DEFAULT_BATCH_SIZE = 5000
+
+CHECKPOINT_DDL = """
+    CREATE TABLE IF NOT EXISTS ingest_checkpoints (
+        source TEXT PRIMARY KEY,
+        fingerprint TEXT NOT NULL,
+        position TEXT NOT NULL,
+        rows_loaded INTEGER NOT NULL,
+        finished INTEGER NOT NULL DEFAULT 0
+    )
+"""
+
+STAGING_TABLE = "staging.ingest_staging"
+
+# Source columns plus the content hash of the row
+UPSERT_COLUMNS = BOOK_COLUMNS + ("content_hash",)
+
+# Changed rows of a batch are collected in a temp table and upserted with a
+# single statement: FTS5 flushes its pending index data at every statement
+# savepoint, so a row-at-a-time executemany writes one tiny index segment per
+# book (and then merges them)
+BATCH_DDL = f"CREATE TEMP TABLE IF NOT EXISTS ingest_batch ({', '.join(UPSERT_COLUMNS)})"
+
+BATCH_INSERT_SQL = (f"INSERT INTO temp.ingest_batch ({', '.join(UPSERT_COLUMNS)}) "
+                    f"VALUES ({', '.join('?' * len(UPSERT_COLUMNS))})")
+
+UPSERT_SQL = """
+    INSERT INTO books ({columns})
+    SELECT {columns} FROM temp.ingest_batch WHERE true ORDER BY rowid
+    ON CONFLICT (book_id) DO UPDATE SET {updates}
+""".format(
+    columns=", ".join(UPSERT_COLUMNS),
+    # An upsert (unlike INSERT OR REPLACE) fires the UPDATE triggers that keep
+    # the FTS index and the summary tables in sync
+    updates=", ".join(f"{c} = excluded.{c}" for c in UPSERT_COLUMNS if c != "book_id"),
+)
+
+
+class IngestError(RuntimeError):
+    pass
+
+
+def detect_format(path):
+    return "jsonl" if path.endswith((".jsonl", ".ndjson")) else "columns"
+
+
+def _fingerprint(path):
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def staging_path(db_path):
+    return os.path.splitext(db_path)[0] + ".staging.db"
+
+
+def _to_row(record):
+    return tuple(record.get(column) for column in BOOK_COLUMNS)
+
+
+class Progress:
+    # Prints rows loaded and throughput at most every `interval` seconds
+    def __init__(self, stream=sys.stderr, interval=1.0):
+        self.stream = stream
+        self.interval = interval
+        self.started = time.monotonic()
+        self._last = 0.0
+
+    def __call__(self, phase, done, total=None, final=False):
+        now = time.monotonic()
+        if not final and now - self._last < self.interval:
+            return
+        self._last = now
+        elapsed = max(now - self.started, 1e-9)
+        of_total = f"/{total}" if total else ""
+        print(f"\r{phase}: {done}{of_total} rows ({done / elapsed:,.0f} rows/s)",
+              end="\n" if final else "", file=self.stream, flush=True)
+
+
+class Loader:
+    # With `keep_search_keys`, books already stored keep the search key they
+    # were first loaded under (harvester.py: a volume found by several keys)
+    def __init__(self, db_path, batch_size=DEFAULT_BATCH_SIZE, progress=None, keep_search_keys=False):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.progress = progress or (lambda *args, **kwargs: None)
+        self.keep_search_keys = keep_search_keys
+        # Records by outcome: inserted, updated or unchanged
+        self.counts = Counter()
+        self._wrote = False
+        # Journal mode found before the first write, once switched to WAL
+        self._journal_mode = None
+        migrate(db_path)
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute(CHECKPOINT_DDL)
+        self.conn.execute(BATCH_DDL)
+        self.conn.commit()
+
+    # WAL for the batches, switched on at the first write only: a load that
+    # changes nothing leaves the file as it was
+    def _use_wal(self):
+        if self._journal_mode is None:
+            self._journal_mode = self.conn.execute("PRAGMA main.journal_mode").fetchone()[0]
+            self.conn.execute("PRAGMA main.journal_mode = WAL")
+            self.conn.execute("PRAGMA synchronous = NORMAL")
+
+    def close(self):
+        if self._journal_mode not in (None, "wal"):
+            try:
+                # Checkpoints the WAL and removes the -wal/-shm files
+                self.conn.execute(f"PRAGMA main.journal_mode = {self._journal_mode}")
+            except sqlite3.OperationalError:
+                pass  # another connection still reads it; it stays in WAL mode
+        self.conn.close()
+
+    # -- checkpoints -------------------------------------------------------
+
+    # `schema` "staging": the checkpoints of the column-oriented staging phase
+    def _checkpoint(self, source, schema="main"):
+        row = self.conn.execute(
+            f"SELECT fingerprint, position, rows_loaded, finished FROM {schema}.ingest_checkpoints WHERE source = ?",
+            (source,),
+        ).fetchone()
+        return row
+
+    def _save_checkpoint(self, source, fingerprint, position, rows_loaded, finished=False, schema="main"):
+        self.conn.execute(f"""
+            INSERT INTO {schema}.ingest_checkpoints (source, fingerprint, position, rows_loaded, finished)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (source) DO UPDATE SET
+                fingerprint = excluded.fingerprint, position = excluded.position,
+                rows_loaded = excluded.rows_loaded, finished = excluded.finished
+        """, (source, fingerprint, json.dumps(position), rows_loaded, int(finished)))
+
+    def _resume_point(self, source, fingerprint, restart, schema="main"):
+        checkpoint = None if restart else self._checkpoint(source, schema)
+        if checkpoint is None or checkpoint[0] != fingerprint:
+            # New or changed file: start over
+            return None, 0, False
+        return json.loads(checkpoint[1]), checkpoint[2], bool(checkpoint[3])
+
+    # -- writing -----------------------------------------------------------
+
+    # The rows of a batch that are new or differ from the stored book, with
+    # their content hash appended (the last copy of a book in the batch wins)
+    def _changed_rows(self, rows):
+        latest = {row[0]: row for row in rows}
+        stored = {book_id: (search_key, stored_hash) for book_id, search_key, stored_hash in self.conn.execute(
+            "SELECT book_id, search_key, content_hash FROM books WHERE book_id IN (SELECT value FROM json_each(?))",
+            (json.dumps([book_id for book_id in latest if book_id is not None]),),
+        )}
+        changed = []
+        for book_id, row in latest.items():
+            if self.keep_search_keys and book_id in stored:
+                row = row[:1] + (stored[book_id][0],) + row[2:]
+            row += (content_hash(*row),)
+            if book_id not in stored:
+                self.counts["inserted"] += 1
+            elif stored[book_id][1] != row[-1]:
+                self.counts["updated"] += 1
+            else:
+                self.counts["unchanged"] += 1
+                continue
+            changed.append(row)
+        return changed
+
+    # Upsert the new and changed rows of a batch (BOOK_COLUMNS tuples) in one
+    # transaction, saving `checkpoint` (source, fingerprint, position,
+    # rows_loaded) with them. Returns the number of rows written. Also the
+    # entry point for other producers of rows (harvester.py).
+    def write_rows(self, rows, checkpoint=None):
+        changed = self._changed_rows(rows)
+        if not changed:
+            # Nothing to write; a resumed load re-reads (and skips) this batch
+            return 0
+        self._use_wal()
+        with self.conn:
+            self.conn.execute("DELETE FROM temp.ingest_batch")
+            self.conn.executemany(BATCH_INSERT_SQL, changed)
+            self.conn.execute(UPSERT_SQL)
+            refresh_dimensions(self.conn, [row[0] for row in changed])
+            if checkpoint is not None:
+                self._save_checkpoint(*checkpoint)
+        self._wrote = True
+        return len(changed)
+
+    def _write_batch(self, rows, source, fingerprint, position, rows_loaded):
+        self.write_rows(rows, (source, fingerprint, position, rows_loaded))
+
+    def _finish(self, source, fingerprint, position, rows_loaded):
+        if self._wrote:
+            with self.conn:
+                self._save_checkpoint(source, fingerprint, position, rows_loaded, finished=True)
+        counts = self.counts
+        self.progress(f"loaded ({counts['inserted']} new, {counts['updated']} changed, "
+                      f"{counts['unchanged']} unchanged)", rows_loaded, final=True)
+        return rows_loaded
+
+    # -- JSON Lines --------------------------------------------------------
+
+    def load_jsonl(self, path, restart=False):
+        source, fingerprint = os.path.abspath(path), _fingerprint(path)
+        offset, rows_loaded, finished = self._resume_point(source, fingerprint, restart)
+        if finished:
+            return rows_loaded
+        offset = offset or 0
+        batch = []
+        with open(path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                offset += len(line)
+                if not line.strip():
+                    continue
+                try:
+                    batch.append(_to_row(json.loads(line)))
+                except (ValueError, AttributeError) as exc:
+                    raise IngestError(f"{path}: bad JSON record ending at byte {offset}: {exc}") from None
+                if len(batch) >= self.batch_size:
+                    rows_loaded += len(batch)
+                    self._write_batch(batch, source, fingerprint, offset, rows_loaded)
+                    self.progress("loaded", rows_loaded)
+                    batch = []
+        if batch:
+            rows_loaded += len(batch)
+            self._write_batch(batch, source, fingerprint, offset, rows_loaded)
+        return self._finish(source, fingerprint, offset, rows_loaded)
+
+    # -- column-oriented JSON ---------------------------------------------
+
+    def _attach_staging(self):
+        self.conn.execute("ATTACH DATABASE ? AS staging", (staging_path(self.db_path),))
+        self.conn.execute(CHECKPOINT_DDL.replace("ingest_checkpoints", "staging.ingest_checkpoints"))
+        columns = ", ".join(BOOK_COLUMNS)
+        self.conn.execute(f"CREATE TABLE IF NOT EXISTS {STAGING_TABLE} (row_index INTEGER PRIMARY KEY, {columns})")
+        self.conn.commit()
+
+    def _drop_staging(self):
+        self.conn.execute("DETACH DATABASE staging")
+        os.remove(staging_path(self.db_path))
+
+    def _stage_values(self, column, values, source, fingerprint, position):
+        with self.conn:
+            self.conn.executemany(f"""
+                INSERT INTO {STAGING_TABLE} (row_index, {column}) VALUES (?, ?)
+                ON CONFLICT (row_index) DO UPDATE SET {column} = excluded.{column}
+            """, values)
+            self._save_checkpoint(source, fingerprint, position, 0, schema="staging")
+
+    def _stream_columns(self, path, skip_columns, skip_values):
+        # Yields (column, row_index, value) from `{"column": {"row_index": value}}`
+        column, row_index, seen = None, None, 0
+        with open(path, "rb") as f:
+            for prefix, event, value in ijson.parse(f, use_float=True):
+                if prefix == "" and event == "map_key":
+                    if value not in BOOK_COLUMNS:
+                        raise IngestError(f"{path}: unknown column {value!r}")
+                    column, seen = value, 0
+                elif prefix == column and event == "map_key":
+                    row_index = int(value)
+                elif prefix == f"{column}.{row_index}":
+                    if event not in ("string", "number", "boolean", "null"):
+                        raise IngestError(f"{path}: nested value in column {column!r}, row {row_index}")
+                    seen += 1
+                    if column in skip_columns or (column == skip_values[0] and seen <= skip_values[1]):
+                        continue
+                    yield column, row_index, value
+
+    def load_columns(self, path, restart=False):
+        if ijson is None:
+            raise IngestError(
+                "streaming column-oriented JSON needs the 'ijson' package (pip install ijson); "
+                "alternatively export the data as JSON Lines (.jsonl)"
+            )
+        source, fingerprint = os.path.abspath(path), _fingerprint(path)
+        position, rows_loaded, finished = self._resume_point(source, fingerprint, restart)
+        if finished:
+            return rows_loaded
+        self._attach_staging()
+        try:
+            rows_loaded = self._load_staged(path, source, fingerprint, restart, position, rows_loaded)
+        except BaseException:
+            # The sidecar stays, so the next run resumes from its checkpoint
+            self.conn.execute("DETACH DATABASE staging")
+            raise
+        self._drop_staging()
+        return rows_loaded
+
+    def _load_staged(self, path, source, fingerprint, restart, position, rows_loaded):
+        staged = self._resume_point(source, fingerprint, restart, schema="staging")[0]
+        if staged is None:
+            # New or changed file, or its staged rows are gone: start over
+            with self.conn:
+                self.conn.execute(f"DELETE FROM {STAGING_TABLE}")
+            position, rows_loaded = {"staged_columns": [], "column": None, "values": 0, "moved": None}, 0
+        elif position is None:
+            # Staging, or moving rows none of which had changed yet
+            position, rows_loaded = staged, 0
+
+        # Phase 1: stage the file one column at a time. Staging is an upsert,
+        # so values re-read after an interruption are simply written again.
+        if position["moved"] is None:
+            skip_values = (position["column"], position["values"])
+            batch, current, count = [], position["column"], position["values"]
+            for column, row_index, value in self._stream_columns(path, set(position["staged_columns"]), skip_values):
+                if column != current:
+                    if batch:
+                        self._stage_values(current, batch, source, fingerprint, position)
+                        batch = []
+                    if current is not None:
+                        position["staged_columns"].append(current)
+                    current, count = column, 0
+                batch.append((row_index, value))
+                count += 1
+                if len(batch) >= self.batch_size:
+                    position.update(column=current, values=count)
+                    self._stage_values(current, batch, source, fingerprint, position)
+                    self.progress(f"staging {current}", count)
+                    batch = []
+            if batch:
+                self._stage_values(current, batch, source, fingerprint, position)
+            if current is not None:
+                position["staged_columns"].append(current)
+            position.update(column=None, values=0, moved=-1)
+            with self.conn:
+                self._save_checkpoint(source, fingerprint, position, 0, schema="staging")
+
+        # Phase 2: move staged rows into books in row order
+        total = self.conn.execute(f"SELECT COUNT(*) FROM {STAGING_TABLE}").fetchone()[0]
+        select = f"""
+            SELECT row_index, {", ".join(BOOK_COLUMNS)} FROM {STAGING_TABLE}
+            WHERE row_index > ? ORDER BY row_index LIMIT ?
+        """
+        while True:
+            rows = self.conn.execute(select, (position["moved"], self.batch_size)).fetchall()
+            if not rows:
+                break
+            rows_loaded += len(rows)
+            position["moved"] = rows[-1][0]
+            self._write_batch([row[1:] for row in rows], source, fingerprint, position, rows_loaded)
+            self.progress("loaded", rows_loaded, total)
+        return self._finish(source, fingerprint, position, rows_loaded)
+
+    def load(self, path, fmt=None, restart=False):
+        fmt = fmt or detect_format(path)
+        if fmt == "jsonl":
+            return self.load_jsonl(path, restart)
+        if fmt == "columns":
+            return self.load_columns(path, restart)
+        raise ValueError(f"unknown input format {fmt!r}")
+
+
+def ingest(path, db_path="books_database.db", fmt=None, batch_size=DEFAULT_BATCH_SIZE, restart=False, progress=None):
+    loader = Loader(db_path, batch_size, progress)
+    try:
+        return loader.load(path, fmt, restart)
+    finally:
+        loader.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stream a Google Books JSON export into SQLite.")
+    parser.add_argument("source", help="JSON Lines or pandas column-oriented JSON file")
+    parser.add_argument("--db", default="books_database.db", help="target database (created if missing)")
+    parser.add_argument("--format", choices=["jsonl", "columns"], help="input layout (default: by file extension)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--restart", action="store_true", help="ignore any saved checkpoint for this file")
+    args = parser.parse_args(argv)
+    try:
+        ingest(args.source, args.db, args.format, args.batch_size, args.restart, Progress())
+    except IngestError as exc:
+        parser.exit(1, f"error: {exc}\n")
+    if similarity.available(args.db):
+        similarity.update(args.db, progress=Progress())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,526 @@
+"""
+Analysis text computed from the results already on the page.
+
+Each question has a markdown template and a function that picks the facts
+(counts, leaders, comparisons) out of its result, so the narrative always
+matches the current data and costs no extra query. Numbers go through small
+memoized formatters: the same few values are formatted again on every rerun.
+Sidebar filters can leave aggregates NULL: missing numbers read "n/a", and
+rows without the values a text is about are left out of it.
+
+The "Overall Insights and Recommendations" text is built the same way from
+one pass over the `book_summary` aggregates (see summaries.py), plus the
+cached top-author and keyword-count results.
+"""
+
+from collections import namedtuple
+from functools import lru_cache
+
+import pandas as pd
+
+
+# -- formatting ----------------------------------------------------------
+
+
+def _missing(value):
+    return value is None or pd.isna(value)
+
+
+@lru_cache(maxsize=4096)
+def number(value, digits=0):
+    return "n/a" if _missing(value) else f"{value:,.{digits}f}"
+
+
+# Dollar amounts; the $ is escaped so Streamlit does not start LaTeX math
+@lru_cache(maxsize=4096)
+def money(value):
+    return "n/a" if _missing(value) else f"\\${value:,.2f}"
+
+
+@lru_cache(maxsize=4096)
+def percent(part, whole, digits=1):
+    return f"{100 * part / whole:.{digits}f}%" if whole else "n/a"
+
+
+# "A", "A and B", "A, B and C"
+@lru_cache(maxsize=1024)
+def join_names(names, quote="*"):
+    names = [f"{quote}{name}{quote}" for name in names]
+    return names[0] if len(names) == 1 else ", ".join(names[:-1]) + " and " + names[-1]
+
+
+def _names(values, limit=3, quote="*"):
+    return join_names(tuple(str(v) for v in list(values)[:limit]), quote)
+
+
+# The rows with a value in each of `columns`, as numbers (a column of NULLs
+# arrives with dtype object)
+def _known(frame, *columns):
+    frame = frame.assign(**{column: pd.to_numeric(frame[column], errors="coerce") for column in columns})
+    return frame.dropna(subset=list(columns))
+
+
+# -- per-question facts --------------------------------------------------
+
+
+def _ebook_facts(data):
+    ebooks, physical = data["EBooks"], data["Physical Books"]
+    total = ebooks + physical
+    if ebooks == physical:
+        trend = "EBooks and physical books are evenly matched."
+    else:
+        lead, trail = ("EBooks", "physical books") if ebooks > physical else ("Physical books", "eBooks")
+        slightly = "slightly " if abs(ebooks - physical) < 0.1 * total else ""
+        trend = f"{lead} {slightly}outnumber {trail}, " + (
+            "indicating a growing trend in digital reading." if ebooks > physical
+            else "so print is still the larger part of the catalog.")
+    return {
+        "ebooks": number(ebooks), "ebook_share": percent(ebooks, total),
+        "physical": number(physical), "physical_share": percent(physical, total), "trend": trend,
+    }
+
+
+def _top_publisher_facts(result):
+    publisher, book_count = result
+    return {"publisher": publisher, "book_count": number(book_count)}
+
+
+def _top_rated_publisher_facts(result):
+    publisher, avg_rating = result
+    if _missing(avg_rating):
+        return None
+    return {"publisher": publisher, "rating": number(avg_rating, 2)}
+
+
+def _most_expensive_facts(frame):
+    frame = _known(frame, "Retail Price")
+    if frame.empty:
+        return None
+    top = frame.iloc[0]
+    return {"title": top["Book Title"], "price": money(top["Retail Price"])}
+
+
+def _long_recent_facts(frame):
+    per_year = frame.groupby("Year").size()
+    peak_year = per_year.idxmax()
+    decline = ""
+    if peak_year != per_year.index[-1] and per_year.iloc[-1] < per_year.max():
+        decline = (f" After {peak_year} the bar chart shows a decline, which may reflect fewer readers"
+                   " leading publishers to reduce the number of long books they publish.")
+    return {"count": number(len(frame)), "peak_year": peak_year, "peak_count": number(per_year.max()),
+            "decline": decline}
+
+
+def _discount_facts(frame, min_discount):
+    return {"count": number(len(frame)), "min_discount": number(min_discount),
+            "max_discount": number(frame["Discount"].max(), 1)}
+
+
+def _page_count_facts(frame):
+    pages = dict(zip(frame["Book Type"], frame["Average Page Count"]))
+    physical, ebook = pages.get("Physical Book"), pages.get("EBook")
+    if physical is None or ebook is None or pd.isna(physical) or pd.isna(ebook):
+        comparison = "Only one format has page counts, so the formats cannot be compared."
+    elif physical > ebook:
+        comparison = ("Physical books generally have higher page counts than eBooks, possibly reflecting"
+                      " their preference for detailed, comprehensive content. This could also suggest that"
+                      " eBooks are designed to be concise and easier to consume digitally.")
+    else:
+        comparison = ("EBooks are at least as long as physical books on average, so the digital catalog is"
+                      " not limited to short-form content.")
+    return {
+        "physical": "n/a" if physical is None or pd.isna(physical) else number(physical),
+        "ebook": "n/a" if ebook is None or pd.isna(ebook) else number(ebook),
+        "comparison": comparison,
+    }
+
+
+def _top_author_facts(frame):
+    return {"authors": "\n".join(
+        f"        \\n {i}.\t{row.Authors} ({number(row[1])} books)."
+        for i, row in enumerate(frame.itertuples(index=False), start=1)
+    )}
+
+
+def _prolific_publisher_facts(frame):
+    leaders = frame.sort_values("Book Count", ascending=False, kind="stable")["Publisher"]
+    return {"count": number(len(frame)), "leaders": _names(leaders)}
+
+
+def _category_page_facts(frame):
+    top = _known(frame, "Average Page Count").nlargest(2, "Average Page Count")
+    if top.empty:
+        return None
+    categories = [(row.Category, number(row[1])) for row in top.itertuples(index=False)]
+    return {
+        "highest": " and ".join(f'"{name}" ({pages} pages)' for name, pages in categories),
+        "names": " and ".join(f'"{name}"' for name, _ in categories),
+    }
+
+
+def _multi_author_facts(frame):
+    return {"count": number(len(frame)), "max_authors": number(frame["Author Count"].max())}
+
+
+def _above_average_facts(frame, average):
+    if _missing(average):
+        return None
+    frame = _known(frame, "Rating Count")
+    above = frame[frame["Rating Count"] > average]
+    examples = above.nlargest(4, "Rating Count")
+    return {
+        "count": number(len(above)), "average": number(average, 2),
+        "examples": "\n".join(f'    \\n •\t"{row[0]}": {number(row[1])}' for row in examples.itertuples(index=False)),
+    }
+
+
+def _same_year_facts(frame):
+    by_author = frame.groupby("Authors")["Book Count"].sum().sort_values(ascending=False, kind="stable")
+    counts = frame["Book Count"]
+    most = counts.max()
+    return {
+        "authors": ", ".join(str(name) for name in by_author.index[:3]), "usual": number(counts.mode().iloc[0]),
+        "most": f", and a few have published {number(most)}" if most > counts.mode().iloc[0] else "",
+    }
+
+
+def _keyword_facts(counts):
+    python, data_science, both, others = counts
+    lead = "Python" if python >= data_science else "Data Science"
+    return {
+        "total": number(python + data_science + both + others), "python": number(python),
+        "data_science": number(data_science), "both": number(both), "lead": lead,
+        "second": "Data Science" if lead == "Python" else "Python",
+    }
+
+
+def _price_year_facts(frame):
+    top = _known(frame, "Year", "Average Price").head(3)
+    if top.empty:
+        return None
+    years = [(int(row[0]), money(row[1])) for row in top.itertuples(index=False)]
+    others = " and ".join(f"{year} ({price})" for year, price in years[1:])
+    return {"year": years[0][0], "price": years[0][1],
+            "others": f" Other high-price years include {others}." if others else ""}
+
+
+def _streak_facts(frame, min_years):
+    top = frame.iloc[0]
+    authors = "author" if len(frame) == 1 else "authors"
+    return {"count": f"{number(len(frame))} {authors}", "min_years": min_years, "author": top["Author"],
+            "years": number(top["Consecutive Year Count"]), "start": top["From"], "end": top["To"]}
+
+
+def _multi_publisher_facts(frame):
+    return {"count": number(len(frame))}
+
+
+def _ebook_price_facts(frame):
+    ebook, physical = frame.iloc[0]
+    return {
+        "physical": ("No physical books are priced." if _missing(physical)
+                     else f"The average retail price for physical books is {money(physical)}."),
+        "ebook": ("No eBooks are priced." if _missing(ebook)
+                  else f"The average retail price for eBooks is {money(ebook)}."),
+        "reading": ("eBooks dominate the market, and the pricing aligns with the affordability and"
+                    " accessibility of digital formats." if _missing(physical) else
+                    "Both formats are priced, so the gap between them shows how much readers pay for print."),
+    }
+
+
+def _rating_outlier_facts(frame, center):
+    if center is None:
+        below = None
+        direction = "their group's typical rating"
+    else:
+        below = (frame["Average Rating"] < center).mean() >= 0.5
+        direction = "the average"
+    mostly = "" if below is None else (
+        " These deviations are primarily negative, with low ratings across several titles." if below
+        else " These deviations are primarily positive, with unusually high ratings.")
+    titles = frame["Title"]
+    if center is not None:
+        # The furthest from the reference first
+        titles = titles.iloc[(frame["Average Rating"] - center).abs().argsort(kind="stable")[::-1]]
+    return {"titles": ", ".join(f'"{title}"' for title in titles[:3]), "direction": direction, "mostly": mostly,
+            "reading": ("The low ratings could indicate outdated content, lack of relevance, or poor execution."
+                        if below is not False else
+                        "The unusually high ratings single out titles worth featuring, especially when"
+                        " they are rated often.")}
+
+
+def _top_rated_large_publisher_facts(result):
+    publisher, avg_rating, book_count = result
+    return {"publisher": publisher, "rating": number(avg_rating, 2), "book_count": number(book_count)}
+
+
+# -- templates -----------------------------------------------------------
+
+# `facts(result, ...)` returns the template fields, or None when the result
+# has none of the values the text is about; `empty` is shown instead then,
+# and when there is no result, with the page settings as its positional fields
+Insight = namedtuple("Insight", ["facts", "template", "empty"], defaults=[None])
+
+INSIGHTS = {
+    "q1": Insight(_ebook_facts, """
+    ### Analysis
+    - **Insight:** There are {ebooks} eBooks ({ebook_share}) and {physical} physical books ({physical_share}). A pie chart is used for visualization.
+    - **Interpretation:** {trend}
+    """),
+    "q2": Insight(_top_publisher_facts, """
+    ### Analysis
+    - **Insight:** The publisher '{publisher}' has published the highest number of books.
+      \\n Total books published: {book_count}
+      - **Business Interpretation:**
+      \\n {publisher} is a key player in this catalog, especially in technical and professional books.
+    """),
+    "q3": Insight(_top_rated_publisher_facts, """
+    ### Analysis
+    - **Insight:** The publisher with the highest average rating is: {publisher}
+      \\n Average rating: {rating}
+    - **Interpretation:**
+    \\n This indicates that books from {publisher} are highly rated, suggesting quality content and positive user reception.
+    """, "No books in the selection are rated."),
+    "q4": Insight(_most_expensive_facts, """
+    ### Analysis
+    - **Insight:** The top book is "{title}" priced at {price}.
+    - **Interpretation:** The highest-priced books are academic or professional, reflecting their niche audience and high-value content.
+    """, "No books in the selection are priced."),
+    "q5": Insight(_long_recent_facts, """
+    ### Analysis
+    - **Insight:** {count} books meet the criteria; the most ({peak_count}) were published in {peak_year}.
+    - **Interpretation:** Indicates that publishers are still investing in substantial content post-2010, possibly reflecting increased demand for comprehensive material.{decline}
+    """, "No books published after 2010 have at least 500 pages."),
+    "q6": Insight(_discount_facts, """
+    ### Analysis
+    - **Insight:** {count} books are offered at a discount above {min_discount}% (up to {max_discount}%).
+    - **Interpretation:** Discounts are likely used as a strategy to boost sales or clear inventory.
+    """, "No books are discounted by more than {0}%."),
+    "q7": Insight(_page_count_facts, """
+    ### Analysis
+    - **Insight:**
+    \\n Physical Books: {physical} pages on average.
+    \\n eBooks: {ebook} pages on average.
+    - **Interpretation:**
+    \\n {comparison}
+    """),
+    "q8": Insight(_top_author_facts, """
+    ### Analysis
+    - **Insight:**
+    \\n 	Top authors:
+{authors}
+
+    - **Interpretation:**
+    \\n These authors are prolific contributors, likely in technical or academic domains. Their consistent presence could indicate high demand for their expertise.
+    """),
+    "q9": Insight(_prolific_publisher_facts, """
+    ### Analysis
+    - **Insight:**
+    \\n {count} publishers have more than 10 books.
+    \\n {leaders} are notable leaders.
+
+    - **Interpretation:**
+     \\n These publishers are dominant forces in the industry, producing high volumes of content that cater to a wide range of readers.
+    """),
+    "q10": Insight(_category_page_facts, """
+    ### Analysis
+    - **Insight:** Categories like {highest} have the highest average page counts.
+    - **Interpretation:** Certain categories, such as {names}, have significantly higher page counts, likely due to the technical or reference nature of these books.
+    """, "No categories in the selection have page counts."),
+    "q11": Insight(_multi_author_facts, """
+    ### Analysis
+    - **Insight:** {count} books have more than 3 authors (up to {max_authors} on one book).
+    - **Interpretation:** These books are likely collaborative efforts in fields such as research, academia, or specialized industries where multiple contributors bring diverse expertise.
+    """),
+    "q12": Insight(_above_average_facts, """
+    ### Analysis
+    - **Insight:** {count} Books with a rating count higher than the average ({average}) indicate higher popularity or audience engagement.
+    \\n Examples include:
+{examples}
+
+    - **Interpretation:** Books with ratings higher than the average are more likely to be considered useful, engaging, or well-written. These books are strong candidates for marketing or promotional campaigns.
+    """, "No books in the selection have a ratings count."),
+    "q13": Insight(_same_year_facts, """
+    ### Analysis
+    - **Insight:**  Authors like {authors}, and many others published multiple books in a given year.	Most authors have published {usual} books in the same year{most}.
+    - **Interpretation:** 	Publishing multiple books in the same year indicates that these authors are either prolific writers or their works are split into multiple volumes.
+    - **Recommendation:** 	For marketing, highlight such authors to boost sales and readership by promoting their complete collection.
+    """),
+    "q14": Insight(_keyword_facts, """
+    ### Analysis
+    - **Insight:**
+    	\\n Total books: {total}.
+        \\n Python keyword: {python} books.
+        \\n Data Science keyword: {data_science} books.
+        \\n Both keywords: {both} books.
+
+    - **Interpretation:** {lead} is the more prominent keyword; {second} also has substantial representation, aligning with its growing industry relevance.
+
+    """),
+    "q15": Insight(_price_year_facts, """
+    ### Analysis
+    - **Insight:** The year {year} has the highest average book price at {price}.{others}
+
+    - **Interpretation:** 	Books published in the top-priced years carry more academic and niche content, which commands higher prices.
+
+    """, "No books in the selection are priced."),
+    "q16": Insight(_streak_facts, """
+    ### Analysis
+    - **Insight:** {count} published in at least {min_years} consecutive years; the longest streak is {author}'s {years} years ({start}–{end}).
+    - **Interpretation:** Consistent yearly output keeps these authors in front of their audience.
+    """),
+    "q17": Insight(_multi_publisher_facts, """
+    ### Analysis
+    - **Insight:** 	{count} author-years span more than one publisher.
+
+    - **Interpretation:** 	Most pairs are imprints or name variants of the same publishing group (e.g. a publisher and its regional or "Inc." imprint), rather than authors switching houses.
+    """, """
+    ### Analysis
+    - **Insight:** 	No authors published books with more than one publisher in the same year.
+
+    - **Interpretation:** 	Authors might be following exclusivity agreements with publishers or focusing on building their reputation with a single publishing house.
+    """),
+    "q18": Insight(_ebook_price_facts, """
+### Analysis
+- **Insight:**
+  - {physical}
+  - {ebook}
+
+- **Interpretation:**
+  - {reading}
+
+- **Recommendation:**
+  - Evaluate strategies for introducing affordable physical books for audiences who prefer traditional reading formats.
+"""),
+    "q19": Insight(_rating_outlier_facts, """
+### Analysis
+- **Insight:**
+  - Books like {titles}, and others deviate significantly from {direction}.{mostly}
+
+- **Interpretation:**
+  - {reading}
+
+- **Recommendation:**
+  - Analyze customer feedback for poorly rated books and update or replace them with improved editions.
+"""),
+    "q20": Insight(_top_rated_large_publisher_facts, """
+### Analysis
+- **Insight:**
+  - {publisher} has the highest average rating of {rating}.
+  - Number of books: {book_count}.
+
+- **Interpretation:**
+  - {publisher} maintains a consistent reputation for quality among the large publishers.
+"""),
+}
+
+
+def _is_empty(result):
+    if result is None:
+        return True
+    if isinstance(result, pd.DataFrame):
+        return result.empty
+    return False
+
+
+# The Analysis markdown of a question. `result` is what the page computed
+# (a DataFrame, a row or a dict); `extra` are page settings the text needs.
+def analysis(question_id, result, *extra):
+    insight = INSIGHTS[question_id]
+    facts = None if _is_empty(result) else insight.facts(result, *extra)
+    if facts is None:
+        return (insight.empty or "").format(*extra)
+    return insight.template.format(**facts)
+
+
+# -- overall insights ----------------------------------------------------
+
+
+def _groups(summary, dimension):
+    groups = summary[summary["dimension"] == dimension]
+    return groups.assign(
+        avg_rating=groups["rating_sum"] / groups["rating_n"].where(groups["rating_n"] > 0),
+        avg_pages=groups["pages_sum"] / groups["pages_n"].where(groups["pages_n"] > 0),
+        avg_price=groups["price_sum"] / groups["price_n"].where(groups["price_n"] > 0),
+    )
+
+
+def _format_line(formats):
+    by_type = {int(row.group_key): row for row in formats.itertuples(index=False)}
+    ebook, physical = by_type.get(1), by_type.get(0)
+    if ebook is None or physical is None:
+        return "Only one format is present in the catalog."
+    parts = [
+        f"{number(physical.book_count)} physical books vs {number(ebook.book_count)} eBooks"
+        f" ({'eBooks lead' if ebook.book_count > physical.book_count else 'physical books lead'})"
+    ]
+    if not pd.isna(physical.avg_pages) and not pd.isna(ebook.avg_pages):
+        parts.append(f"{number(physical.avg_pages)} vs {number(ebook.avg_pages)} pages on average")
+    if pd.isna(physical.avg_price):
+        parts.append("only eBooks are priced")
+    elif not pd.isna(ebook.avg_price):
+        parts.append(f"{money(physical.avg_price)} vs {money(ebook.avg_price)} on average")
+    return "; ".join(parts) + "."
+
+
+def overview_facts(summary, top_authors, keyword_counts, min_rated_books=10):
+    formats = _groups(summary, "isEbook")
+    publishers = _groups(summary, "publisher")
+    categories = _groups(summary, "category")
+    years = _groups(summary, "year")
+    total = int(_groups(summary, "all")["book_count"].sum())
+
+    largest = publishers.nlargest(2, "book_count")["name"]
+    rated = publishers[publishers["book_count"] > min_rated_books].dropna(subset=["avg_rating"])
+    best_rated = rated.nlargest(1, "avg_rating")
+    popular_categories = categories.nlargest(3, "book_count")["name"]
+    ebooks = int(formats.loc[formats["group_key"] == 1, "book_count"].sum())
+    recent = years.sort_values("group_key").tail(5)
+    python, data_science, both, _ = keyword_counts
+
+    return {
+        "total": number(total),
+        "formats": _format_line(formats),
+        "leading_format": "eBooks" if ebooks * 2 > total else "physical books",
+        "publishers": _names(largest),
+        "authors": _names(top_authors["Authors"]),
+        "best_rated": (f"*{best_rated['name'].iloc[0]}* (average rating {number(best_rated['avg_rating'].iloc[0], 2)})"
+                       if len(best_rated) else "no publisher with enough rated books"),
+        "categories": _names(popular_categories),
+        "recent_years": ", ".join(f"{int(row.group_key)}: {number(row.book_count)}"
+                                  for row in recent.itertuples(index=False)),
+        "keywords": (f"Python appears in {number(python + both)} titles and Data Science in"
+                     f" {number(data_science + both)} ({percent(python + data_science + both, total)} of the catalog)"),
+    }
+
+
+OVERVIEW_TEMPLATE = """
+### Overall Insights and Recommendations for the Dataset
+#### Key Insights:
+1. **Formats**: {formats}
+2. **Popular Authors and Publishers**: Authors like {authors} and publishers like {publishers} dominate the catalog of {total} books.
+3. **Categories**: {categories} have the most books.
+4. **Emerging Trends**: {keywords}. Books per recent year: {recent_years}.
+
+---
+
+#### Recommendations:
+1. **Focus Marketing on Emerging Topics**:
+    - Promote Python-related and high-demand categories such as {categories}.
+2. **Enhance Digital and Print Offerings**:
+    - {leading_format} make up most of the catalog; expand that collection while filling gaps in the other format.
+3. **Collaborative Publications**:
+    - Invest in books with multiple authors for complex or academic subjects.
+4. **Price Adjustments**:
+    - Compare eBook and physical prices and optimize them to compete across formats.
+5. **Leverage High-Rated Publishers**:
+    - Highlight top publishers like {best_rated} in marketing campaigns.
+6. **Analyze Low-Rated Books**:
+    - Replace or improve poorly rated books to enhance customer satisfaction.
+7. **Promote Prolific Authors**:
+    - Authors with multiple books in the same year or across different years should be promoted for audience retention.
+"""
+
+
+def overview(summary, top_authors, keyword_counts):
+    return OVERVIEW_TEMPLATE.format(**overview_facts(summary, top_authors, keyword_counts))
@@ -0,0 +1,356 @@
+"""
+Hot-path instrumentation for the dashboard questions.
+
+Each question is timed stage by stage:
+- connect: take a connection from the pool
+- execute, fetch: run the statement and read its rows
+- frame: build the result DataFrame
+- plot: prepare and draw the chart
+- display: hand the chart to Streamlit
+- page: the whole page
+
+The timings go into per-process histograms, alongside the rows returned,
+query-cache hits/misses and the `EXPLAIN QUERY PLAN` of each executed
+statement. Plans that read every row of `books` (`SCAN books`) are flagged.
+Everything is exported as Prometheus text: to a file for node_exporter's
+textfile collector, or over a small local HTTP endpoint.
+
+A `Trace` collects the stages of one page run (for the on-screen debug
+panel). `SamplingProfiler` samples a thread's stack through
+`sys._current_frames()` and reports the hottest functions and collapsed
+stacks (flame graph input). `timed()` is the median of repeated runs, for
+the backend comparisons (columnar.py, catalog.py).
+"""
+
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+STAGES = ("connect", "execute", "fetch", "frame", "plot", "display", "page")
+
+# Histogram bucket upper bounds, in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Tables whose full scans are flagged in query plans
+FLAGGED_TABLES = ("books",)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# -- query plans ---------------------------------------------------------
+
+
+# `EXPLAIN QUERY PLAN` rows as (id, parent, detail)
+def explain(conn, sql, params=()):
+    rows = conn.execute("EXPLAIN QUERY PLAN " + sql.strip().rstrip(";"), tuple(params)).fetchall()
+    return [(row[0], row[1], row[3]) for row in rows]
+
+
+# Tables a plan reads in full: "SCAN books" (or "SCAN TABLE books" before SQLite 3.36)
+def full_scans(plan, tables=FLAGGED_TABLES):
+    scans = []
+    for _, _, detail in plan:
+        match = re.match(r"SCAN (?:TABLE )?(\w+)", detail)
+        if match and match.group(1) in tables and match.group(1) not in scans:
+            scans.append(match.group(1))
+    return scans
+
+
+# The plan as an indented tree, one step per line
+def format_plan(plan):
+    depth = {0: -1}
+    lines = []
+    for node_id, parent, detail in plan:
+        depth[node_id] = depth.get(parent, -1) + 1
+        lines.append("  " * depth[node_id] + detail)
+    return "\n".join(lines)
+
+
+# -- benchmarks ----------------------------------------------------------
+
+
+# The result of `function()` and the median of `repeat` runs, in seconds
+def timed(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - started)
+    return result, sorted(timings)[len(timings) // 2]
+
+
+# -- traces --------------------------------------------------------------
+
+
+_local = threading.local()
+
+
+class Trace:
+    # The stages recorded on this thread while the trace is active (one page run)
+    def __init__(self):
+        self.stages = []
+        self.rows = {}
+        self.cache = Counter()
+
+    def __enter__(self):
+        self._previous = getattr(_local, "trace", None)
+        _local.trace = self
+        return self
+
+    def __exit__(self, *exc_info):
+        _local.trace = self._previous
+
+    def total(self, stage):
+        return sum(seconds for _, name, seconds in self.stages if name == stage)
+
+
+def current_trace():
+    return getattr(_local, "trace", None)
+
+
+# -- metrics -------------------------------------------------------------
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+class Metrics:
+    # Process-wide, thread-safe collector shared by every session
+    def __init__(self, buckets=DEFAULT_BUCKETS, namespace="bookscape"):
+        self.buckets = tuple(buckets)
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._rows = Counter()
+        self._cache = Counter()
+        self.plans = {}
+
+    @contextmanager
+    def stage(self, question_id, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(question_id, stage, time.perf_counter() - started)
+
+    def observe(self, question_id, stage, seconds):
+        with self._lock:
+            key = (question_id, stage)
+            if key not in self._stages:
+                self._stages[key] = Histogram(self.buckets)
+            self._stages[key].observe(seconds)
+        trace = current_trace()
+        if trace is not None:
+            trace.stages.append((question_id, stage, seconds))
+
+    def count_rows(self, question_id, rows):
+        with self._lock:
+            self._rows[question_id] += rows
+        trace = current_trace()
+        if trace is not None:
+            trace.rows[question_id] = trace.rows.get(question_id, 0) + rows
+
+    def count_cache(self, question_id, hit):
+        result = "hit" if hit else "miss"
+        with self._lock:
+            self._cache[(question_id, result)] += 1
+        trace = current_trace()
+        if trace is not None:
+            trace.cache[result] += 1
+
+    # Latest plan of a question's statement, with the flagged full scans.
+    # Cheap: EXPLAIN QUERY PLAN only prepares the statement.
+    def capture_plan(self, question_id, conn, sql, params=()):
+        plan = explain(conn, sql, params)
+        with self._lock:
+            self.plans[question_id] = (plan, full_scans(plan))
+        return plan
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "stages": {
+                    key: {"count": h.count, "sum": h.sum, "mean": h.sum / h.count if h.count else 0.0}
+                    for key, h in self._stages.items()
+                },
+                "rows": dict(self._rows),
+                "cache": dict(self._cache),
+                "full_scans": {question_id: scans for question_id, (_, scans) in self.plans.items()},
+            }
+
+    def prometheus_text(self):
+        ns = self.namespace
+        lines = [
+            f"# HELP {ns}_stage_seconds Time spent in each stage of a dashboard question.",
+            f"# TYPE {ns}_stage_seconds histogram",
+        ]
+        with self._lock:
+            for (question_id, stage), h in sorted(self._stages.items()):
+                cumulative = 0
+                for bound, count in zip(h.buckets, h.counts):
+                    cumulative += count
+                    lines.append(f"{ns}_stage_seconds_bucket"
+                                 f"{_labels(question=question_id, stage=stage, le=f'{bound:g}')} {cumulative}")
+                lines.append(f"{ns}_stage_seconds_bucket{_labels(question=question_id, stage=stage, le='+Inf')} {h.count}")
+                lines.append(f"{ns}_stage_seconds_sum{_labels(question=question_id, stage=stage)} {h.sum:.9g}")
+                lines.append(f"{ns}_stage_seconds_count{_labels(question=question_id, stage=stage)} {h.count}")
+
+            lines += [
+                f"# HELP {ns}_rows_returned_total Result rows returned to the dashboard.",
+                f"# TYPE {ns}_rows_returned_total counter",
+            ]
+            lines += [f"{ns}_rows_returned_total{_labels(question=q)} {n}" for q, n in sorted(self._rows.items())]
+
+            lines += [
+                f"# HELP {ns}_query_cache_total Query cache lookups by result.",
+                f"# TYPE {ns}_query_cache_total counter",
+            ]
+            lines += [f"{ns}_query_cache_total{_labels(question=q, result=r)} {n}"
+                      for (q, r), n in sorted(self._cache.items())]
+
+            lines += [
+                f"# HELP {ns}_full_table_scan Whether the latest plan of a question reads the whole table.",
+                f"# TYPE {ns}_full_table_scan gauge",
+            ]
+            for question_id, (_, scans) in sorted(self.plans.items()):
+                for table in FLAGGED_TABLES:
+                    lines.append(f"{ns}_full_table_scan{_labels(question=question_id, table=table)} "
+                                 f"{int(table in scans)}")
+        return "\n".join(lines) + "\n"
+
+    # Atomically (re)write the Prometheus text file, so a scraper never reads
+    # half a file
+    def write_textfile(self, path):
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".metrics-", suffix=".prom")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(self.prometheus_text())
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+# Serve `GET /metrics` on a daemon thread; returns the server (call shutdown() to stop)
+def serve_metrics(metrics, port, host="127.0.0.1"):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.prometheus_text().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+# -- sampling profiler ---------------------------------------------------
+
+
+def _frame_name(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    # Samples the stack of `thread_id` (default: the thread that starts it)
+    # every `interval` seconds from a background thread. Sampling costs the
+    # profiled thread nothing but the GIL hand-offs.
+    def __init__(self, thread_id=None, interval=0.005, max_depth=64):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = Counter()
+        self.samples = 0
+        self.elapsed = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.thread_id is None:
+            self.thread_id = threading.get_ident()
+        self._stop.clear()
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+            self.elapsed += time.perf_counter() - self._started
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                stack.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            self.stacks[tuple(reversed(stack))] += 1
+            self.samples += 1
+
+    # Functions by samples spent in them ("self") and below them ("total")
+    def top(self, n=20):
+        own, total = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for name in set(stack):
+                total[name] += count
+        return [
+            (name, own[name], total[name], total[name] / self.samples)
+            for name, _ in total.most_common(n)
+        ] if self.samples else []
+
+    # Collapsed stacks, one "outer;...;inner count" line per stack (the input
+    # format of flamegraph.pl and speedscope)
+    def collapsed(self):
+        return "\n".join(f"{';'.join(stack)} {count}" for stack, count in self.stacks.most_common()) + "\n"
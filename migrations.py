@@ -0,0 +1,397 @@
+"""
+Schema migrations for books_database.db.
+
+The flat `books` table is kept as-is (new columns are only added to it) and is
+complemented by normalized `publishers`, `categories`, `authors` and
+`book_authors` tables plus the indexes the dashboard questions need. Applied
+migrations are tracked in `PRAGMA user_version`, so `migrate()` is idempotent
+and cheap to call on every server start.
+
+Usage: python migrations.py [path/to/books_database.db]
+"""
+
+import hashlib
+import sqlite3
+import sys
+
+import pricing
+import search
+import summaries
+from cleaning import decode_publisher
+
+
+# The flat table as originally exported; every later change is a migration
+BOOKS_DDL = """
+    CREATE TABLE IF NOT EXISTS books (
+        book_id VARCHAR PRIMARY KEY,
+        search_key VARCHAR,
+        book_title VARCHAR,
+        book_subtitle TEXT,
+        book_authors TEXT,
+        book_publisher TEXT,
+        book_description TEXT,
+        industryIdentifiers TEXT,
+        text_readingModes BOOLEAN,
+        image_readingModes BOOLEAN,
+        pageCount INT,
+        categories TEXT,
+        language VARCHAR,
+        imageLinks TEXT,
+        ratingsCount INT,
+        averageRating DECIMAL,
+        country VARCHAR,
+        saleability VARCHAR,
+        isEbook BOOLEAN,
+        amount_listPrice DECIMAL,
+        currencyCode_listPrice VARCHAR,
+        amount_retailPrice DECIMAL,
+        currencyCode_retailPrice VARCHAR,
+        buyLink TEXT,
+        year TEXT
+    )
+"""
+
+# Source columns of `books`, in table order
+BOOK_COLUMNS = (
+    "book_id", "search_key", "book_title", "book_subtitle", "book_authors", "book_publisher",
+    "book_description", "industryIdentifiers", "text_readingModes", "image_readingModes",
+    "pageCount", "categories", "language", "imageLinks", "ratingsCount", "averageRating",
+    "country", "saleability", "isEbook", "amount_listPrice", "currencyCode_listPrice",
+    "amount_retailPrice", "currencyCode_retailPrice", "buyLink", "year",
+)
+
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def _add_column(conn, table, column, decl):
+    if column not in _columns(conn, table):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+# Integer publication year from the ISO-ish `year` strings ('2015', '2015-07', '2015-07-30')
+PUB_YEAR_EXPR = "CASE WHEN {col} GLOB '[0-9][0-9][0-9][0-9]*' THEN CAST(substr({col}, 1, 4) AS INTEGER) END"
+
+
+# Run a multi-statement script inside the current transaction (unlike
+# `executescript`, which commits first)
+def run_script(conn, script):
+    statement = ""
+    for piece in script.split(";"):
+        statement += piece + ";"
+        if sqlite3.complete_statement(statement):
+            if statement.strip(" \n;"):
+                conn.execute(statement)
+            statement = ""
+
+
+def _hash_value(value):
+    # Booleans and integral floats are stored as integers (NUMERIC affinity)
+    if isinstance(value, bool) or (isinstance(value, float) and value.is_integer()):
+        return int(value)
+    return value
+
+
+# Digest of a row's source columns (in BOOK_COLUMNS order). Re-delivered
+# records hash the same as their stored copy, so a delta ingest only writes
+# the rows that actually changed.
+def content_hash(*values):
+    return hashlib.blake2b(repr(tuple(map(_hash_value, values))).encode(), digest_size=16).hexdigest()
+
+
+def split_authors(book_authors):
+    if not book_authors:
+        return []
+    names = []
+    for name in book_authors.split(","):
+        name = name.strip()
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+# Rebuild the dimension tables and the derived columns on `books` for the
+# given book ids, or for the whole table when `book_ids` is None. Rows whose
+# derived values are unchanged are not rewritten (and fire no triggers).
+def refresh_dimensions(conn, book_ids=None):
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS refresh_authors (author_id INTEGER PRIMARY KEY)")
+    conn.execute("DELETE FROM temp.refresh_authors")
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS refresh_publishers (publisher_id INTEGER PRIMARY KEY)")
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS refresh_categories (category_id INTEGER PRIMARY KEY)")
+    conn.execute("DELETE FROM temp.refresh_publishers")
+    conn.execute("DELETE FROM temp.refresh_categories")
+    if book_ids is None:
+        scope = " WHERE 1"
+        conn.execute("DELETE FROM book_authors")
+    else:
+        book_ids = list(book_ids)
+        if not book_ids:
+            return
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS refresh_ids (book_id TEXT PRIMARY KEY)")
+        conn.execute("DELETE FROM temp.refresh_ids")
+        conn.executemany("INSERT OR IGNORE INTO temp.refresh_ids VALUES (?)", ((b,) for b in book_ids))
+        scope = " WHERE book_id IN (SELECT book_id FROM temp.refresh_ids)"
+        # Authors losing one of these books need their counts refreshed too
+        conn.execute(f"INSERT OR IGNORE INTO temp.refresh_authors SELECT author_id FROM book_authors{scope}")
+        # Publishers and categories these books referred to may be left unused
+        conn.execute(f"""
+            INSERT OR IGNORE INTO temp.refresh_publishers
+            SELECT publisher_id FROM books{scope} AND publisher_id IS NOT NULL
+        """)
+        conn.execute(f"""
+            INSERT OR IGNORE INTO temp.refresh_categories
+            SELECT category_id FROM books{scope} AND category_id IS NOT NULL
+        """)
+        conn.execute(f"DELETE FROM book_authors{scope}")
+
+    # Publishers: raw values are decoded once into canonical names (see
+    # cleaning.py), so spelling variants of the same exploded string share an id
+    conn.create_function("decode_publisher", 1, decode_publisher, deterministic=True)
+    conn.execute(f"""
+        INSERT OR IGNORE INTO publishers (name)
+        SELECT name FROM (
+            SELECT DISTINCT decode_publisher(book_publisher) AS name
+            FROM books{scope} AND book_publisher IS NOT NULL
+        )
+        WHERE name IS NOT NULL
+    """)
+
+    # Categories: one row per distinct value, ids stay stable
+    conn.execute(f"""
+        INSERT OR IGNORE INTO categories (name)
+        SELECT DISTINCT TRIM(categories) FROM books{scope}
+        AND categories IS NOT NULL AND TRIM(categories) != ''
+    """)
+
+    # Both ids in one UPDATE, so a changed row is rewritten (and fires the
+    # summary triggers) once
+    publisher_id = "(SELECT publisher_id FROM publishers WHERE name = decode_publisher(books.book_publisher))"
+    category_id = "(SELECT category_id FROM categories WHERE name = TRIM(books.categories))"
+    conn.execute(f"""
+        UPDATE books SET publisher_id = {publisher_id}, category_id = {category_id}{scope}
+        AND (publisher_id IS NOT {publisher_id} OR category_id IS NOT {category_id})
+    """)
+
+    # Authors: explode the comma-joined `book_authors` into the link table
+    # (the author -> books inverted list) and keep the per-row/per-author counts
+    rows = conn.execute(f"SELECT book_id, book_authors FROM books{scope}")
+    links = [(book_id, name, position)
+             for book_id, book_authors in rows
+             for position, name in enumerate(split_authors(book_authors))]
+    conn.executemany("INSERT OR IGNORE INTO authors (name) VALUES (?)", ((name,) for _, name, _ in links))
+    conn.executemany("""
+        INSERT OR IGNORE INTO book_authors (book_id, author_id, position)
+        SELECT ?, author_id, ? FROM authors WHERE name = ?
+    """, ((book_id, position, name) for book_id, name, position in links))
+    author_count = "(SELECT COUNT(*) FROM book_authors WHERE book_id = books.book_id)"
+    conn.execute(f"UPDATE books SET author_count = {author_count}{scope} AND author_count IS NOT {author_count}")
+    if book_ids is None:
+        author_scope = ""
+    else:
+        conn.execute(f"INSERT OR IGNORE INTO temp.refresh_authors SELECT author_id FROM book_authors{scope}")
+        author_scope = " WHERE author_id IN (SELECT author_id FROM temp.refresh_authors)"
+    conn.execute(f"""
+        UPDATE authors SET book_count = (
+            SELECT COUNT(*) FROM book_authors WHERE author_id = authors.author_id
+        ){author_scope}
+    """)
+
+    # Authors, publishers and categories left without books
+    conn.execute(f"DELETE FROM authors{author_scope or ' WHERE 1'} AND book_count = 0")
+    prune_dimensions(conn, scoped=book_ids is not None)
+
+
+# Drop publishers and categories no book refers to any more. A full prune
+# scans `books`; a scoped one only checks the ids collected by
+# refresh_dimensions, through the publisher/category indexes.
+def prune_dimensions(conn, scoped=False):
+    if not scoped:
+        conn.execute("DELETE FROM publishers WHERE publisher_id NOT IN "
+                     "(SELECT publisher_id FROM books WHERE publisher_id IS NOT NULL)")
+        conn.execute("DELETE FROM categories WHERE category_id NOT IN "
+                     "(SELECT category_id FROM books WHERE category_id IS NOT NULL)")
+        return
+    conn.execute("""
+        DELETE FROM publishers
+        WHERE publisher_id IN (SELECT publisher_id FROM temp.refresh_publishers)
+        AND NOT EXISTS (SELECT 1 FROM books WHERE books.publisher_id = publishers.publisher_id)
+    """)
+    conn.execute("""
+        DELETE FROM categories
+        WHERE category_id IN (SELECT category_id FROM temp.refresh_categories)
+        AND NOT EXISTS (SELECT 1 FROM books WHERE books.category_id = categories.category_id)
+    """)
+
+
+# 1. Normalized dimension tables, integer publication year and covering indexes
+def _normalize_books(conn):
+    _add_column(conn, "books", "pub_year", "INTEGER")
+    _add_column(conn, "books", "publisher_id", "INTEGER REFERENCES publishers(publisher_id)")
+    _add_column(conn, "books", "category_id", "INTEGER REFERENCES categories(category_id)")
+
+    run_script(conn, """
+        CREATE TABLE IF NOT EXISTS publishers (
+            publisher_id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        );
+        CREATE TABLE IF NOT EXISTS categories (
+            category_id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        );
+        CREATE TABLE IF NOT EXISTS authors (
+            author_id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        );
+        CREATE TABLE IF NOT EXISTS book_authors (
+            book_id VARCHAR NOT NULL REFERENCES books(book_id),
+            author_id INTEGER NOT NULL REFERENCES authors(author_id),
+            position INTEGER NOT NULL,
+            PRIMARY KEY (book_id, author_id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_book_authors_author ON book_authors (author_id, book_id);
+    """)
+
+    # Keep pub_year in sync with `year` for rows written after the migration
+    pub_year = PUB_YEAR_EXPR.format(col="NEW.year")
+    run_script(conn, f"""
+        CREATE TRIGGER IF NOT EXISTS books_pub_year_insert AFTER INSERT ON books
+        BEGIN
+            UPDATE books SET pub_year = {pub_year} WHERE rowid = NEW.rowid;
+        END;
+        CREATE TRIGGER IF NOT EXISTS books_pub_year_update AFTER UPDATE OF year ON books
+        BEGIN
+            UPDATE books SET pub_year = {pub_year} WHERE rowid = NEW.rowid;
+        END;
+    """)
+    conn.execute(f"UPDATE books SET pub_year = {PUB_YEAR_EXPR.format(col='year')}")
+
+    # Covering indexes for the dashboard questions
+    run_script(conn, """
+        -- 2, 3, 9, 20: per-publisher counts and average ratings
+        CREATE INDEX IF NOT EXISTS idx_books_publisher_rating ON books (publisher_id, averageRating);
+        -- 5: books after a year with a minimum page count
+        CREATE INDEX IF NOT EXISTS idx_books_year_pages ON books (pub_year, pageCount, book_title);
+        -- 15: average retail price per year
+        CREATE INDEX IF NOT EXISTS idx_books_year_price ON books (pub_year, amount_retailPrice);
+        -- 8, 13, 16: per-author(-string) and per-author-year groupings
+        CREATE INDEX IF NOT EXISTS idx_books_authors_year ON books (book_authors, pub_year);
+        CREATE INDEX IF NOT EXISTS idx_books_category ON books (category_id, pageCount);
+    """)
+    return True
+
+
+# 2. Re-key publishers on decoded canonical names instead of the exploded raw strings
+def _canonical_publishers(conn):
+    conn.execute("UPDATE books SET publisher_id = NULL")
+    conn.execute("DELETE FROM publishers")
+    return True
+
+
+# 3. FTS5 index over title, subtitle, description and categories
+def _full_text_index(conn):
+    search.install(conn)
+
+
+# 4. Per-isEbook/category/publisher/year aggregates maintained by triggers,
+# filled after the pending steps (later steps add the columns they sum)
+def _summary_tables(conn):
+    summaries.install(conn, fill=False)
+    return True
+
+
+# 5. Covering index for joining book_authors to the publication year (question 16)
+def _author_year_index(conn):
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_books_id_year ON books (book_id, pub_year)")
+
+
+# 6. Precomputed author counts: per book (question 11) and per author (question 8)
+def _author_counts(conn):
+    _add_column(conn, "books", "author_count", "INTEGER")
+    _add_column(conn, "authors", "book_count", "INTEGER")
+    run_script(conn, """
+        CREATE INDEX IF NOT EXISTS idx_books_author_count ON books (author_count);
+        CREATE INDEX IF NOT EXISTS idx_authors_book_count ON authors (book_count);
+    """)
+    return True
+
+
+# 7. Content hash of each row's source columns, for delta ingests (ingest.py)
+def _content_hashes(conn):
+    _add_column(conn, "books", "content_hash", "TEXT")
+    conn.create_function("content_hash", len(BOOK_COLUMNS), content_hash, deterministic=True)
+    conn.execute(f"UPDATE books SET content_hash = content_hash({', '.join(BOOK_COLUMNS)})")
+
+
+# 8. Retail prices in USD and discounts, indexed (pricing.py); the summary
+# tables sum the converted prices from now on
+def _prices(conn):
+    pricing.install(conn)
+    summaries.reinstall(conn)
+
+
+# 9. Drop the (book_authors, pub_year) index from step 1: no question's plan
+# uses it since the author questions join book_authors (steps 5 and 6)
+def _drop_author_string_index(conn):
+    conn.execute("DROP INDEX IF EXISTS idx_books_authors_year")
+
+
+# 10. Rebuild the summary table without the unused sums of squares
+def _summary_without_squares(conn):
+    summaries.reinstall(conn, columns=True)
+
+
+# 11. Recreate the price triggers: mixed-currency discounts multiplied by the
+# list price's rate instead of dividing by it
+def _price_triggers(conn):
+    pricing.reinstall(conn)
+
+
+# Ordered list of (version, migration); append new steps, never reorder.
+# A step returns True when the derived tables and columns must be refreshed;
+# that happens once, after all pending steps, in the same transaction.
+MIGRATIONS = [
+    (1, _normalize_books),
+    (2, _canonical_publishers),
+    (3, _full_text_index),
+    (4, _summary_tables),
+    (5, _author_year_index),
+    (6, _author_counts),
+    (7, _content_hashes),
+    (8, _prices),
+    (9, _drop_author_string_index),
+    (10, _summary_without_squares),
+    (11, _price_triggers),
+]
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute(BOOKS_DDL)
+        current = schema_version(conn)
+        pending = [(version, step) for version, step in MIGRATIONS if version > current]
+        if not pending:
+            return current
+        with conn:
+            conn.execute("BEGIN")
+            needs_refresh = False
+            for version, step in pending:
+                needs_refresh = step(conn) or needs_refresh
+            if needs_refresh:
+                refresh_dimensions(conn)
+                summaries.rebuild(conn)
+            conn.execute(f"PRAGMA user_version = {pending[-1][0]}")
+        conn.execute("ANALYZE")
+        return schema_version(conn)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else "books_database.db"
+    print(f"{path}: schema version {migrate(path)}")
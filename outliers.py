@@ -0,0 +1,111 @@
+"""
+Outlier detection over a numeric column, optionally per group.
+
+All statistics are computed with vectorized NumPy passes, never with per-row
+Python or correlated SQL subqueries:
+
+- "zscore": mean/standard deviation from a chunked Welford/Chan pass
+  (|x - mean| > k * std)
+- "mad":    median absolute deviation, scaled to be comparable to a std
+  (|x - median| > k * 1.4826 * MAD)
+- "iqr":    Tukey fences (x < Q1 - k * IQR or x > Q3 + k * IQR)
+
+`groups` (e.g. category or publisher per row) makes every statistic per group;
+NaN values are ignored and never flagged.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+
+METHODS = ("zscore", "mad", "iqr")
+DEFAULT_K = {"zscore": 2.0, "mad": 3.5, "iqr": 1.5}
+
+# Normal-consistency constant: 1.4826 * MAD estimates the standard deviation
+MAD_SCALE = 1.4826
+
+# Per-row result: the outlier flag, the group center and the inlier bounds
+OutlierResult = namedtuple("OutlierResult", ["mask", "center", "lower", "upper"])
+
+
+def _encode_groups(groups, size):
+    if groups is None:
+        return np.zeros(size, dtype=np.intp), 1
+    # Missing group labels (None/NaN) form a group of their own
+    codes, uniques = pd.factorize(pd.Series(groups), use_na_sentinel=False)
+    return codes.astype(np.intp), len(uniques)
+
+
+# Count, mean and sum of squared deviations (M2) per group, merging one
+# vectorized chunk at a time with Chan et al.'s parallel update of Welford's
+# algorithm, so memory stays bounded and the sums stay numerically stable
+def moments(values, codes=None, n_groups=1, chunk_size=1 << 16):
+    values = np.asarray(values, dtype=np.float64)
+    if codes is None:
+        codes = np.zeros(len(values), dtype=np.intp)
+    count = np.zeros(n_groups)
+    mean = np.zeros(n_groups)
+    m2 = np.zeros(n_groups)
+    for start in range(0, len(values), chunk_size):
+        x = values[start:start + chunk_size]
+        c = codes[start:start + chunk_size]
+        valid = ~np.isnan(x)
+        x, c = x[valid], c[valid]
+        n_b = np.bincount(c, minlength=n_groups).astype(np.float64)
+        sum_b = np.bincount(c, weights=x, minlength=n_groups)
+        mean_b = np.divide(sum_b, n_b, out=np.zeros(n_groups), where=n_b > 0)
+        m2_b = np.bincount(c, weights=(x - mean_b[c]) ** 2, minlength=n_groups)
+        total = count + n_b
+        delta = mean_b - mean
+        weight = np.divide(n_b, total, out=np.zeros(n_groups), where=total > 0)
+        mean = mean + delta * weight
+        m2 = m2 + m2_b + delta ** 2 * count * weight
+        count = total
+    return count, mean, m2
+
+
+# Per-group quantiles (linear interpolation, like np.quantile) from one sort
+def _group_quantiles(values, codes, n_groups, qs):
+    valid = ~np.isnan(values)
+    order = np.lexsort((values[valid], codes[valid]))
+    sorted_values = values[valid][order]
+    counts = np.bincount(codes[valid], minlength=n_groups)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    result = []
+    for q in qs:
+        pos = starts + q * np.maximum(counts - 1, 0)
+        lo = np.floor(pos).astype(np.intp)
+        hi = np.ceil(pos).astype(np.intp)
+        quantile = np.full(n_groups, np.nan)
+        has = counts > 0
+        frac = pos - lo
+        quantile[has] = sorted_values[lo[has]] * (1 - frac[has]) + sorted_values[hi[has]] * frac[has]
+        result.append(quantile)
+    return result
+
+
+def detect_outliers(values, method="zscore", k=None, groups=None):
+    if method not in METHODS:
+        raise ValueError(f"unknown outlier method {method!r}; expected one of {METHODS}")
+    k = DEFAULT_K[method] if k is None else k
+    values = np.asarray(values, dtype=np.float64)
+    codes, n_groups = _encode_groups(groups, len(values))
+
+    if method == "zscore":
+        count, center, m2 = moments(values, codes, n_groups)
+        spread = np.sqrt(np.divide(m2, count, out=np.zeros(n_groups), where=count > 0))
+        lower, upper = center - k * spread, center + k * spread
+    elif method == "mad":
+        (center,) = _group_quantiles(values, codes, n_groups, [0.5])
+        (mad,) = _group_quantiles(np.abs(values - center[codes]), codes, n_groups, [0.5])
+        lower, upper = center - k * MAD_SCALE * mad, center + k * MAD_SCALE * mad
+    else:
+        q1, center, q3 = _group_quantiles(values, codes, n_groups, [0.25, 0.5, 0.75])
+        lower, upper = q1 - k * (q3 - q1), q3 + k * (q3 - q1)
+
+    row_lower, row_upper = lower[codes], upper[codes]
+    with np.errstate(invalid="ignore"):
+        mask = (values < row_lower) | (values > row_upper)
+    return OutlierResult(mask & ~np.isnan(values), center[codes], row_lower, row_upper)
@@ -0,0 +1,312 @@
+"""
+Retail prices normalized to one base currency, and the discount of every book.
+
+`fx_rates` is a local table of exchange rates (BASE_CURRENCY per unit of each
+currency), stamped with the version, i.e. the date, of the rates it holds.
+`install()` writes the RATES shipped here; `update_rates()` replaces them
+with a newer version and re-prices only the books in a currency whose rate
+changed.
+
+Two derived columns on `books` are computed once, when a row is written,
+by triggers (like `pub_year`, see migrations.py):
+- `price_usd`: the retail price converted to BASE_CURRENCY, NULL when the
+  book is unpriced or its currency has no rate
+- `discount_pct`: the retail price's discount off the list price, in percent,
+  NULL without both prices or when the list price is not positive. Prices in
+  different currencies are compared in BASE_CURRENCY.
+
+Both are indexed, alone and after `isEbook` / `pub_year`, so the price
+questions (4, 6, 15 and 18, via book_summary) and the band counts below are
+range scans on those indexes instead of per-row arithmetic. `band_sql()`
+counts the books of every band with one range scan each; `bands()` and
+`format_bands()` shape the counts with vectorized pandas operations.
+
+Usage: python pricing.py [--db books_database.db] [--update-rates]
+"""
+
+import argparse
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+
+BASE_CURRENCY = "USD"
+
+# Reference rates (BASE_CURRENCY per unit) as of RATES_VERSION
+RATES_VERSION = "2024-06-28"
+RATES = {
+    "USD": 1.0,
+    "EUR": 1.0713,
+    "GBP": 1.2645,
+    "CAD": 0.7306,
+    "AUD": 0.6670,
+    "NZD": 0.6087,
+    "CHF": 1.1127,
+    "JPY": 0.006217,
+    "CNY": 0.1376,
+    "HKD": 0.1281,
+    "SGD": 0.7378,
+    "INR": 0.011983,
+    "BRL": 0.1789,
+    "MXN": 0.05458,
+    "ZAR": 0.05477,
+    "SEK": 0.09439,
+    "NOK": 0.09383,
+    "DKK": 0.1437,
+    "PLN": 0.2486,
+    "CZK": 0.04280,
+    "HUF": 0.002711,
+    "TRY": 0.03046,
+    "KRW": 0.000727,
+    "TWD": 0.03075,
+    "THB": 0.02722,
+    "IDR": 0.0000611,
+    "MYR": 0.2120,
+    "PHP": 0.01707,
+    "ILS": 0.2654,
+    "RUB": 0.01163,
+}
+
+FX_RATES_DDL = """
+    CREATE TABLE IF NOT EXISTS fx_rates (
+        currency TEXT PRIMARY KEY,
+        usd_per_unit REAL NOT NULL,
+        version TEXT NOT NULL
+    )
+"""
+
+PRICE_COLUMNS = ("amount_listPrice", "currencyCode_listPrice", "amount_retailPrice", "currencyCode_retailPrice")
+
+
+# An amount in BASE_CURRENCY (NULL without a rate for its currency), as one
+# parenthesized term: it is divided by in discount_sql()
+def _usd(amount, currency):
+    return f"({amount} * (SELECT usd_per_unit FROM fx_rates WHERE currency = {currency}))"
+
+
+# `price_usd` and `discount_pct` of a row, as SQL over its columns (`row`
+# is the "NEW." prefix in triggers)
+def price_sql(row=""):
+    return _usd(f"{row}amount_retailPrice", f"{row}currencyCode_retailPrice")
+
+
+def discount_sql(row=""):
+    retail, retail_currency = f"{row}amount_retailPrice", f"{row}currencyCode_retailPrice"
+    listed, list_currency = f"{row}amount_listPrice", f"{row}currencyCode_listPrice"
+    # Same-currency prices need no rate (100.0 first: integral prices divide as integers)
+    return f"""CASE WHEN {listed} > 0 AND {retail} IS NOT NULL THEN
+        CASE WHEN {list_currency} IS {retail_currency}
+            THEN 100.0 * ({listed} - {retail}) / {listed}
+            ELSE (1 - {_usd(retail, retail_currency)} / {_usd(listed, list_currency)}) * 100
+        END
+    END"""
+
+
+def _set_prices(row):
+    return f"price_usd = {price_sql(row)}, discount_pct = {discount_sql(row)}"
+
+
+# Keep both columns in sync for rows written after the migration. Unpriced
+# inserts keep their NULLs without a second write.
+TRIGGERS = [
+    f"""CREATE TRIGGER IF NOT EXISTS books_price_insert AFTER INSERT ON books
+    WHEN NEW.amount_retailPrice IS NOT NULL
+    BEGIN
+        UPDATE books SET {_set_prices("NEW.")} WHERE rowid = NEW.rowid;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS books_price_update AFTER UPDATE OF {", ".join(PRICE_COLUMNS)} ON books
+    BEGIN
+        UPDATE books SET {_set_prices("NEW.")} WHERE rowid = NEW.rowid;
+    END""",
+]
+
+INDEXES = [
+    # 4 and the price bands
+    "CREATE INDEX IF NOT EXISTS idx_books_price_usd ON books (price_usd)",
+    # 6 and the discount bands
+    "CREATE INDEX IF NOT EXISTS idx_books_discount ON books (discount_pct, book_title, price_usd)",
+    # 15: average price per year (replaces the index on the unconverted price)
+    "CREATE INDEX IF NOT EXISTS idx_books_year_price_usd ON books (pub_year, price_usd)",
+    "DROP INDEX IF EXISTS idx_books_year_price",
+    # eBook vs physical price bands
+    "CREATE INDEX IF NOT EXISTS idx_books_format_price ON books (isEbook, price_usd)",
+]
+
+# Question 6's default threshold, in percent
+MIN_DISCOUNT = 20
+
+# Band edges: [low, high) per band, the last one open-ended
+PRICE_EDGES = (0, 5, 10, 20, 50, 100, 250)
+DISCOUNT_EDGES = (0, 10, 20, 30, 40, 50, 75)
+
+
+def _edges_sql(edges):
+    highs = [*edges[1:], None]
+    return ", ".join(f"({low}, {'NULL' if high is None else high})" for low, high in zip(edges, highs))
+
+
+# Books per [low, high) band of a column, each counted by a range scan on the
+# column's index. `by` groups the counts by the values of a leading index
+# column as well, e.g. per format on (isEbook, price_usd).
+def band_sql(column, edges, by=None, by_values=()):
+    bands = f"bands(low, high) AS (VALUES {_edges_sql(edges)})"
+    # Open-ended top band: the bound stays a constant, so the index range holds
+    upper = f"{column} < COALESCE(b.high, 1e308)"
+    if by is None:
+        return f"""
+    WITH {bands}
+    SELECT
+        b.low,
+        b.high,
+        (SELECT COUNT(*) FROM books WHERE {column} >= b.low AND {upper}) AS book_count
+    FROM bands AS b
+    ORDER BY b.low;
+"""
+    groups = ", ".join(f"({value})" for value in by_values)
+    return f"""
+    WITH {bands},
+    groups(value) AS (VALUES {groups})
+    SELECT
+        g.value,
+        b.low,
+        b.high,
+        (SELECT COUNT(*) FROM books WHERE {by} = g.value AND {column} >= b.low AND {upper}) AS book_count
+    FROM groups AS g, bands AS b
+    ORDER BY g.value, b.low;
+"""
+
+
+PRICE_BANDS_SQL = band_sql("price_usd", PRICE_EDGES)
+DISCOUNT_BANDS_SQL = band_sql("discount_pct", DISCOUNT_EDGES)
+FORMAT_PRICE_BANDS_SQL = band_sql("price_usd", PRICE_EDGES, by="isEbook", by_values=(0, 1))
+
+
+def band_label(low, high, unit=""):
+    if unit == "$":
+        return f"${low:g}+" if high is None or pd.isna(high) else f"${low:g}–{high:g}"
+    return f"{low:g}{unit}+" if high is None or pd.isna(high) else f"{low:g}–{high:g}{unit}"
+
+
+# A band count frame (low, high, book_count) with a label and the share of
+# the counted books per band
+def bands(frame, unit=""):
+    counts = frame["book_count"].to_numpy(dtype=np.int64)
+    total = counts.sum()
+    return pd.DataFrame({
+        "Band": [band_label(low, high, unit) for low, high in zip(frame["low"], frame["high"])],
+        "Book Count": counts,
+        "Share": counts / total * 100 if total else np.zeros(len(counts)),
+    })
+
+
+FORMAT_NAMES = {0: "Physical Book", 1: "EBook"}
+
+
+# Per-format band counts (value, low, high, book_count) side by side: one
+# row per band, count and share columns per format
+def format_bands(frame, names=FORMAT_NAMES):
+    counts = frame.pivot(index=["low", "high"], columns="value", values="book_count")
+    counts = counts.reindex(columns=list(names), fill_value=0).fillna(0).astype(np.int64)
+    shares = counts / counts.sum().replace(0, np.nan) * 100
+    result = pd.DataFrame({"Band": [band_label(low, high, "$") for low, high in counts.index]})
+    for value, name in names.items():
+        result[f"{name} Count"] = counts[value].to_numpy()
+        result[f"{name} Share"] = shares[value].fillna(0).to_numpy()
+    return result
+
+
+def _columns(conn):
+    return {row[1] for row in conn.execute("PRAGMA table_info(books)")}
+
+
+def _write_rates(conn, rates, version):
+    conn.executemany("""
+        INSERT INTO fx_rates (currency, usd_per_unit, version) VALUES (?, ?, ?)
+        ON CONFLICT (currency) DO UPDATE SET usd_per_unit = excluded.usd_per_unit, version = excluded.version
+    """, ((currency, rate, version) for currency, rate in rates.items()))
+
+
+# Recompute both columns for every book, or for the books priced in one of
+# `currencies`. Rows whose values are unchanged are not rewritten.
+def reprice(conn, currencies=None):
+    scope = ""
+    params = ()
+    if currencies is not None:
+        currencies = list(currencies)
+        if not currencies:
+            return 0
+        marks = ", ".join("?" * len(currencies))
+        scope = f" AND (currencyCode_retailPrice IN ({marks}) OR currencyCode_listPrice IN ({marks}))"
+        params = (*currencies, *currencies)
+    price, discount = price_sql(), discount_sql()
+    return conn.execute(f"""
+        UPDATE books SET price_usd = {price}, discount_pct = {discount}
+        WHERE (price_usd IS NOT {price} OR discount_pct IS NOT {discount}){scope}
+    """, params).rowcount
+
+
+# Rate table, derived columns, triggers and indexes (a migration step)
+def install(conn):
+    conn.execute(FX_RATES_DDL)
+    _write_rates(conn, RATES, RATES_VERSION)
+    columns = _columns(conn)
+    for column in ("price_usd", "discount_pct"):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE books ADD COLUMN {column} REAL")
+    for trigger in TRIGGERS:
+        conn.execute(trigger)
+    reprice(conn)
+    for statement in INDEXES:
+        conn.execute(statement)
+
+
+# Recreate the triggers (after price_sql() or discount_sql() change) and
+# re-price the books they would have priced differently
+def reinstall(conn):
+    for trigger in ("books_price_insert", "books_price_update"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    for trigger in TRIGGERS:
+        conn.execute(trigger)
+    reprice(conn)
+
+
+def rates_version(conn):
+    row = conn.execute("SELECT MAX(version) FROM fx_rates").fetchone()
+    return row[0] if row else None
+
+
+# Replace the rates with a newer version; books are re-priced only in the
+# currencies whose rate changed. Returns the number of re-priced books.
+def update_rates(conn, rates=RATES, version=RATES_VERSION):
+    current = dict(conn.execute("SELECT currency, usd_per_unit FROM fx_rates"))
+    changed = [currency for currency, rate in rates.items() if current.get(currency) != rate]
+    _write_rates(conn, rates, version)
+    return reprice(conn, changed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Price bands in the base currency.")
+    parser.add_argument("--db", default="books_database.db")
+    parser.add_argument("--update-rates", action="store_true",
+                        help=f"apply the rates shipped here ({RATES_VERSION})")
+    args = parser.parse_args(argv)
+
+    from migrations import migrate
+
+    migrate(args.db)
+    with sqlite3.connect(args.db) as conn:
+        if args.update_rates:
+            print(f"Re-priced {update_rates(conn):,} books")
+        print(f"FX rates version {rates_version(conn)}, prices in {BASE_CURRENCY}\n")
+
+        def query(sql):
+            return pd.read_sql_query(sql, conn)
+
+        print(bands(query(PRICE_BANDS_SQL), "$").to_string(index=False), "\n")
+        print(bands(query(DISCOUNT_BANDS_SQL), "%").to_string(index=False), "\n")
+        print(format_bands(query(FORMAT_PRICE_BANDS_SQL)).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,478 @@
+"""
+Registry of the dashboard questions: id, menu title, SQL, default parameters,
+result columns and chart spec. The dashboard dispatches on it, and the same
+questions run headlessly (benchmarks, the columnar backend, reports).
+
+Statements target the normalized schema built by migrations.py. Question 14's
+SQL lives in search.py (FTS5) and question 16's in author_streaks.py.
+
+Usage: python queries.py [q1 q5 ...] [--db books_database.db]
+"""
+
+import argparse
+import re
+import sqlite3
+from collections import namedtuple
+from functools import lru_cache
+
+import pandas as pd
+
+import author_streaks
+import pricing
+import search
+import summaries
+from charts import ChartSpec, bin_rows, top_n_other
+from migrations import migrate
+
+
+# Books per format (isEbook 0/1)
+EBOOK_COUNTS_SQL = """
+    SELECT
+        group_key AS isEbook,
+        book_count
+    FROM book_summary
+    WHERE dimension = 'isEbook';
+"""
+
+# Publisher with the most books
+TOP_PUBLISHER_SQL = """
+    SELECT
+        p.name,
+        c.book_count
+    FROM (
+        SELECT publisher_id, COUNT(*) AS book_count
+        FROM books
+        WHERE publisher_id IS NOT NULL
+        GROUP BY publisher_id
+        ORDER BY book_count DESC
+        LIMIT 1
+    ) AS c
+    JOIN publishers AS p ON p.publisher_id = c.publisher_id;
+"""
+
+# Publisher with the highest average rating
+TOP_RATED_PUBLISHER_SQL = """
+    SELECT
+        p.name,
+        r.avg_rating
+    FROM (
+        SELECT publisher_id, AVG(averageRating) AS avg_rating
+        FROM books
+        WHERE publisher_id IS NOT NULL
+        GROUP BY publisher_id
+        ORDER BY avg_rating DESC, publisher_id
+        LIMIT 1
+    ) AS r
+    JOIN publishers AS p ON p.publisher_id = r.publisher_id;
+"""
+
+# Five most expensive books by retail price, in USD (pricing.py)
+MOST_EXPENSIVE_SQL = """
+    SELECT
+        book_title,
+        price_usd
+    FROM books
+    ORDER BY price_usd DESC
+    LIMIT 5;
+"""
+
+# Books published after 2010 with at least 500 pages
+LONG_RECENT_BOOKS_SQL = """
+    SELECT
+        book_title,
+        pub_year,
+        pageCount
+    FROM books
+    WHERE
+        pub_year > 2010
+        AND pageCount >= 500;
+"""
+
+# Books discounted by more than a percentage off the list price (precomputed
+# discount_pct, a range of its index)
+DISCOUNTED_BOOKS_SQL = """
+    SELECT
+        book_title,
+        price_usd,
+        discount_pct
+    FROM books
+    WHERE discount_pct > ?
+    ORDER BY discount_pct DESC;
+"""
+
+# Average page count per format
+EBOOK_PAGE_COUNTS_SQL = """
+    SELECT
+        group_key AS isEbook,
+        pages_sum / NULLIF(pages_n, 0) AS avg_page_count
+    FROM book_summary
+    WHERE dimension = 'isEbook'
+    ORDER BY group_key;
+"""
+
+# Three authors with the most books
+TOP_AUTHORS_SQL = """
+    SELECT
+        name,
+        book_count
+    FROM authors
+    ORDER BY book_count DESC, name
+    LIMIT 3;
+"""
+
+# Publishers with more than 10 books
+PROLIFIC_PUBLISHERS_SQL = """
+    SELECT
+        p.name,
+        c.book_count
+    FROM (
+        SELECT publisher_id, COUNT(*) AS book_count
+        FROM books
+        WHERE publisher_id IS NOT NULL
+        GROUP BY publisher_id
+        HAVING book_count > 10
+    ) AS c
+    JOIN publishers AS p ON p.publisher_id = c.publisher_id
+    ORDER BY c.book_count DESC;
+"""
+
+# Average page count per category
+CATEGORY_PAGE_COUNTS_SQL = """
+    SELECT
+        c.name,
+        s.pages_sum / NULLIF(s.pages_n, 0) AS avg_page_count
+    FROM book_summary AS s
+    JOIN categories AS c ON c.category_id = s.group_key
+    WHERE s.dimension = 'category'
+    ORDER BY c.name;
+"""
+
+# Books with more than 3 authors
+MULTI_AUTHOR_BOOKS_SQL = """
+    SELECT
+        book_title,
+        book_authors,
+        author_count
+    FROM books
+    WHERE author_count > 3;
+"""
+
+# Ratings count per book, counts above 10 scaled down by 10
+RATINGS_COUNTS_SQL = """
+    SELECT
+        book_title,
+        CASE 
+            WHEN ratingsCount > 10 THEN ratingsCount / 10
+            ELSE ratingsCount
+        END AS adjusted_ratingsCount
+    FROM books;
+"""
+
+# Authors with several books in the same year
+AUTHOR_YEAR_COUNTS_SQL = """
+    SELECT
+        a.name,
+        b.pub_year,
+        COUNT(*) AS book_count
+    FROM book_authors AS ba
+    JOIN books AS b ON b.book_id = ba.book_id
+    JOIN authors AS a ON a.author_id = ba.author_id
+    WHERE b.pub_year IS NOT NULL
+    GROUP BY ba.author_id, a.name, b.pub_year
+    -- COUNT(*), not the alias: authors has a book_count column of its own
+    HAVING COUNT(*) > 1;
+"""
+
+# Three years with the highest average retail price, in USD
+TOP_PRICE_YEARS_SQL = """
+    SELECT
+        pub_year,
+        AVG(price_usd) AS avg_price
+    FROM books
+    WHERE pub_year IS NOT NULL
+    GROUP BY pub_year
+    ORDER BY avg_price DESC
+    LIMIT 3;
+"""
+
+# Authors published by several publishers in the same year
+MULTI_PUBLISHER_AUTHORS_SQL = """
+    WITH author_publishers AS (
+        SELECT DISTINCT
+            ba.author_id,
+            b.pub_year,
+            b.publisher_id
+        FROM book_authors AS ba
+        JOIN books AS b ON b.book_id = ba.book_id
+        WHERE b.pub_year IS NOT NULL AND b.publisher_id IS NOT NULL
+    ),
+    named AS (
+        SELECT
+            ap.author_id,
+            a.name AS author,
+            ap.pub_year,
+            p.name AS publisher
+        FROM author_publishers AS ap
+        JOIN authors AS a ON a.author_id = ap.author_id
+        JOIN publishers AS p ON p.publisher_id = ap.publisher_id
+        -- GROUP_CONCAT joins values in input order: list publishers by name
+        ORDER BY ap.author_id, ap.pub_year, p.name
+    )
+    SELECT
+        author,
+        pub_year,
+        GROUP_CONCAT(publisher, '; ') AS publishers
+    FROM named
+    GROUP BY author_id, author, pub_year
+    HAVING COUNT(*) > 1
+    ORDER BY pub_year DESC, author;
+"""
+
+# Average retail price of eBooks and physical books
+EBOOK_PRICES_SQL = """
+    SELECT
+        MAX(CASE WHEN group_key = 1 THEN price_sum / NULLIF(price_n, 0) END) AS avg_ebook_price,
+        MAX(CASE WHEN group_key = 0 THEN price_sum / NULLIF(price_n, 0) END) AS avg_physical_price
+    FROM book_summary
+    WHERE dimension = 'isEbook';
+"""
+
+# Every rated book with its category and publisher
+RATED_BOOKS_SQL = """
+    SELECT
+        b.book_title,
+        b.averageRating,
+        b.ratingsCount,
+        c.name AS category,
+        p.name AS publisher
+    FROM books AS b
+    LEFT JOIN categories AS c ON c.category_id = b.category_id
+    LEFT JOIN publishers AS p ON p.publisher_id = b.publisher_id
+    WHERE b.averageRating IS NOT NULL;
+"""
+
+# Highest-rated publisher among those with more than 10 books
+TOP_RATED_LARGE_PUBLISHER_SQL = """
+    SELECT
+        p.name,
+        r.avg_rating,
+        r.book_count
+    FROM (
+        SELECT publisher_id, AVG(averageRating) AS avg_rating, COUNT(*) AS book_count
+        FROM books
+        WHERE publisher_id IS NOT NULL
+        GROUP BY publisher_id
+        HAVING book_count > 10
+        ORDER BY avg_rating DESC, publisher_id
+        LIMIT 1
+    ) AS r
+    JOIN publishers AS p ON p.publisher_id = r.publisher_id;
+"""
+
+# Every book_summary group with its name: the overall insights in one pass
+SUMMARY_SQL = """
+    SELECT
+        s.dimension,
+        s.group_key,
+        COALESCE(p.name, c.name) AS name,
+        s.book_count,
+        s.rating_n, s.rating_sum,
+        s.pages_n, s.pages_sum,
+        s.price_n, s.price_sum
+    FROM book_summary AS s
+    LEFT JOIN publishers AS p ON s.dimension = 'publisher' AND p.publisher_id = s.group_key
+    LEFT JOIN categories AS c ON s.dimension = 'category' AND c.category_id = s.group_key;
+"""
+
+
+
+# Chart data for a question: its result DataFrame reduced to at most about
+# `budget` marks (see charts.top_n_other / charts.bin_rows)
+
+
+def _books_per_year(frame, budget):
+    return frame.groupby("Year").size().reset_index(name="Book Count")
+
+
+# Ranked by discount, averaged over runs of neighbouring ranks
+def _binned_discounts(frame, budget):
+    ranked = frame.sort_values(by="Discount", ascending=False)
+    return bin_rows(ranked, "Discount", budget, position="Rank")
+
+
+# The books with the most authors; the rest are one averaged "Other" point
+def _top_author_counts(frame, budget):
+    return top_n_other(frame, "Book Title", "Author Count", budget, agg="mean")
+
+
+# Books rated more often than average, the least rated averaged into "Other"
+def _top_above_average_ratings(frame, budget):
+    above = frame[frame["Rating Count"] > frame["Rating Count"].mean()]
+    return top_n_other(above, "Book Title", "Rating Count", budget, agg="mean")
+
+
+# The most prolific authors; everyone else is one "Other" column with a point per year
+def _top_author_years(frame, budget):
+    frame = frame.dropna(subset=["Authors", "Year"])
+    return top_n_other(frame, "Authors", "Book Count", budget, by="Year")
+
+
+# One dashboard question. `params` are the default bound parameters, `columns`
+# names the result columns (the DataFrame schema), `one` marks single-row
+# results, `chart` is the charts.ChartSpec drawn from the result, if any, and
+# `chart_data(frame, budget)` turns the result into that chart's data.
+# Statements are fixed strings, so each pooled connection prepares a question
+# once and reuses it from sqlite3's per-connection statement cache.
+Question = namedtuple(
+    "Question",
+    ["id", "title", "sql", "columns", "params", "one", "chart", "chart_data"],
+    defaults=[(), False, None, None],
+)
+
+QUESTIONS = {q.id: q for q in [
+    Question("q1", "1. Check Availability of eBooks vs Physical Books",
+             EBOOK_COUNTS_SQL, ["isEbook", "Book Count"]),
+    Question("q2", "2. Publisher with the Most Books Published",
+             TOP_PUBLISHER_SQL, ["Publisher", "Book Count"], one=True),
+    Question("q3", "3. Identify the Publisher with the Highest Average Rating",
+             TOP_RATED_PUBLISHER_SQL, ["Publisher", "Average Rating"], one=True),
+    Question("q4", "4. Top 5 Most Expensive Books by Retail Price",
+             MOST_EXPENSIVE_SQL, ["Book Title", "Retail Price"]),
+    Question("q5", "5. Books Published After 2010 with at Least 500 Pages",
+             LONG_RECENT_BOOKS_SQL, ["Book Title", "Year", "Page Count"],
+             chart=ChartSpec(
+                 "bar", "Year", "Book Count",
+                 title="Number of Books Published After 2010 with At Least 500 Pages",
+                 x_title="Year of Publication", y_title="Number of Books", mark_color="blue", labels=True,
+             ), chart_data=_books_per_year),
+    Question("q6", f"6. List Books with Discounts Greater than {pricing.MIN_DISCOUNT}%",
+             DISCOUNTED_BOOKS_SQL, ["Book Title", "Retail Price", "Discount"], (pricing.MIN_DISCOUNT,),
+             chart=ChartSpec(
+                 "scatter", "Rank", "Discount", title=f"Discount Percentage for Books (Above {pricing.MIN_DISCOUNT}%)",
+                 x_title="Books (Ordered by Discount)", y_title="Discount Percentage", mark_color="green",
+             ), chart_data=_binned_discounts),
+    Question("q7", "7. Average Page Count for eBooks vs Physical Books",
+             EBOOK_PAGE_COUNTS_SQL, ["Book Type", "Average Page Count"]),
+    Question("q8", "8. Top 3 Authors with the Most Books",
+             TOP_AUTHORS_SQL, ["Authors", "Book Count"]),
+    Question("q9", "9. List Publishers with More than 10 Books",
+             PROLIFIC_PUBLISHERS_SQL, ["Publisher", "Book Count"]),
+    Question("q10", "10. Average Page Count for Each Category",
+             CATEGORY_PAGE_COUNTS_SQL, ["Category", "Average Page Count"]),
+    Question("q11", "11. Books with More than 3 Authors",
+             MULTI_AUTHOR_BOOKS_SQL, ["Book Title", "Authors", "Author Count"],
+             chart=ChartSpec(
+                 "scatter", "Book Title", "Author Count", title="Books with More than 3 Authors",
+                 y_title="Number of Authors", color="Author Count", size="Author Count",
+                 size_scale=50,  # Adjust marker size based on Author Count
+                 cmap="plasma", label_rotation=90,
+             ), chart_data=_top_author_counts),
+    Question("q12", "12. Books with Ratings Count Greater Than the Average",
+             RATINGS_COUNTS_SQL, ["Book Title", "Rating Count"],
+             chart=ChartSpec(
+                 "bar", "Book Title", "Rating Count", title="Books with Ratings Count Above Average",
+                 y_title="Ratings Count", mark_color="green", label_rotation=90,
+             ), chart_data=_top_above_average_ratings),
+    Question("q13", "13. Books with the Same Author Published in the Same Year",
+             AUTHOR_YEAR_COUNTS_SQL, ["Authors", "Year", "Book Count"],
+             chart=ChartSpec(
+                 "scatter", "Authors", "Year", title="Books with the Same Author Published in the Same Year",
+                 color="Book Count", size="Book Count", size_scale=50, label_rotation=90,
+             ), chart_data=_top_author_years),
+    Question("q14", "14. Books with a Specific Keyword in the Title",
+             search.SEARCH_SQL, ["Book Title", "Match", "Relevance"], (search.KEYWORD_PRESETS["Python"], 500)),
+    Question("q15", "15. Year with the Highest Average Book Price",
+             TOP_PRICE_YEARS_SQL, ["Year", "Average Price"]),
+    Question("q16", "16. Count Authors Who Published 3 Consecutive Years",
+             author_streaks.LONGEST_STREAKS_SQL, ["Author", "Consecutive Year Count", "From", "To"], (3,)),
+    Question("q17", "17. Authors Who Have Published Books in the Same Year but Under Different Publishers",
+             MULTI_PUBLISHER_AUTHORS_SQL, ["Author", "Year", "Publishers"]),
+    Question("q18", "18. Average Amount of Retail Price for eBooks and Physical Books",
+             EBOOK_PRICES_SQL, ["Average Ebook Price", "Average Physical Book Price"]),
+    Question("q19", "19. Books with Average Rating More Than Two Standard Deviations Away from the Average",
+             RATED_BOOKS_SQL, ["Title", "Average Rating", "Ratings Count", "Category", "Publisher"]),
+    Question("q20", "20. Publisher with the Highest Average Rating Among Publishers with More than 10 Books",
+             TOP_RATED_LARGE_PUBLISHER_SQL, ["Publisher", "Average Rating", "Book Count"], one=True),
+    # Supporting queries, not listed in the menu
+    Question("q14_counts", None,
+             search.KEYWORD_COUNTS_SQL, ["Python", "Data Science", "Both", "Others"],
+             (search.PYTHON_IN_TITLE, search.DATA_SCIENCE_IN_TITLE), one=True),
+    Question("price_bands", None,
+             pricing.PRICE_BANDS_SQL, ["low", "high", "book_count"]),
+    Question("discount_bands", None,
+             pricing.DISCOUNT_BANDS_SQL, ["low", "high", "book_count"]),
+    Question("format_price_bands", None,
+             pricing.FORMAT_PRICE_BANDS_SQL, ["value", "low", "high", "book_count"]),
+    Question("summary", None,
+             SUMMARY_SQL, ["dimension", "group_key", "name", "book_count", "rating_n", "rating_sum",
+                           "pages_n", "pages_sum", "price_n", "price_sum"]),
+]}
+
+# Menu title -> question, in menu order
+BY_TITLE = {q.title: q for q in QUESTIONS.values() if q.title}
+
+
+# Scoping a question to a subset of the books (the sidebar filters, see
+# facets.py): the tables it reads are shadowed by CTEs of the same name.
+# `books` keeps the rows whose rowid is in a JSON array bound as the first
+# parameter; the precomputed aggregates (`book_summary`, `authors.book_count`)
+# are recomputed over those rows. Only the CTEs a statement mentions are added.
+SCOPE_CTES = {
+    "books": "books AS NOT MATERIALIZED (SELECT rowid, * FROM main.books WHERE rowid IN (SELECT value FROM json_each(?)))",
+    "book_summary": f"book_summary AS ({summaries.SUMMARY_ROWS_SQL})",
+    "authors": """authors AS (
+        SELECT a.author_id, a.name, c.book_count
+        FROM (
+            SELECT ba.author_id, COUNT(*) AS book_count
+            FROM books AS b
+            JOIN book_authors AS ba ON ba.book_id = b.book_id
+            GROUP BY ba.author_id
+        ) AS c
+        JOIN main.authors AS a ON a.author_id = c.author_id
+    )""",
+}
+
+
+# `sql` over the books whose rowids are bound (as a JSON array) before its own parameters
+@lru_cache(maxsize=None)
+def scoped_sql(sql):
+    ctes = ",\n    ".join(cte for name, cte in SCOPE_CTES.items()
+                          if name == "books" or re.search(rf"\b{name}\b", sql))
+    sql = sql.strip()
+    # Statements with CTEs of their own get the scope ones prepended
+    match = re.match(r"WITH(\s+RECURSIVE)?\s", sql, re.IGNORECASE)
+    if match:
+        return f"WITH{match.group(1) or ''} {ctes},\n    {sql[match.end():]}"
+    return f"WITH {ctes}\n{sql}"
+
+
+# Run a question on any DB-API connection, outside Streamlit: a DataFrame with
+# the question's columns, or a single row (None if empty) for `one` questions
+def run(conn, question_id, params=None):
+    question = QUESTIONS[question_id]
+    cursor = conn.execute(question.sql, question.params if params is None else params)
+    if question.one:
+        return cursor.fetchone()
+    return pd.DataFrame(cursor.fetchall(), columns=question.columns)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run dashboard questions headlessly.")
+    parser.add_argument("questions", nargs="*", help="question ids (default: all)")
+    parser.add_argument("--db", default="books_database.db")
+    args = parser.parse_args(argv)
+    unknown = [q for q in args.questions if q not in QUESTIONS]
+    if unknown:
+        parser.error(f"unknown question(s): {', '.join(unknown)}")
+    migrate(args.db)
+    with sqlite3.connect(f"file:{args.db}?mode=ro", uri=True) as conn:
+        for question_id in args.questions or QUESTIONS:
+            question = QUESTIONS[question_id]
+            print(f"== {question_id}: {question.title or 'supporting query'}")
+            result = run(conn, question_id)
+            print(result.to_string(max_rows=10) if isinstance(result, pd.DataFrame) else dict(zip(question.columns, result or ())))
+            print()
+
+
+if __name__ == "__main__":
+    main()
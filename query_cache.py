@@ -0,0 +1,238 @@
+"""
+Result cache for the dashboard questions.
+
+Results are keyed by question id and a digest of the SQL and its bound
+parameters (a scope's rowid list can run to megabytes, see facets.py), and
+are only valid for one version of the database file. Every lookup compares a cheap fingerprint of
+the database (mtime/size of the file and its WAL) and drops all cached results
+as soon as it changes, so reloading the data never serves stale answers.
+
+`Snapshot` applies the same check to anything built from the database (the
+columnar copy, the catalog, the facet index): it is rebuilt when the file
+changes.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import ExitStack, closing, nullcontext
+
+
+# Fingerprint of the database file: changes whenever SQLite writes to it
+def db_fingerprint(db_path):
+    parts = []
+    for path in (db_path, db_path + "-wal"):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            parts.append(None)
+        else:
+            parts.append((stat.st_mtime_ns, stat.st_size))
+    return tuple(parts)
+
+
+class Snapshot:
+    # The value `build(conn)` makes from the database file over a read-only
+    # connection, rebuilt when the file changes. The fingerprint is re-checked
+    # at most every `check_interval` seconds. `discard(value)` releases a value
+    # that was replaced or closed; `get(use)` returns `use(value)`, computed
+    # before the value can be discarded.
+    def __init__(self, db_path, build, check_interval=1.0, discard=None):
+        self.db_path = db_path
+        self.build = build
+        self.check_interval = check_interval
+        self.discard = discard
+        self._lock = threading.Lock()
+        self._value = None
+        self._fingerprint = None
+        self._checked_at = 0.0
+        self.loads = 0
+
+    def load(self):
+        fingerprint = db_fingerprint(self.db_path)
+        with closing(sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)) as conn:
+            value = self.build(conn)
+        self._replace(value)
+        self._fingerprint = fingerprint
+        self.loads += 1
+        return value
+
+    def get(self, use=None):
+        with self._lock:
+            now = time.monotonic()
+            if self._value is None or (
+                now - self._checked_at >= self.check_interval
+                and db_fingerprint(self.db_path) != self._fingerprint
+            ):
+                self.load()
+            self._checked_at = now
+            return self._value if use is None else use(self._value)
+
+    def _replace(self, value):
+        old, self._value = self._value, value
+        if old is not None and self.discard is not None:
+            self.discard(old)
+
+    def close(self):
+        with self._lock:
+            self._replace(None)
+
+
+# Digest of a statement and its parameters: a short cache key however long
+# the SQL or the parameters are
+def statement_key(sql, params):
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(sql.encode())
+    digest.update(repr(tuple(params)).encode())
+    return digest.digest()
+
+
+class LRUCache:
+    # Bounded mapping that evicts the least recently used entry first.
+    # `max_weight` bounds the summed weight of the entries (e.g. cached rows).
+    def __init__(self, max_entries=256, max_weight=None):
+        self.max_entries = max_entries
+        self.max_weight = max_weight
+        self._data = OrderedDict()
+        self._weight = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, weight = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, weight=1):
+        with self._lock:
+            if key in self._data:
+                self._weight -= self._data.pop(key)[1]
+            # Entries heavier than the whole budget are never cached
+            if self.max_weight is not None and weight > self.max_weight:
+                return
+            self._data[key] = (value, weight)
+            self._weight += weight
+            while len(self._data) > self.max_entries or (
+                self.max_weight is not None and self._weight > self.max_weight
+            ):
+                _, (_, evicted_weight) = self._data.popitem(last=False)
+                self._weight -= evicted_weight
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._weight = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {
+            "entries": len(self._data),
+            "weight": self._weight,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class QueryCache:
+    # `connection` is a zero-argument callable returning a context manager that
+    # yields a DB-API connection, e.g. `ConnectionPool.connection`.
+    # The fingerprint is re-checked at most every `check_interval` seconds so a
+    # cache hit stays a dictionary lookup even under many concurrent sessions.
+    # With `metrics` (an instrumentation.Metrics) lookups are counted, and
+    # executed statements are timed and have their query plan recorded.
+    def __init__(self, db_path, connection, max_entries=128, max_rows=500_000, check_interval=1.0, metrics=None):
+        self.db_path = db_path
+        self.connection = connection
+        self.metrics = metrics
+        self.check_interval = check_interval
+        self._results = LRUCache(max_entries=max_entries, max_weight=max_rows)
+        self._fingerprint = db_fingerprint(db_path)
+        self._checked_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._inflight = {}
+
+    @property
+    def fingerprint(self):
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            with self._lock:
+                current = db_fingerprint(self.db_path)
+                if current != self._fingerprint:
+                    self._results.clear()
+                    self._fingerprint = current
+                self._checked_at = now
+        return self._fingerprint
+
+    def invalidate(self):
+        with self._lock:
+            self._results.clear()
+            self._fingerprint = db_fingerprint(self.db_path)
+            self._checked_at = time.monotonic()
+
+    def fetch(self, question_id, sql, params=(), one=False):
+        key = (question_id, statement_key(sql, params), one, self.fingerprint)
+        missing = object()
+        result = self._results.get(key, missing)
+        if self.metrics is not None:
+            self.metrics.count_cache(question_id, result is not missing)
+        if result is not missing:
+            return result
+
+        # Only one session runs a given query; the others wait for its result
+        with self._lock:
+            event = self._inflight.get(key)
+            leader = event is None
+            if leader:
+                event = self._inflight[key] = threading.Event()
+        if not leader:
+            event.wait()
+            result = self._results.get(key, missing)
+            if result is not missing:
+                return result
+            return self._execute(question_id, sql, params, one)
+
+        try:
+            result = self._execute(question_id, sql, params, one)
+            self._results.put(key, result, weight=1 if one else max(len(result), 1))
+            return result
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            event.set()
+
+    def _stage(self, question_id, stage):
+        return self.metrics.stage(question_id, stage) if self.metrics is not None else nullcontext()
+
+    def _execute(self, question_id, sql, params, one):
+        with ExitStack() as stack:
+            with self._stage(question_id, "connect"):
+                conn = stack.enter_context(self.connection())
+            with self._stage(question_id, "execute"):
+                cursor = conn.execute(sql, tuple(params))
+            with self._stage(question_id, "fetch"):
+                result = cursor.fetchone() if one else tuple(cursor.fetchall())
+            if self.metrics is not None:
+                self.metrics.capture_plan(question_id, conn, sql, params)
+            return result
+
+    def stats(self):
+        return self._results.stats()
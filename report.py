@@ -0,0 +1,285 @@
+"""
+Headless report of every dashboard question, without Streamlit.
+
+The queries run concurrently on a pool of read-only connections; sqlite3
+releases the GIL while SQLite works, so they overlap on several cores. Charts
+are drawn in a process pool, because matplotlib rendering is CPU-bound and
+holds the GIL. A question's chart is queued as soon as its query returns, so
+the report takes about as long as the slowest question (query + chart) when
+there are enough cores, rather than the sum of all of them.
+
+Each section shows what the question's page shows (views.py): its table,
+e.g. only the rating outliers of question 19, and its analysis text, for the
+default page settings.
+
+The output is one self-contained HTML file with the charts embedded, or a PDF
+with a page per question when the output name ends in .pdf.
+
+Usage: python report.py [--db books_database.db] [--output report.html] [--workers N]
+"""
+
+import argparse
+import base64
+import html
+import io
+import os
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+import pandas as pd
+
+import charts
+import figures
+import queries
+import views
+from db_pool import ConnectionPool
+from migrations import migrate
+
+
+# Rows shown per result table, and the size of charts described by a ChartSpec
+MAX_TABLE_ROWS = 50
+SPEC_FIGSIZE = (10, 6)
+
+Section = namedtuple("Section", ["question", "table", "text", "query_s", "error", "chart", "chart_s"])
+
+# Results a section's view needs besides its own, e.g. the keyword counts of
+# question 14's text
+VIEW_RESULTS = {"q14": ("q14_counts",)}
+
+
+# The report section a question's result belongs to (supporting queries feed
+# the chart of another question)
+def _section(question_id):
+    figure = figures.FIGURES.get(question_id)
+    return figure.section if figure is not None else question_id
+
+
+def _run_question(pool, question_id):
+    started = time.perf_counter()
+    with pool.connection() as conn:
+        result = queries.run(conn, question_id)
+    return result, time.perf_counter() - started
+
+
+# What to draw for a question's result, as (section, draw, data, figsize,
+# options), or None when it has no chart or nothing to plot
+def chart_job(question_id, result, budget=charts.DEFAULT_POINT_BUDGET):
+    question = queries.QUESTIONS[question_id]
+    if result is None:
+        return None
+    if question.chart is not None:
+        data = question.chart_data(result, budget)
+        return question_id, charts.draw_spec, data, SPEC_FIGSIZE, {"spec": question.chart}
+    figure = figures.FIGURES.get(question_id)
+    if figure is None:
+        return None
+    data, options = figure.data(result)
+    if len(data) == 0:
+        return None
+    return figure.section, figure.draw, data, figure.figsize, options
+
+
+# -- chart worker processes -----------------------------------------------
+
+_renderer = None
+
+
+def _init_worker(fmt, dpi):
+    global _renderer
+    _renderer = charts.ChartRenderer(max_entries=1, fmt=fmt, dpi=dpi)
+
+
+def _render(chart_id, draw, data, figsize, options):
+    started = time.perf_counter()
+    image = _renderer.render(chart_id, draw, data, figsize, **options)
+    return image, time.perf_counter() - started
+
+
+# -- running --------------------------------------------------------------
+
+
+def build_report(db_path, workers=None, fmt="png", dpi=100, budget=charts.DEFAULT_POINT_BUDGET):
+    workers = workers or os.cpu_count() or 1
+    migrate(db_path)
+    results, errors, query_times, images, chart_times = {}, {}, {}, {}, {}
+    with ConnectionPool(db_path, size=workers) as pool, \
+            ThreadPoolExecutor(workers, thread_name_prefix="report-query") as threads, \
+            ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(fmt, dpi)) as processes:
+        pending_queries = {threads.submit(_run_question, pool, qid): qid for qid in queries.QUESTIONS}
+        pending_charts = {}
+        for future in as_completed(pending_queries):
+            question_id = pending_queries[future]
+            try:
+                results[question_id], query_times[question_id] = future.result()
+            except Exception as exc:
+                errors[_section(question_id)] = f"{question_id}: {type(exc).__name__}: {exc}"
+                continue
+            job = chart_job(question_id, results[question_id], budget)
+            if job is not None:
+                section, draw, data, figsize, options = job
+                pending_charts[processes.submit(_render, section, draw, data, figsize, options)] = section
+        for future in as_completed(pending_charts):
+            section = pending_charts[future]
+            try:
+                images[section], chart_times[section] = future.result()
+            except Exception as exc:
+                errors[section] = f"chart failed: {type(exc).__name__}: {exc}"
+
+    sections = []
+    for question in queries.BY_TITLE.values():
+        table = text = None
+        if question.id in results:
+            page = views.view(question.id, results[question.id],
+                              *(results.get(other) for other in VIEW_RESULTS.get(question.id, ())))
+            table, text = page.table, page.text
+        sections.append(Section(
+            question, table, text, query_times.get(question.id), errors.get(question.id),
+            images.get(question.id), chart_times.get(question.id),
+        ))
+    return sections
+
+
+# The analysis markdown as plain paragraphs (Streamlit escapes and emphasis removed)
+def _paragraphs(text):
+    text = text.replace("\\n", "\n").replace("\\$", "$").replace("**", "")
+    lines = (" ".join(line.split()).strip("-•# ") for line in text.splitlines())
+    return [line for line in lines if line]
+
+
+# -- HTML -----------------------------------------------------------------
+
+HTML_STYLE = """
+body { font-family: sans-serif; margin: 2em auto; max-width: 1100px; color: #222; }
+h2 { border-bottom: 1px solid #ccc; padding-bottom: .2em; margin-top: 2em; }
+table { border-collapse: collapse; font-size: 13px; }
+th, td { border: 1px solid #ddd; padding: 3px 6px; text-align: left; }
+th { background: #f3f3f3; }
+img, svg { max-width: 100%; height: auto; }
+.meta { color: #777; font-size: 12px; }
+.error { color: #b00; }
+.analysis p { margin: .3em 0; }
+"""
+
+
+def _html_image(image, fmt):
+    if fmt == "svg":
+        return image.decode()
+    return f'<img alt="chart" src="data:{charts.FORMATS[fmt]};base64,{base64.b64encode(image).decode()}">'
+
+
+def render_html(sections, db_path, fmt="png"):
+    parts = [
+        "<!DOCTYPE html>", '<html><head><meta charset="utf-8">',
+        "<title>Books Data Analysis</title>", f"<style>{HTML_STYLE}</style></head><body>",
+        "<h1>Books Data Analysis</h1>",
+        f'<p class="meta">{html.escape(os.path.abspath(db_path))}, generated {datetime.now():%Y-%m-%d %H:%M}</p>',
+        "<ol>",
+    ]
+    parts += [f'<li><a href="#{s.question.id}">{html.escape(s.question.title)}</a></li>' for s in sections]
+    parts.append("</ol>")
+    for section in sections:
+        question = section.question
+        parts.append(f'<h2 id="{question.id}">{html.escape(question.title)}</h2>')
+        if section.error:
+            parts.append(f'<p class="error">{html.escape(section.error)}</p>')
+        if section.table is not None:
+            frame = section.table
+            timing = f"query {section.query_s * 1e3:.1f} ms"
+            if section.chart_s is not None:
+                timing += f", chart {section.chart_s * 1e3:.1f} ms"
+            parts.append(f'<p class="meta">{len(frame)} rows; {timing}</p>')
+            parts.append(frame.to_html(index=False, max_rows=MAX_TABLE_ROWS, na_rep="", border=0))
+        if section.chart is not None:
+            parts.append(_html_image(section.chart, fmt))
+        if section.text:
+            parts.append('<div class="analysis">')
+            parts += [f"<p>{html.escape(line)}</p>" for line in _paragraphs(section.text)]
+            parts.append("</div>")
+    parts.append("</body></html>")
+    return "\n".join(parts)
+
+
+# -- PDF ------------------------------------------------------------------
+
+# Rows per result table on a PDF page, and characters per cell
+PDF_TABLE_ROWS = 15
+PDF_CELL_CHARS = 40
+
+
+def _cell(value):
+    text = "" if pd.isna(value) else str(value)
+    return text if len(text) <= PDF_CELL_CHARS else text[:PDF_CELL_CHARS - 1] + "…"
+
+
+# One A4 page per question: title, the head of the result, the chart and
+# the analysis text. Charts must be PNG here (they are placed as images).
+def write_pdf(sections, path):
+    import matplotlib.image
+    from matplotlib.backends.backend_pdf import PdfPages
+    from matplotlib.figure import Figure
+
+    with PdfPages(path) as pdf:
+        for section in sections:
+            fig = Figure(figsize=(8.27, 11.69))
+            fig.text(0.05, 0.97, section.question.title, fontsize=12, weight="bold", va="top", wrap=True)
+            if section.error:
+                fig.text(0.05, 0.93, section.error, color="#b00", fontsize=9, va="top", wrap=True)
+            if section.table is not None:
+                frame = section.table
+                fig.text(0.05, 0.93, f"{len(frame)} rows", fontsize=9, color="#777", va="top")
+                head = frame.head(PDF_TABLE_ROWS)
+                if len(head):
+                    ax = fig.add_axes([0.05, 0.55, 0.9, 0.36])
+                    ax.axis("off")
+                    table = ax.table(
+                        cellText=[[_cell(v) for v in row] for row in head.itertuples(index=False)],
+                        colLabels=list(head.columns), loc="upper center", cellLoc="left",
+                    )
+                    table.auto_set_font_size(False)
+                    table.set_fontsize(7)
+            if section.text:
+                fig.text(0.05, 0.53, "\n".join(_paragraphs(section.text)), fontsize=7, va="top", wrap=True)
+            if section.chart is not None:
+                ax = fig.add_axes([0.05, 0.03, 0.9, 0.36])
+                ax.imshow(matplotlib.image.imread(io.BytesIO(section.chart), format="png"))
+                ax.axis("off")
+            pdf.savefig(fig)
+            fig.clear()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a static report of every dashboard question.")
+    parser.add_argument("--db", default="books_database.db")
+    parser.add_argument("--output", default="report.html", help="report file (.html, or .pdf)")
+    parser.add_argument("--workers", type=int, default=None, help="query threads and chart processes (default: CPUs)")
+    parser.add_argument("--dpi", type=int, default=100)
+    parser.add_argument("--svg", action="store_true", help="embed SVG charts instead of PNG (HTML only)")
+    args = parser.parse_args(argv)
+    pdf = args.output.lower().endswith(".pdf")
+    if pdf and args.svg:
+        parser.error("--svg is only supported for HTML reports")
+    fmt = "svg" if args.svg else "png"
+
+    started = time.perf_counter()
+    sections = build_report(args.db, args.workers, fmt, args.dpi)
+    if pdf:
+        write_pdf(sections, args.output)
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(render_html(sections, args.db, fmt))
+
+    elapsed = time.perf_counter() - started
+    timed = [(s.query_s + (s.chart_s or 0), s.question.id) for s in sections if s.query_s is not None]
+    slowest_s, slowest = max(timed) if timed else (0.0, "-")
+    print(f"wrote {args.output} in {elapsed:.2f}s "
+          f"(sum of questions {sum(t for t, _ in timed):.2f}s, slowest {slowest} {slowest_s:.2f}s)", file=sys.stderr)
+    failed = [s.question.id for s in sections if s.error]
+    if failed:
+        parser.exit(1, f"failed: {', '.join(failed)}\n")
+
+
+if __name__ == "__main__":
+    main()
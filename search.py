@@ -0,0 +1,115 @@
+"""
+Full-text search over the books catalog (SQLite FTS5).
+
+`books_fts` is an external-content index over the title, subtitle, description
+and category of each book. It stores no copy of the text and is kept in sync
+with `books` by triggers. Queries use the FTS5 syntax (terms, "phrases",
+prefix*, AND/OR/NOT, `column : term`) and are always passed as bound
+parameters.
+"""
+
+import sqlite3
+
+
+INDEXED_COLUMNS = ("book_title", "book_subtitle", "book_description", "categories")
+
+# bm25() weights, in INDEXED_COLUMNS order: a hit in the title counts most
+BM25_WEIGHTS = (10.0, 4.0, 1.0, 2.0)
+
+
+def install(conn):
+    columns = ", ".join(INDEXED_COLUMNS)
+    new_values = ", ".join(f"NEW.{c}" for c in INDEXED_COLUMNS)
+    old_values = ", ".join(f"OLD.{c}" for c in INDEXED_COLUMNS)
+    conn.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+            {columns},
+            content='books', content_rowid='rowid',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS books_fts_insert AFTER INSERT ON books BEGIN
+            INSERT INTO books_fts (rowid, {columns}) VALUES (NEW.rowid, {new_values});
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS books_fts_delete AFTER DELETE ON books BEGIN
+            INSERT INTO books_fts (books_fts, rowid, {columns}) VALUES ('delete', OLD.rowid, {old_values});
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS books_fts_update AFTER UPDATE OF {columns} ON books BEGIN
+            INSERT INTO books_fts (books_fts, rowid, {columns}) VALUES ('delete', OLD.rowid, {old_values});
+            INSERT INTO books_fts (rowid, {columns}) VALUES (NEW.rowid, {new_values});
+        END
+    """)
+    rebuild(conn)
+
+
+# Re-read every row of `books` into the index. Needed after a VACUUM, which
+# may renumber the implicit rowids the index is keyed on.
+def rebuild(conn):
+    conn.execute("INSERT INTO books_fts (books_fts) VALUES ('rebuild')")
+
+
+# Ranked matches with a highlighted excerpt from the best-matching column
+SEARCH_SQL = f"""
+    SELECT
+        b.book_title,
+        snippet(books_fts, -1, '«', '»', '…', 12) AS excerpt,
+        bm25(books_fts, {", ".join(map(str, BM25_WEIGHTS))}) AS rank
+    FROM books_fts
+    JOIN books AS b ON b.rowid = books_fts.rowid
+    WHERE books_fts MATCH ?
+    ORDER BY rank
+    LIMIT ?;
+"""
+
+# Books matching a lookup, best first, as (book_id, title, authors, year)
+LOOKUP_SQL = f"""
+    SELECT b.book_id, b.book_title, b.book_authors, b.year
+    FROM books_fts
+    JOIN books AS b ON b.rowid = books_fts.rowid
+    WHERE books_fts MATCH ?
+    ORDER BY bm25(books_fts, {", ".join(map(str, BM25_WEIGHTS))})
+    LIMIT ?;
+"""
+
+# Python / Data Science / both / neither title counts in a single pass over books
+KEYWORD_COUNTS_SQL = """
+    WITH
+        python AS (SELECT rowid FROM books_fts WHERE books_fts MATCH ?),
+        data_science AS (SELECT rowid FROM books_fts WHERE books_fts MATCH ?)
+    SELECT
+        COALESCE(SUM(p AND NOT d), 0),
+        COALESCE(SUM(d AND NOT p), 0),
+        COALESCE(SUM(p AND d), 0),
+        COALESCE(SUM(NOT p AND NOT d), 0)
+    FROM (
+        SELECT rowid IN python AS p, rowid IN data_science AS d FROM books
+    );
+"""
+
+PYTHON_IN_TITLE = "book_title : python*"
+DATA_SCIENCE_IN_TITLE = 'book_title : "data science"'
+
+# Title-only presets offered next to the free-text box
+KEYWORD_PRESETS = {
+    "Python": f"{PYTHON_IN_TITLE} NOT {DATA_SCIENCE_IN_TITLE}",
+    "Data Science": f"{DATA_SCIENCE_IN_TITLE} NOT {PYTHON_IN_TITLE}",
+    "Python & Data Science": f"{PYTHON_IN_TITLE} AND {DATA_SCIENCE_IN_TITLE}",
+}
+
+
+# Fallback for input that is not valid FTS5 syntax: match every word literally
+def quote_terms(text):
+    terms = ['"{}"'.format(term.replace('"', '""')) for term in text.split()]
+    return " ".join(terms)
+
+
+def is_syntax_error(exc):
+    return isinstance(exc, sqlite3.OperationalError) and (
+        "fts5" in str(exc) or "syntax error" in str(exc) or "no such column" in str(exc)
+        or "unterminated string" in str(exc)
+    )
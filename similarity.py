@@ -0,0 +1,635 @@
+"""
+"Similar books": the nearest neighbours of every book by its text.
+
+Every book is a hashing TF-IDF vector over its title, subtitle, categories and
+description. Words are hashed (crc32) into N_FEATURES columns, so there is no
+vocabulary to build or keep in sync, weighted by sublinear term frequency
+times inverse document frequency, and scaled to unit length: the cosine
+similarity of two books is the dot product of their vectors. Words found in
+fewer than MIN_DF books (they match nothing) or in more than MAX_DF of the
+catalog (they match everything) are left out, and a book keeps its MAX_TERMS
+strongest terms.
+
+The K most similar books of every book are precomputed and stored in a
+sidecar SQLite file next to the database (books_database.similar.db), so the
+similar titles of a book are a primary-key lookup. The build is chunked: the
+books are vectorised a chunk at a time, then the neighbours of each chunk are
+accumulated through an inverted index (feature -> books) holding only the
+candidates that share a term, in a process pool across the cores.
+
+Updates are incremental. New books and books whose text changed (found via
+books.content_hash) are vectorised and searched; books whose lists named them
+are searched again; every other book merges in the changed books that beat
+its current K-th neighbour. Document frequencies are those of the last full
+build plus the books vectorised since; `--rebuild` recomputes them.
+
+Usage: python similarity.py [--db books_database.db] [--rebuild] [--workers N] [--k 10]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import sqlite3
+import sys
+import time
+import zlib
+from collections import Counter, deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from functools import lru_cache
+
+import numpy as np
+
+from migrations import content_hash, migrate
+
+
+# Bump when the vectors change meaning; an index of another version is rebuilt
+INDEX_VERSION = 1
+
+N_FEATURES = 1 << 20
+
+# Text columns and how much each occurrence of a word in them counts
+TEXT_WEIGHTS = {"book_title": 3, "book_subtitle": 2, "categories": 2, "book_description": 1}
+
+TOKEN_RE = re.compile(r"[^\W_]{2,}")
+
+STOP_WORDS = frozenset("""
+    about after all also an and any are as at be been but by can do does each for from has have how
+    if in into is it its more most new not of on one or other our out over so such than that the
+    their them then there these they this through to up use using was we what when which while who
+    will with within you your
+""".split())
+
+K = 10
+MAX_TERMS = 48
+MIN_DF = 2
+MAX_DF = 0.1
+MAX_BOOKS = 1000
+
+# Books per vectorising task and per search task, and the candidate (book,
+# neighbour) pairs accumulated at once
+VECTOR_CHUNK = 2000
+SEARCH_CHUNK = 1000
+PAIR_BUDGET = 4_000_000
+
+# The products of a batch are summed into a dense (query, book) block instead
+# of sorted when the block has at most DENSE_RATIO cells per product (and at
+# most DENSE_CELLS cells)
+DENSE_RATIO = 8
+DENSE_CELLS = 1 << 24
+
+TEXT_SQL = f"SELECT book_id, content_hash, {', '.join(TEXT_WEIGHTS)} FROM books ORDER BY rowid"
+
+TEXT_BY_ID_SQL = f"""
+    SELECT book_id, content_hash, {', '.join(TEXT_WEIGHTS)}
+    FROM books
+    WHERE book_id IN (SELECT value FROM json_each(?))
+"""
+
+INDEX_DDL = """
+    CREATE TABLE meta (key TEXT PRIMARY KEY, value);
+    CREATE TABLE vectors (
+        doc INTEGER PRIMARY KEY,
+        book_id TEXT NOT NULL UNIQUE,
+        row_hash TEXT,          -- books.content_hash when vectorised
+        text_hash TEXT NOT NULL,
+        features BLOB NOT NULL, -- int32 feature ids, strongest first
+        weights BLOB NOT NULL   -- float32, unit length
+    );
+    CREATE TABLE neighbors (
+        doc INTEGER NOT NULL,
+        rank INTEGER NOT NULL,
+        neighbor INTEGER NOT NULL,
+        score REAL NOT NULL,
+        PRIMARY KEY (doc, rank)
+    ) WITHOUT ROWID;
+    CREATE INDEX neighbors_neighbor ON neighbors (neighbor);
+"""
+
+NEIGHBORS_SQL = """
+    SELECT other.book_id, n.score
+    FROM vectors AS v
+    JOIN neighbors AS n ON n.doc = v.doc
+    JOIN vectors AS other ON other.doc = n.neighbor
+    WHERE v.book_id = ?
+    ORDER BY n.rank
+    LIMIT ?;
+"""
+
+# Details of books by id, in the order of the JSON array of ids
+BOOKS_SQL = """
+    SELECT
+        b.book_id, b.book_title, b.book_subtitle, b.book_authors, b.book_publisher, b.year,
+        b.categories, b.pageCount, b.averageRating, b.ratingsCount,
+        b.amount_retailPrice, b.currencyCode_retailPrice, b.imageLinks, b.book_description
+    FROM json_each(?) AS j
+    JOIN books AS b ON b.book_id = j.value
+    ORDER BY j.key;
+"""
+
+# Term counts of a chunk of books: terms per book, then their feature ids and
+# counts, book after book
+Counts = namedtuple("Counts", ["lengths", "features", "counts"])
+
+# Rows of unit vectors: book `doc` has features[indptr[doc]:indptr[doc + 1]]
+Matrix = namedtuple("Matrix", ["indptr", "features", "weights"])
+
+# The same entries by feature: feature `f` is in books docs[ptr[f]:ptr[f + 1]]
+Postings = namedtuple("Postings", ["ptr", "docs", "weights"])
+
+# What an update did: books vectorised for the first time, re-vectorised,
+# dropped, and the books whose neighbours were searched again
+Update = namedtuple("Update", ["added", "changed", "removed", "searched"])
+
+
+def index_path(db_path):
+    return os.path.splitext(db_path)[0] + ".similar.db"
+
+
+def available(db_path):
+    return os.path.exists(index_path(db_path))
+
+
+# The K most similar books of a book as (book_id, score), best first; None
+# when the index has not been built
+def similar(db_path, book_id, k=K):
+    path = index_path(db_path)
+    if not os.path.exists(path):
+        return None
+    with closing(sqlite3.connect(f"file:{path}?mode=ro", uri=True)) as conn:
+        return conn.execute(NEIGHBORS_SQL, (book_id, k)).fetchall()
+
+
+# -- vectors --------------------------------------------------------------
+
+@lru_cache(maxsize=1 << 18)
+def _feature(word):
+    return zlib.crc32(word.encode()) & (N_FEATURES - 1)
+
+
+# Weighted word counts of a book's text columns, by feature
+def term_counts(texts):
+    counts = Counter()
+    for text, weight in zip(texts, TEXT_WEIGHTS.values()):
+        if text:
+            for word, n in Counter(TOKEN_RE.findall(text.lower())).items():
+                if word not in STOP_WORDS:
+                    counts[_feature(word)] += n * weight
+    return counts
+
+
+# Vectorising task: the text hashes and term counts of (book_id, row_hash,
+# *texts) rows
+def _count_chunk(rows):
+    text_hashes, lengths, features, counts = [], [], [], []
+    for row in rows:
+        texts = row[2:]
+        terms = term_counts(texts)
+        text_hashes.append(content_hash(*texts))
+        lengths.append(len(terms))
+        features.extend(terms)
+        counts.extend(terms.values())
+    return text_hashes, Counts(
+        np.array(lengths, dtype=np.int64), np.array(features, dtype=np.int32), np.array(counts, dtype=np.float32),
+    )
+
+
+def _concat_counts(parts):
+    if not parts:
+        return Counts(np.zeros(0, np.int64), np.zeros(0, np.int32), np.zeros(0, np.float32))
+    return Counts(*(np.concatenate(column) for column in zip(*parts)))
+
+
+def _indptr(lengths):
+    indptr = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=indptr[1:])
+    return indptr
+
+
+# TF-IDF unit vectors of counted books, keeping each book's `max_terms`
+# strongest usable terms
+def weigh(counts, doc_freq, n_books, max_terms=MAX_TERMS, max_df=MAX_DF):
+    n_rows = len(counts.lengths)
+    rows = np.repeat(np.arange(n_rows), counts.lengths)
+    df = doc_freq[counts.features]
+    weights = (1 + np.log(counts.counts)) * (np.log((1 + n_books) / (1 + df)) + 1)
+    usable = (df >= MIN_DF) & (df <= max(min(max_df * n_books, MAX_BOOKS), MIN_DF))
+
+    order = np.lexsort((-weights, rows))  # by book, strongest term first
+    order = order[usable[order]]
+    first = np.searchsorted(rows[order], np.arange(n_rows))
+    rank = np.arange(len(order)) - first[rows[order]]
+    keep = order[rank < max_terms]
+
+    kept_rows = rows[keep]
+    kept = weights[keep].astype(np.float32)
+    norms = np.sqrt(np.bincount(kept_rows, kept.astype(np.float64) ** 2, minlength=n_rows))
+    kept /= norms[kept_rows].astype(np.float32)
+    return Matrix(_indptr(np.bincount(kept_rows, minlength=n_rows)), counts.features[keep], kept)
+
+
+def invert(matrix):
+    rows = np.repeat(np.arange(len(matrix.indptr) - 1, dtype=np.int32), np.diff(matrix.indptr))
+    order = np.argsort(matrix.features, kind="stable")
+    ptr = np.searchsorted(matrix.features[order], np.arange(N_FEATURES + 1))
+    return Postings(ptr, rows[order], matrix.weights[order])
+
+
+# -- search ---------------------------------------------------------------
+
+# Positions starts[i] .. starts[i] + lengths[i] - 1 of every range, concatenated
+def _ranges(starts, lengths):
+    offsets = np.cumsum(lengths) - lengths
+    return np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())
+
+
+# Top-k neighbours of the `docs` books as (doc, neighbour, score) arrays, by
+# doc then best first. With `floor` (the k-th score of every book's current
+# list), also the (book, doc, score) entries where a searched doc now beats
+# another book's k-th neighbour.
+def _search_batch(matrix, postings, docs, k, floor=None):
+    n_docs = len(matrix.indptr) - 1
+    lengths = matrix.indptr[docs + 1] - matrix.indptr[docs]
+    terms = _ranges(matrix.indptr[docs], lengths)
+    features = matrix.features[terms]
+    starts = postings.ptr[features]
+    hits_per_term = postings.ptr[features + 1] - starts
+    hits = _ranges(starts, hits_per_term)
+    query = np.repeat(np.repeat(np.arange(len(docs), dtype=np.int64), lengths), hits_per_term)
+    products = np.repeat(matrix.weights[terms], hits_per_term) * postings.weights[hits]
+    keys = query * n_docs + postings.docs[hits]
+    cells = len(docs) * n_docs
+    entries = None
+
+    # The dot products are the sums of the products per (query, book) key
+    if len(keys) == 0:
+        query, other, scores = np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros(0)
+    elif cells <= min(DENSE_RATIO * len(keys), DENSE_CELLS):
+        # A score for every (query, book) cell; keep the cells that reach
+        # the query's k-th best
+        block = np.bincount(keys, products, minlength=cells).reshape(len(docs), n_docs)
+        block[np.arange(len(docs)), docs] = 0
+        kth = np.partition(block, n_docs - k, axis=1)[:, n_docs - k] if n_docs > k else np.zeros(len(docs))
+        query, other = np.nonzero((block >= kth[:, None]) & (block > 0))
+        scores = block[query, other]
+        if floor is not None:
+            beat_query, beat_other = np.nonzero(block > floor)
+            entries = (beat_other, docs[beat_query], block[beat_query, beat_other])
+    else:
+        # Sparse: sort the keys and add up the runs of equal keys
+        order = np.argsort(keys)
+        keys = keys[order]
+        first = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+        scores = np.add.reduceat(products[order], first)
+        query, other = np.divmod(keys[first], n_docs)
+        distinct = other != docs[query]
+        query, other, scores = query[distinct], other[distinct], scores[distinct]
+        if floor is not None:
+            beats = scores > floor[other]
+            entries = (other[beats], docs[query[beats]], scores[beats])
+
+    # Best first within each query (scores are at most 1); the stable sort
+    # keeps ties in book order
+    order = np.argsort(query * 4.0 - scores, kind="stable")
+    query, other, scores = query[order], other[order], scores[order]
+    rank = np.arange(len(query)) - np.searchsorted(query, np.arange(len(docs)))[query]
+    top = rank < k
+    if floor is not None and entries is None:
+        entries = (np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros(0))
+    return (docs[query[top]], other[top], scores[top]), entries
+
+
+def search(matrix, postings, docs, k, floor=None, budget=PAIR_BUDGET):
+    lengths = matrix.indptr[docs + 1] - matrix.indptr[docs]
+    terms = _ranges(matrix.indptr[docs], lengths)
+    features = matrix.features[terms]
+    hits = postings.ptr[features + 1] - postings.ptr[features]
+    pairs = np.cumsum(np.bincount(np.repeat(np.arange(len(docs)), lengths), hits, minlength=len(docs)))
+    results, entries = [], []
+    start = 0
+    while start < len(docs):
+        done = pairs[start - 1] if start else 0
+        end = max(int(np.searchsorted(pairs, done + budget, side="right")), start + 1)
+        result, beats = _search_batch(matrix, postings, docs[start:end], k, floor)
+        results.append(result)
+        if beats is not None:
+            entries.append(beats)
+        start = end
+    return _concat(results), _concat(entries) if floor is not None else None
+
+
+def _concat(parts):
+    if not parts:
+        return np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros(0, np.float64)
+    return tuple(np.concatenate(column) for column in zip(*parts))
+
+
+# -- worker processes -----------------------------------------------------
+
+# (matrix, postings, k, floor) of the running search, inherited by forked
+# workers or sent once to each worker
+_shared = None
+
+
+def _share(shared):
+    global _shared
+    _shared = shared
+
+
+def _search_task(docs):
+    matrix, postings, k, floor = _shared
+    return search(matrix, postings, docs, k, floor)
+
+
+# `fn` over the chunks, in order, in a pool of `workers` processes (in this
+# process when there is one worker). At most two chunks per worker are in
+# flight, so the input is read as it is consumed.
+def _map(fn, chunks, workers, shared=None):
+    _share(shared)
+    if workers <= 1:
+        yield from map(fn, chunks)
+        return
+    if "fork" in multiprocessing.get_all_start_methods():
+        executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("fork"))
+    else:
+        executor = ProcessPoolExecutor(workers, initializer=_share, initargs=(shared,))
+    with executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(fn, chunk))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _chunks(cursor, size):
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            return
+        yield rows
+
+
+def _neighbours(matrix, docs, k, workers, floor=None, progress=None):
+    postings = invert(matrix)
+    chunks = [docs[start:start + SEARCH_CHUNK] for start in range(0, len(docs), SEARCH_CHUNK)]
+    results, entries = [], []
+    for done, (result, beats) in enumerate(_map(_search_task, chunks, workers, (matrix, postings, k, floor)), 1):
+        results.append(result)
+        if beats is not None:
+            entries.append(beats)
+        if progress:
+            progress("searched", min(done * SEARCH_CHUNK, len(docs)), len(docs), final=done == len(chunks))
+    return _concat(results), _concat(entries)
+
+
+# -- building -------------------------------------------------------------
+
+def _write_neighbours(conn, result):
+    docs, others, scores = result
+    rank = np.arange(len(docs)) - np.searchsorted(docs, docs)
+    conn.executemany(
+        "INSERT INTO neighbors (doc, rank, neighbor, score) VALUES (?, ?, ?, ?)",
+        zip(docs.tolist(), rank.tolist(), others.tolist(), scores.tolist()),
+    )
+
+
+def _vector_rows(docs, book_ids, row_hashes, text_hashes, matrix):
+    for doc, book_id, row_hash, text_hash, start, end in zip(
+        docs, book_ids, row_hashes, text_hashes, matrix.indptr[:-1].tolist(), matrix.indptr[1:].tolist(),
+    ):
+        yield doc, book_id, row_hash, text_hash, matrix.features[start:end].tobytes(), matrix.weights[start:end].tobytes()
+
+
+def _write_meta(conn, k, doc_freq, n_books):
+    conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", [
+        ("version", INDEX_VERSION), ("n_features", N_FEATURES), ("k", k),
+        ("n_books", n_books), ("doc_freq", doc_freq.astype(np.int32).tobytes()),
+    ])
+
+
+# Vectorise every book and search the neighbours of all of them, into a new
+# index file that replaces the old one when complete
+def build(db_path, k=K, workers=None, progress=None):
+    workers = workers or os.cpu_count() or 1
+    migrate(db_path)
+    book_ids, row_hashes, text_hashes, parts = [], [], [], []
+    with closing(sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)) as conn:
+        total = conn.execute("SELECT count(*) FROM books").fetchone()[0]
+        chunks = _chunks(conn.execute(TEXT_SQL), VECTOR_CHUNK)
+
+        def remember(rows):
+            book_ids.extend(row[0] for row in rows)
+            row_hashes.extend(row[1] for row in rows)
+            return rows
+
+        for hashes, counts in _map(_count_chunk, map(remember, chunks), workers):
+            text_hashes.extend(hashes)
+            parts.append(counts)
+            if progress:
+                progress("vectorised", len(text_hashes), total, final=len(text_hashes) == total)
+
+    counts = _concat_counts(parts)
+    doc_freq = np.bincount(counts.features, minlength=N_FEATURES)
+    matrix = weigh(counts, doc_freq, len(book_ids))
+    docs = np.arange(len(book_ids))
+    result, _ = _neighbours(matrix, docs, k, workers, progress=progress)
+
+    path = index_path(db_path)
+    building = path + ".building"
+    if os.path.exists(building):
+        os.remove(building)
+    with closing(sqlite3.connect(building)) as index:
+        index.executescript(INDEX_DDL)
+        with index:
+            _write_meta(index, k, doc_freq, len(book_ids))
+            index.executemany(
+                "INSERT INTO vectors VALUES (?, ?, ?, ?, ?, ?)",
+                _vector_rows(docs.tolist(), book_ids, row_hashes, text_hashes, matrix),
+            )
+            _write_neighbours(index, result)
+    os.replace(building, path)
+    return Update(len(book_ids), 0, 0, len(book_ids))
+
+
+# -- incremental updates --------------------------------------------------
+
+def _load_matrix(index, size):
+    lengths = np.zeros(size, dtype=np.int64)
+    features, weights = [], []
+    for doc, doc_features, doc_weights in index.execute("SELECT doc, features, weights FROM vectors ORDER BY doc"):
+        lengths[doc] = len(doc_features) // 4
+        features.append(doc_features)
+        weights.append(doc_weights)
+    return Matrix(
+        _indptr(lengths),
+        np.frombuffer(b"".join(features), dtype=np.int32), np.frombuffer(b"".join(weights), dtype=np.float32),
+    )
+
+
+# `matrix` with the rows of `docs` replaced by the rows of `rows` (a Matrix
+# over those docs, in the same order), grown to `size` rows
+def _replace_rows(matrix, size, docs, rows):
+    lengths = np.zeros(size, dtype=np.int64)
+    lengths[:len(matrix.indptr) - 1] = np.diff(matrix.indptr)
+    kept = np.ones(len(matrix.features), dtype=bool)
+    old = docs[docs < len(matrix.indptr) - 1]
+    kept[_ranges(matrix.indptr[old], lengths[old])] = False
+    lengths[docs] = np.diff(rows.indptr)
+
+    row_of_entry = np.concatenate([
+        np.repeat(np.arange(len(matrix.indptr) - 1), np.diff(matrix.indptr))[kept],
+        np.repeat(docs, np.diff(rows.indptr)),
+    ])
+    order = np.argsort(row_of_entry, kind="stable")
+    return Matrix(
+        _indptr(lengths),
+        np.concatenate([matrix.features[kept], rows.features])[order],
+        np.concatenate([matrix.weights[kept], rows.weights])[order],
+    )
+
+
+# Bring the index in line with the books table: vectorise new and edited
+# books, drop deleted ones and refresh the neighbour lists they affect. Builds
+# the index when there is none (or it is from another version).
+def update(db_path, workers=None, progress=None, rebuild=False, k=K):
+    path = index_path(db_path)
+    if rebuild or not os.path.exists(path):
+        return build(db_path, k, workers, progress)
+    workers = workers or os.cpu_count() or 1
+    migrate(db_path)
+    with closing(sqlite3.connect(path)) as index, \
+            closing(sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)) as conn:
+        meta = dict(index.execute("SELECT key, value FROM meta"))
+        if meta.get("version") != INDEX_VERSION or meta.get("n_features") != N_FEATURES:
+            index.close()
+            return build(db_path, k, workers, progress)
+        k = meta["k"]
+        stored = {row[0]: row[1:] for row in index.execute("SELECT book_id, doc, row_hash, text_hash FROM vectors")}
+        current = dict(conn.execute("SELECT book_id, content_hash FROM books"))
+        removed = [stored[book_id][0] for book_id in stored.keys() - current.keys()]
+        candidates = [book_id for book_id, row_hash in current.items()
+                      if book_id not in stored or stored[book_id][1] != row_hash]
+        if not removed and not candidates:
+            return Update(0, 0, 0, 0)
+
+        # Vectorise the candidates; those whose text is unchanged only get
+        # their new row hash
+        rows, touched = [], []
+        for start in range(0, len(candidates), VECTOR_CHUNK):
+            rows += conn.execute(TEXT_BY_ID_SQL, (json.dumps(candidates[start:start + VECTOR_CHUNK]),)).fetchall()
+        chunks = [rows[start:start + VECTOR_CHUNK] for start in range(0, len(rows), VECTOR_CHUNK)]
+        new_rows, parts = [], []
+        for chunk, (hashes, counts) in zip(chunks, _map(_count_chunk, chunks, workers)):
+            offsets = _indptr(counts.lengths)
+            for row, text_hash, start, end in zip(chunk, hashes, offsets[:-1], offsets[1:]):
+                book_id, row_hash = row[:2]
+                if book_id in stored and stored[book_id][2] == text_hash:
+                    touched.append((row_hash, stored[book_id][0]))
+                else:
+                    new_rows.append((book_id, row_hash, text_hash))
+                    parts.append(Counts(
+                        np.array([end - start]), counts.features[start:end], counts.counts[start:end],
+                    ))
+
+        size = int(index.execute("SELECT coalesce(max(doc) + 1, 0) FROM vectors").fetchone()[0])
+        docs = []
+        for book_id, _, _ in new_rows:
+            if book_id in stored:
+                docs.append(stored[book_id][0])
+            else:
+                docs.append(size)
+                size += 1
+        docs = np.array(docs, dtype=np.int64)
+        added = sum(book_id not in stored for book_id, _, _ in new_rows)
+
+        counts = _concat_counts(parts)
+        doc_freq = np.frombuffer(meta["doc_freq"], dtype=np.int32).astype(np.int64)
+        doc_freq += np.bincount(counts.features, minlength=N_FEATURES)
+        rows_matrix = weigh(counts, doc_freq, len(current))
+        gone = np.array(removed, dtype=np.int64)
+        matrix = _replace_rows(
+            _load_matrix(index, size), size, np.concatenate([docs, gone]),
+            Matrix(
+                np.concatenate([rows_matrix.indptr, np.full(len(gone), rows_matrix.indptr[-1])]),
+                rows_matrix.features, rows_matrix.weights,
+            ),
+        )
+
+        # Books whose lists named a changed or removed book are searched
+        # again; the rest keep their lists and merge in better matches
+        changed = np.concatenate([docs, gone])
+        stale = np.array(sorted({doc for (doc,) in index.execute(
+            "SELECT DISTINCT doc FROM neighbors WHERE neighbor IN (SELECT value FROM json_each(?))",
+            (json.dumps(changed.tolist()),),
+        )} - set(changed.tolist())), dtype=np.int64)
+        floor = np.zeros(size)
+        for doc, score in index.execute("SELECT doc, score FROM neighbors WHERE rank = ?", (k - 1,)):
+            floor[doc] = score
+        searched = np.concatenate([docs, stale])
+        result, entries = _neighbours(matrix, np.sort(searched), k, workers, floor, progress)
+        result = _merge(index, result, entries, docs, np.union1d(searched, gone), k)
+
+        with index:
+            index.executemany("UPDATE vectors SET row_hash = ? WHERE doc = ?", touched)
+            affected = json.dumps(np.union1d(np.union1d(searched, gone), result[0]).tolist())
+            index.execute("DELETE FROM neighbors WHERE doc IN (SELECT value FROM json_each(?))", (affected,))
+            index.execute("DELETE FROM vectors WHERE doc IN (SELECT value FROM json_each(?))",
+                          (json.dumps(changed.tolist()),))
+            index.executemany(
+                "INSERT INTO vectors VALUES (?, ?, ?, ?, ?, ?)",
+                _vector_rows(
+                    docs.tolist(), [row[0] for row in new_rows], [row[1] for row in new_rows],
+                    [row[2] for row in new_rows], rows_matrix,
+                ),
+            )
+            _write_neighbours(index, result)
+            _write_meta(index, k, doc_freq, len(current))
+        return Update(added, len(new_rows) - added, len(removed), len(searched))
+
+
+# Search results plus the lists of the other books that gained entries: their
+# stored list and the entries of the re-vectorised `docs`, best k. Books in
+# `skip` (searched or removed) take no entries.
+def _merge(index, result, entries, docs, skip, k):
+    books, others, scores = entries
+    gaining = np.isin(others, docs) & ~np.isin(books, skip)
+    books, others, scores = books[gaining], others[gaining], scores[gaining]
+    if len(books) == 0:
+        return result
+    stored = np.array(index.execute(
+        "SELECT doc, neighbor, score FROM neighbors WHERE doc IN (SELECT value FROM json_each(?))",
+        (json.dumps(np.unique(books).tolist()),),
+    ).fetchall(), dtype=np.float64).reshape(-1, 3)
+    books = np.concatenate([books, stored[:, 0].astype(np.int64)])
+    others = np.concatenate([others, stored[:, 1].astype(np.int64)])
+    scores = np.concatenate([scores, stored[:, 2]])
+    order = np.lexsort((others, -scores, books))
+    books, others, scores = books[order], others[order], scores[order]
+    top = np.arange(len(books)) - np.searchsorted(books, books) < k
+    merged = (books[top], others[top], scores[top])
+    combined = tuple(np.concatenate(column) for column in zip(result, merged))
+    order = np.lexsort((-combined[2], combined[0]))
+    return tuple(column[order] for column in combined)
+
+
+def main(argv=None):
+    from ingest import Progress
+
+    parser = argparse.ArgumentParser(description="Build or update the similar-books index.")
+    parser.add_argument("--db", default="books_database.db")
+    parser.add_argument("--rebuild", action="store_true", help="rebuild from scratch instead of updating")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: CPUs)")
+    parser.add_argument("--k", type=int, default=K, help="neighbours per book (full builds)")
+    args = parser.parse_args(argv)
+    started = time.perf_counter()
+    result = update(args.db, args.workers, Progress(), args.rebuild, args.k)
+    print(f"{index_path(args.db)}: {result.added} added, {result.changed} changed, {result.removed} removed, "
+          f"{result.searched} searched in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
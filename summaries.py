@@ -0,0 +1,156 @@
+"""
+Materialized per-group aggregates of the books table.
+
+`book_summary` holds one row per (dimension, group) with the book count and the
+count and sum of the rating, page count and retail price of its books (in
+USD, see pricing.py). Triggers on `books` apply every insert, update and delete as a +/-
+delta, so the dashboard reads O(groups) rows instead of scanning O(books);
+means are derived from the stored sums. `rebuild()` recomputes
+everything from scratch (e.g. to shed floating-point drift after many deltas).
+
+Usage: python summaries.py [path/to/books_database.db]
+"""
+
+import sqlite3
+import sys
+
+
+# dimension name -> books column holding its group key ("all" has a single group).
+# Rows whose key is NULL are not counted in that dimension.
+DIMENSIONS = {
+    "all": None,
+    "isEbook": "isEbook",
+    "category": "category_id",
+    "publisher": "publisher_id",
+    "year": "pub_year",
+}
+
+# metric prefix -> books column
+METRICS = {
+    "rating": "averageRating",
+    "pages": "pageCount",
+    "price": "price_usd",
+}
+
+SOURCE_COLUMNS = [c for c in DIMENSIONS.values() if c] + list(METRICS.values())
+
+METRIC_COLUMNS = [f"{m}_{part}" for m in METRICS for part in ("n", "sum")]
+
+
+def _group_key(row, dimension):
+    column = DIMENSIONS[dimension]
+    return f"{row}.{column}" if column else "0"
+
+
+def _create_table(conn):
+    metric_decls = ",\n".join(
+        f"{m}_n INTEGER NOT NULL DEFAULT 0, {m}_sum REAL NOT NULL DEFAULT 0"
+        for m in METRICS
+    )
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS book_summary (
+            dimension TEXT NOT NULL,
+            group_key NOT NULL,
+            book_count INTEGER NOT NULL DEFAULT 0,
+            {metric_decls},
+            PRIMARY KEY (dimension, group_key)
+        ) WITHOUT ROWID
+    """)
+
+
+# Upsert adding (sign=+1) or removing (sign=-1) one row's contribution
+def _delta_statements(row, sign):
+    statements = []
+    for dimension in DIMENSIONS:
+        key = _group_key(row, dimension)
+        values = [f"{sign}"]
+        for column in METRICS.values():
+            value = f"{row}.{column}"
+            values += [
+                f"{sign} * ({value} IS NOT NULL)",
+                f"{sign} * COALESCE({value}, 0)",
+            ]
+        updates = ", ".join(f"{c} = {c} + excluded.{c}" for c in ["book_count", *METRIC_COLUMNS])
+        statements.append(f"""
+            INSERT INTO book_summary (dimension, group_key, book_count, {", ".join(METRIC_COLUMNS)})
+            SELECT '{dimension}', {key}, {", ".join(values)} WHERE {key} IS NOT NULL
+            ON CONFLICT (dimension, group_key) DO UPDATE SET {updates};""")
+        if sign < 0:
+            statements.append(
+                f"DELETE FROM book_summary WHERE dimension = '{dimension}' AND group_key = {key} AND book_count <= 0;"
+            )
+    return "\n".join(statements)
+
+
+def _create_triggers(conn):
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS book_summary_insert AFTER INSERT ON books BEGIN
+            {_delta_statements("NEW", +1)}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS book_summary_delete AFTER DELETE ON books BEGIN
+            {_delta_statements("OLD", -1)}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS book_summary_update AFTER UPDATE OF {", ".join(SOURCE_COLUMNS)} ON books BEGIN
+            {_delta_statements("OLD", -1)}
+            {_delta_statements("NEW", +1)}
+        END
+    """)
+
+
+# The summary rows of one dimension, computed from `books` with one GROUP BY
+def aggregate_sql(dimension):
+    aggregates = ", ".join(
+        f"COUNT({c}) AS {m}_n, TOTAL({c}) AS {m}_sum" for m, c in METRICS.items()
+    )
+    key = _group_key("books", dimension)
+    # A bare integer would be read as a column position: group "all" by its name
+    group_by = key if DIMENSIONS[dimension] else f"'{dimension}'"
+    return f"""
+        SELECT '{dimension}' AS dimension, {key} AS group_key, COUNT(*) AS book_count, {aggregates}
+        FROM books
+        WHERE {key} IS NOT NULL
+        GROUP BY {group_by}"""
+
+
+# Every summary row computed from `books`: the contents of `book_summary`,
+# for queries over a subset of the books (queries.scoped_sql)
+SUMMARY_ROWS_SQL = "\n        UNION ALL".join(aggregate_sql(dimension) for dimension in DIMENSIONS)
+
+
+# Recompute every summary row with one GROUP BY pass per dimension
+def rebuild(conn):
+    conn.execute("DELETE FROM book_summary")
+    for dimension in DIMENSIONS:
+        conn.execute(f"""
+            INSERT INTO book_summary (dimension, group_key, book_count, {", ".join(METRIC_COLUMNS)})
+            {aggregate_sql(dimension)}
+        """)
+
+
+# Table and triggers, filled from `books` unless `fill` is false
+def install(conn, fill=True):
+    _create_table(conn)
+    _create_triggers(conn)
+    if fill:
+        rebuild(conn)
+
+
+# Recreate the triggers (after DIMENSIONS or METRICS change) and refill the
+# table; `columns` also recreates the table, for a change of its columns
+def reinstall(conn, columns=False):
+    for trigger in ("book_summary_insert", "book_summary_delete", "book_summary_update"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    if columns:
+        conn.execute("DROP TABLE IF EXISTS book_summary")
+    install(conn)
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else "books_database.db"
+    with sqlite3.connect(path) as conn:
+        rebuild(conn)
+    print(f"{path}: book_summary rebuilt")
@@ -0,0 +1,20 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+# The modules live at the repository root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from migrations import migrate  # noqa: E402
+
+
+# A migrated copy of the shipped database, shared by the tests that only read it
+@pytest.fixture(scope="session")
+def books_db(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("db") / "books_database.db")
+    shutil.copy(os.path.join(ROOT, "books_database.db"), path)
+    migrate(path)
+    return path
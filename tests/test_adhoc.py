@@ -0,0 +1,101 @@
+import sqlite3
+import time
+
+import pytest
+
+import adhoc
+
+
+# Runs until stopped
+ENDLESS_SQL = "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT count(*) FROM n"
+
+
+@pytest.fixture
+def runner(books_db):
+    runner = adhoc.Runner(books_db, workers=1, budget=0.2, max_rows=5)
+    yield runner
+    runner.close()
+
+
+# The authorizer alone, on a connection that could otherwise write
+@pytest.mark.parametrize("sql", [
+    "INSERT INTO t VALUES (1)",
+    "UPDATE t SET x = 2",
+    "DELETE FROM t",
+    "CREATE TABLE u (x)",
+    "DROP TABLE t",
+    "ATTACH DATABASE ':memory:' AS other",
+    "PRAGMA user_version = 3",
+    "BEGIN",
+])
+def test_authorizer_rejects(sql):
+    conn = sqlite3.connect(":memory:")
+    try:
+        conn.execute("CREATE TABLE t (x)")
+        with adhoc._guarded(conn):
+            with pytest.raises(sqlite3.DatabaseError, match="not authorized"):
+                conn.execute(sql)
+        # Removed afterwards: the connection is pooled
+        conn.execute(sql)
+    finally:
+        conn.close()
+
+
+def test_reads_allowed(runner):
+    result = runner.submit("""
+        WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 3)
+        SELECT i, upper('a') FROM n, json_each('[1]')
+    """).result()
+    assert result == (["i", "upper('a')"], [(1, "A"), (2, "A"), (3, "A")], False, result.seconds)
+
+
+def test_row_cap(runner):
+    result = runner.submit("SELECT book_id FROM books").result()
+    assert len(result.rows) == 5 and result.truncated
+    result = runner.submit("SELECT book_id FROM books LIMIT 5").result()
+    assert len(result.rows) == 5 and not result.truncated
+
+
+def test_time_budget(runner):
+    with pytest.raises(adhoc.QueryTimeout):
+        runner.submit(ENDLESS_SQL).result(timeout=10)
+    # The connection goes back to the pool unguarded and usable
+    assert runner.submit("SELECT count(*) FROM books").result().rows[0][0] > 0
+
+
+def test_cancel(books_db):
+    runner = adhoc.Runner(books_db, workers=1, budget=60)
+    try:
+        job = runner.submit(ENDLESS_SQL)
+        # Interrupted while running, not refused before it starts
+        while job.started is None:
+            time.sleep(0.01)
+        job.cancel()
+        with pytest.raises(adhoc.QueryCancelled):
+            job.result(timeout=10)
+    finally:
+        runner.close()
+
+
+def test_plan(runner):
+    plan = runner.plan("SELECT * FROM books WHERE book_id = ?", ("x",))
+    assert plan and "books" in plan[0][-1]
+
+
+def test_build_sql(runner):
+    sql, params = adhoc.build_sql(
+        (), [adhoc.Filter("Year", ">=", "2000")], group_by=["Format"],
+        aggregate=("Average", "Page Count"), order_by="Average Page Count", descending=True,
+    )
+    assert params == (2000.0,)
+    result = runner.submit(sql, params).result()
+    assert result.columns == ["Format", "Average Page Count"]
+    averages = [average for _, average in result.rows]
+    assert averages == sorted(averages, reverse=True)
+
+    with pytest.raises(adhoc.BuilderError):
+        adhoc.build_sql(["No Such Field"])
+    with pytest.raises(adhoc.BuilderError):
+        adhoc.build_sql(["Title"], [adhoc.Filter("Year", "=", "soon")])
+    with pytest.raises(adhoc.BuilderError):
+        adhoc.build_sql(["Title"], order_by="Year")
@@ -0,0 +1,92 @@
+import sqlite3
+from collections import defaultdict
+
+import pytest
+
+from author_streaks import LONGEST_STREAKS_SQL
+
+# author -> publication years of their books (None: year unknown)
+BOOKS = {
+    "Exactly Three": [2000, 2001, 2002],
+    "Two Then Gap": [2000, 2001, 2005],
+    "Same Year Twice": [2010, 2010, 2011, 2012],
+    "Tied Streaks": [1990, 1991, 1992, 2000, 2001, 2002],
+    "Every Other Year": [2000, 2002, 2004],
+    "Unknown Year Between": [2000, None, 2001],
+}
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    conn.executescript("""
+        CREATE TABLE books (book_id TEXT PRIMARY KEY, pub_year INTEGER);
+        CREATE TABLE authors (author_id INTEGER PRIMARY KEY, name TEXT);
+        CREATE TABLE book_authors (book_id TEXT, author_id INTEGER);
+    """)
+    for author_id, (name, years) in enumerate(BOOKS.items()):
+        conn.execute("INSERT INTO authors VALUES (?, ?)", (author_id, name))
+        for i, year in enumerate(years):
+            book_id = f"{author_id}-{i}"
+            conn.execute("INSERT INTO books VALUES (?, ?)", (book_id, year))
+            conn.execute("INSERT INTO book_authors VALUES (?, ?)", (book_id, author_id))
+    yield conn
+    conn.close()
+
+
+def test_streaks_of_at_least_three_years(conn):
+    assert conn.execute(LONGEST_STREAKS_SQL, (3,)).fetchall() == [
+        ("Same Year Twice", 3, 2010, 2012),
+        ("Exactly Three", 3, 2000, 2002),
+        ("Tied Streaks", 3, 2000, 2002),
+    ]
+
+
+def test_streak_boundaries(conn):
+    streaks = {name: rest for name, *rest in conn.execute(LONGEST_STREAKS_SQL, (1,))}
+    assert streaks["Two Then Gap"] == [2, 2000, 2001]
+    assert streaks["Every Other Year"] == [1, 2004, 2004]
+    assert streaks["Unknown Year Between"] == [2, 2000, 2001]
+    assert len(streaks) == len(BOOKS)
+    assert "Two Then Gap" not in {name for name, *_ in conn.execute(LONGEST_STREAKS_SQL, (3,))}
+
+
+# A co-written book counts for each of its authors
+def test_co_authors(conn):
+    conn.execute("INSERT INTO books VALUES ('shared', 2003)")
+    conn.executemany("INSERT INTO book_authors VALUES ('shared', ?)", [(0,), (4,)])
+    streaks = {name: rest for name, *rest in conn.execute(LONGEST_STREAKS_SQL, (1,))}
+    assert streaks["Exactly Three"] == [4, 2000, 2003]
+    assert streaks["Every Other Year"] == [3, 2002, 2004]
+
+
+# The query agrees with a plain Python scan over the catalog
+def test_matches_python_scan(books_db):
+    conn = sqlite3.connect(f"file:{books_db}?mode=ro", uri=True)
+    try:
+        years = defaultdict(set)
+        for author_id, year in conn.execute("""
+            SELECT ba.author_id, b.pub_year
+            FROM book_authors AS ba JOIN books AS b ON b.book_id = ba.book_id
+            WHERE b.pub_year IS NOT NULL
+        """):
+            years[author_id].add(year)
+        names = dict(conn.execute("SELECT author_id, name FROM authors"))
+        result = sorted(conn.execute(LONGEST_STREAKS_SQL, (2,)).fetchall())
+    finally:
+        conn.close()
+
+    expected = []
+    for author_id, author_years in years.items():
+        best = None
+        for year in sorted(author_years):
+            if year - 1 in author_years:
+                continue
+            end = year
+            while end + 1 in author_years:
+                end += 1
+            if best is None or end - year + 1 >= best[0]:
+                best = (end - year + 1, year, end)
+        if best[0] >= 2:
+            expected.append((names[author_id], *best))
+    assert result and result == sorted(expected)
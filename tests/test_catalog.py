@@ -0,0 +1,34 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import catalog
+import queries
+from columnar import results_match
+
+
+@pytest.fixture(scope="module")
+def engine(books_db):
+    return catalog.CatalogEngine(books_db)
+
+
+def _sqlite_frame(db_path, question, params):
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        return pd.DataFrame(conn.execute(question.sql, params).fetchall())
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize("question_id", list(catalog.ANSWERS))
+def test_matches_sqlite(books_db, engine, question_id):
+    question = queries.QUESTIONS[question_id]
+    expected = _sqlite_frame(books_db, question, question.params)
+    assert results_match(expected, engine.fetch(question_id, question.params))
+
+
+@pytest.mark.parametrize("min_discount", [0, 35, 60])
+def test_discount_threshold(books_db, engine, min_discount):
+    expected = _sqlite_frame(books_db, queries.QUESTIONS["q6"], (min_discount,))
+    assert results_match(expected, engine.fetch("q6", (min_discount,)))
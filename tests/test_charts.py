@@ -0,0 +1,117 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import charts
+import queries
+
+
+class Drawer:
+    # A draw function that counts its calls
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, fig, ax, data, color="steelblue"):
+        self.calls += 1
+        ax.bar(data["x"].astype(str), data["y"], color=color)
+
+
+@pytest.fixture
+def data():
+    return pd.DataFrame({"x": ["a", "b", "c"], "y": [3, 1, 2]})
+
+
+def test_data_hash(data):
+    assert charts.data_hash(data) == charts.data_hash(data.copy())
+    assert charts.data_hash(data) != charts.data_hash(data.assign(y=[3, 1, 5]))
+    assert charts.data_hash(data) != charts.data_hash(data.astype({"y": float}))
+    assert charts.data_hash({"a": 1}) == charts.data_hash({"a": 1})
+
+
+# The same chart, data and options are drawn once; any change redraws
+def test_render_cache(data):
+    renderer = charts.ChartRenderer(dpi=50)
+    draw = Drawer()
+    image = renderer.render("q", draw, data, (4, 3))
+    assert image.startswith(b"\x89PNG")
+    assert renderer.render("q", draw, data.copy(), (4, 3)) == image
+    assert draw.calls == 1
+
+    renderer.render("q", draw, data.assign(y=[1, 2, 3]), (4, 3))
+    renderer.render("q", draw, data, (4, 3), color="red")
+    renderer.render("q", draw, data, (5, 3))
+    assert draw.calls == 4
+    assert renderer.render("q", draw, data, (4, 3), fmt="svg").lstrip().startswith(b"<?xml")
+
+
+# Figures never reach pyplot's figure manager
+def test_no_pyplot_figures(data):
+    plt = pytest.importorskip("matplotlib.pyplot")
+    before = plt.get_fignums()
+    charts.ChartRenderer(dpi=50).render("q", Drawer(), data, (4, 3))
+    assert plt.get_fignums() == before
+
+
+def test_cache_is_bounded_by_bytes(data):
+    renderer = charts.ChartRenderer(max_bytes=1, dpi=50)
+    draw = Drawer()
+    renderer.render("q", draw, data, (4, 3))
+    renderer.render("q", draw, data, (4, 3))
+    assert draw.calls == 2 and renderer.stats()["entries"] == 0
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        charts.ChartRenderer(fmt="gif")
+
+
+# -- downsampling and specs ---------------------------------------------
+
+
+def test_top_n_other():
+    data = pd.DataFrame({"name": list("abcdea"), "value": [5, 1, 4, 2, 3, 5]})
+    assert charts.top_n_other(data, "name", "value", 10).values.tolist() == [
+        ["a", 10], ["b", 1], ["c", 4], ["d", 2], ["e", 3]]
+    assert charts.top_n_other(data, "name", "value", 3).values.tolist() == [
+        ["a", 10], ["c", 4], ["Other (3)", 6]]
+    assert charts.top_n_other(data, "name", "value", 3, agg="mean").values.tolist() == [
+        ["a", 5.0], ["c", 4.0], ["Other (3)", 2.0]]
+
+
+def test_top_n_other_by():
+    data = pd.DataFrame({"name": list("aabbc"), "year": [1, 2, 1, 2, 2], "value": [9, 9, 1, 1, 1]})
+    assert charts.top_n_other(data, "name", "value", 2, by="year").values.tolist() == [
+        ["a", 1, 9], ["a", 2, 9], ["Other (2)", 1, 1], ["Other (2)", 2, 2]]
+
+
+def test_bin_rows():
+    data = pd.DataFrame({"value": range(10)})
+    assert charts.bin_rows(data, "value", 20).values.tolist() == [[i, i] for i in range(10)]
+    assert charts.bin_rows(data, "value", 4).values.tolist() == [[0, 1.0], [3, 3.5], [5, 6.0], [8, 8.5]]
+
+
+CHARTED = [question_id for question_id, question in queries.QUESTIONS.items() if question.chart]
+
+
+# Every declarative chart stays within the point budget on the real data and
+# renders with both backends
+@pytest.mark.parametrize("question_id", CHARTED)
+def test_question_charts(books_db, question_id):
+    question = queries.QUESTIONS[question_id]
+    conn = sqlite3.connect(f"file:{books_db}?mode=ro", uri=True)
+    try:
+        frame = pd.DataFrame(conn.execute(question.sql, question.params).fetchall(), columns=question.columns)
+    finally:
+        conn.close()
+    data = question.chart_data(frame, 20) if question.chart_data else frame
+    spec = question.chart
+    if question.chart_data:
+        assert data[spec.x].nunique() <= 20
+    image = charts.ChartRenderer(dpi=30).render(question_id, charts.draw_spec, data, (4, 3), spec=spec)
+    assert image.startswith(b"\x89PNG")
+
+    vega = charts.vega_lite_spec(spec, data)
+    encoding = vega["layer"][0]["encoding"]
+    assert (encoding["x"]["field"], encoding["y"]["field"]) == (spec.x, spec.y)
+    assert all(field["field"] in data.columns for field in encoding["tooltip"])
@@ -0,0 +1,40 @@
+import sqlite3
+
+import pytest
+
+from cleaning import decode_publisher, is_exploded
+
+
+@pytest.mark.parametrize("raw, name", [
+    ("J,o,h,n, ,W,i,l,e,y", "John Wiley"),
+    ('",O,\',R,e,i,l,l,y, ,M,e,d,i,a,,, ,I,n,c,.,"', "O'Reilly Media, Inc."),
+    ("a,b, ", "ab"),
+    ("Packt Publishing", "Packt Publishing"),
+    ("  Apress   Media  ", "Apress Media"),
+    ('"Smith, Jones"', "Smith, Jones"),
+    ("", None),
+    (None, None),
+])
+def test_decode_publisher(raw, name):
+    assert decode_publisher(raw) == name
+
+
+def test_is_exploded():
+    assert is_exploded("a,b,c") and is_exploded("a,,,b")
+    assert not is_exploded("ab") and not is_exploded("a,bc") and not is_exploded("a,b,")
+
+
+# Every book's publisher is the decoded name of its raw book_publisher
+def test_publishers_are_decoded(books_db):
+    conn = sqlite3.connect(f"file:{books_db}?mode=ro", uri=True)
+    try:
+        rows = conn.execute("""
+            SELECT b.book_publisher, p.name
+            FROM books AS b
+            LEFT JOIN publishers AS p ON p.publisher_id = b.publisher_id
+        """).fetchall()
+        names = [name for name, in conn.execute("SELECT name FROM publishers")]
+    finally:
+        conn.close()
+    assert rows and all(name == decode_publisher(raw) for raw, name in rows)
+    assert len(names) == len(set(names)) and not any(is_exploded(name) for name in names)
@@ -0,0 +1,49 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import columnar
+import queries
+
+pytestmark = pytest.mark.skipif(not columnar.available(), reason="needs duckdb and pyarrow")
+
+SUPPORTED = [question_id for question_id in queries.QUESTIONS if question_id not in columnar.UNSUPPORTED]
+
+
+@pytest.fixture(scope="module")
+def engine(books_db):
+    engine = columnar.ColumnarEngine(books_db)
+    yield engine
+    engine.close()
+
+
+@pytest.mark.parametrize("question_id", SUPPORTED)
+def test_matches_sqlite(books_db, engine, question_id):
+    question = queries.QUESTIONS[question_id]
+    conn = sqlite3.connect(f"file:{books_db}?mode=ro", uri=True)
+    try:
+        expected = pd.DataFrame(conn.execute(question.sql, question.params).fetchall())
+    finally:
+        conn.close()
+    assert len(expected)
+    actual = engine.frame(question_id, question.sql, question.params)
+    assert columnar.results_match(expected, actual)
+
+
+def test_unsupported_questions_raise(engine):
+    for question_id in columnar.UNSUPPORTED:
+        with pytest.raises(columnar.UnsupportedQuestion):
+            engine.query(question_id, queries.QUESTIONS[question_id].sql)
+
+
+# The SQL passed in runs, rewritten for DuckDB: not the question's own SQL
+def test_passed_sql_is_rewritten(books_db, engine):
+    sql = "SELECT book_id, ratingsCount / 10 FROM books WHERE ratingsCount > 10 ORDER BY book_id LIMIT 20"
+    conn = sqlite3.connect(f"file:{books_db}?mode=ro", uri=True)
+    try:
+        expected = conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+    assert expected
+    assert engine.fetch("q12", sql) == expected
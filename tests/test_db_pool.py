@@ -0,0 +1,66 @@
+import sqlite3
+
+import pytest
+
+from db_pool import ConnectionPool, PoolClosedError, PoolTimeoutError
+
+
+@pytest.fixture
+def pool(books_db):
+    pool = ConnectionPool(books_db, size=2, timeout=0.1)
+    yield pool
+    pool.close()
+
+
+def test_connections_are_read_only(pool):
+    with pool.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM books").fetchone()[0] > 0
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("DELETE FROM books")
+
+
+def test_connections_are_reused(pool):
+    for _ in range(5):
+        with pool.connection() as conn:
+            conn.execute("SELECT 1")
+    assert pool.stats()["open"] == 1
+
+
+def test_exhausted_pool_times_out(pool):
+    with pool.connection(), pool.connection():
+        with pytest.raises(PoolTimeoutError):
+            with pool.connection():
+                pass
+    assert pool.stats()["idle"] == 2
+
+
+# A read transaction left open is rolled back before the next user gets it
+def test_release_ends_transactions(pool):
+    with pool.connection() as conn:
+        conn.execute("BEGIN")
+        conn.execute("SELECT 1")
+        assert conn.in_transaction
+    with pool.connection() as conn:
+        assert not conn.in_transaction
+
+
+def test_health_check_replaces_dead_connections(pool):
+    with pool.connection() as conn:
+        dead = conn
+    dead.close()
+    assert pool.health_check()["open"] == 1
+    with pool.connection() as conn:
+        assert conn is not dead
+        assert conn.execute("SELECT 1").fetchone() == (1,)
+
+
+def test_closed_pool(pool):
+    pool.close()
+    with pytest.raises(PoolClosedError):
+        with pool.connection():
+            pass
+
+
+def test_missing_database(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        ConnectionPool(str(tmp_path / "missing.db"))
@@ -0,0 +1,131 @@
+import json
+import shutil
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import facets
+import migrations
+import queries
+from columnar import results_match
+
+
+@pytest.fixture(scope="module")
+def frame(books_db):
+    conn = sqlite3.connect(f"file:{books_db}?mode=ro", uri=True)
+    try:
+        return pd.read_sql_query(facets.INDEX_SQL, conn)
+    finally:
+        conn.close()
+
+
+@pytest.fixture(scope="module")
+def index(frame):
+    return facets.FacetIndex(frame)
+
+
+# A selection filtered directly with pandas
+def _expected(frame, selection):
+    keep = pd.Series(True, index=frame.index)
+    for facet in facets.FACETS:
+        choice = selection.get(facet.name)
+        if not choice:
+            continue
+        if facet.kind == "values":
+            keep &= frame[facet.name].astype(str).isin(choice) & frame[facet.name].notna()
+        else:
+            values = pd.to_numeric(frame[facet.name], errors="coerce")
+            keep &= values.between(*choice)
+    return frame.loc[keep, "rowid"].tolist()
+
+
+SELECTIONS = [
+    {"language": ["en"]},
+    {"language": ["en", "de"], "format": ["eBook"]},
+    {"year": (2015, 2020), "pages": (100, 400)},
+    {"price": (0, 30), "saleability": ["FOR_SALE"], "format": ["Physical book"]},
+]
+
+
+@pytest.mark.parametrize("selection", SELECTIONS)
+def test_scope_matches_pandas(frame, index, selection):
+    scope = index.scope(selection)
+    assert json.loads(scope.rowids) == _expected(frame, selection)
+    assert scope.count == index.count(selection)
+
+
+# Rarely used values have no precomputed bitmap and are matched on their codes
+def test_rare_values(frame, monkeypatch):
+    monkeypatch.setattr(facets, "MAX_BITMAPS", 1)
+    index = facets.FacetIndex(frame)
+    rare = frame["language"].value_counts().index[-1]
+    assert index.count({"language": [rare]}) == (frame["language"] == rare).sum()
+    assert index.count({"language": ["no such language"]}) == 0
+
+
+def test_unfiltered_selection(index):
+    assert index.scope({}) is None
+    assert index.scope({"language": [], "year": index.ranges["year"]}) is None
+    assert index.count({}) == index.size
+
+
+# A value's count applies the other facets' filters but not its own facet's
+def test_counts(frame, index):
+    selection = {"language": ["en"], "format": ["eBook"]}
+    counts = index.counts(selection)
+    ebooks = frame[frame["format"] == "eBook"]
+    assert counts["language"]["de"] == (ebooks["language"] == "de").sum()
+    english = frame[frame["language"] == "en"]
+    assert counts["format"]["Physical book"] == (english["format"] == "Physical book").sum()
+    assert counts["year"] == index.count(selection)
+
+
+# Running a question scoped to some books gives what it gives on a database
+# holding only those books
+@pytest.fixture(scope="module")
+def subset(books_db, tmp_path_factory, index):
+    selection = {"language": ["en"], "year": (2010, 2020)}
+    scope = index.scope(selection)
+    path = str(tmp_path_factory.mktemp("subset") / "books_database.db")
+    shutil.copy(books_db, path)
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("DELETE FROM books WHERE rowid NOT IN (SELECT value FROM json_each(?))", (scope.rowids,))
+        migrations.refresh_dimensions(conn)
+    conn.close()
+    return scope, path
+
+
+# bm25() scores (question 14) use the statistics of the whole index, so only
+# the matches are compared there
+@pytest.mark.parametrize("question_id", list(queries.QUESTIONS))
+def test_scoped_questions(books_db, subset, question_id):
+    scope, subset_path = subset
+    question = queries.QUESTIONS[question_id]
+    full = sqlite3.connect(f"file:{books_db}?mode=ro", uri=True)
+    only = sqlite3.connect(f"file:{subset_path}?mode=ro", uri=True)
+    try:
+        scoped = full.execute(queries.scoped_sql(question.sql), (scope.rowids, *question.params)).fetchall()
+        expected = only.execute(question.sql, question.params).fetchall()
+    finally:
+        full.close()
+        only.close()
+    if question_id == "q14":
+        expected, scoped = [row[:-1] for row in expected], [row[:-1] for row in scoped]
+    assert results_match(expected, scoped)
+
+
+def test_facets_reload(books_db, tmp_path):
+    path = str(tmp_path / "books_database.db")
+    shutil.copy(books_db, path)
+    catalog = facets.Facets(path, check_interval=0)
+    size = catalog.index().size
+    assert catalog.index() is catalog.index()
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("DELETE FROM books WHERE rowid = (SELECT MIN(rowid) FROM books)")
+    conn.close()
+    assert catalog.index().size == size - 1
+    assert np.all(np.diff(catalog.index().rowids) > 0)
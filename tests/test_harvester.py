@@ -0,0 +1,74 @@
+import asyncio
+import json
+import sqlite3
+import urllib.parse
+
+import harvester
+
+
+# Serves `totals[q]` volumes per search key, a page at a time; volume ids do
+# not depend on the key, so keys overlap. The first request for a
+# (q, startIndex) in `throttled` gets a 429 with Retry-After; keys in
+# `missing` answer 404.
+class FakeTransport:
+    def __init__(self, totals, throttled=(), missing=()):
+        self.totals = totals
+        self.throttled = set(throttled)
+        self.missing = set(missing)
+        self.urls = []
+
+    async def __call__(self, url):
+        self.urls.append(url)
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(url).query)
+        q, start, size = query["q"][0], int(query["startIndex"][0]), int(query["maxResults"][0])
+        if q in self.missing:
+            return harvester.Response(404, {}, b"")
+        if (q, start) in self.throttled:
+            self.throttled.discard((q, start))
+            return harvester.Response(429, {"Retry-After": "0"}, b"")
+        total = self.totals[q]
+        items = [{"id": f"vol-{i}", "volumeInfo": {"title": f"Volume {i}", "authors": ["A. Author"]}}
+                 for i in range(start, min(start + size, total))]
+        return harvester.Response(200, {}, json.dumps({"totalItems": total, "items": items}).encode())
+
+    def close(self):
+        pass
+
+
+def _run(db_path, transport, search_keys):
+    # A backoff this long would outlast the timeout: the 429 must be retried
+    # after its Retry-After instead
+    harvest = harvester.Harvester(db_path, transport, concurrency=2, rate=1000, max_items=100,
+                                  retries=2, backoff=60, batch_size=25)
+    asyncio.run(asyncio.wait_for(harvest.run(search_keys), 10))
+    return harvest
+
+
+def test_harvest_pages_retries_and_reports(tmp_path):
+    db_path = str(tmp_path / "books.db")
+    transport = FakeTransport({"alpha": 90}, throttled=[("alpha", 40)], missing=["beta"])
+    harvest = _run(db_path, transport, ["alpha", "beta"])
+
+    # alpha: pages at 0, 40 (throttled once) and 80; beta: one failed page
+    assert len(transport.urls) == 5
+    assert harvest.stats == {"requests": 5, "retries": 1, "pages": 3, "volumes": 90, "written": 90}
+    assert harvest.counts == {"inserted": 90}
+    assert len(harvest.errors) == 1
+    assert "'beta' from 0" in harvest.errors[0] and "HTTP 404" in harvest.errors[0]
+
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT search_key, COUNT(*) FROM books GROUP BY 1").fetchall() == [("alpha", 90)]
+
+
+def test_overlapping_keys_keep_their_books(tmp_path):
+    db_path = str(tmp_path / "books.db")
+    _run(db_path, FakeTransport({"alpha": 30}), ["alpha"])
+
+    # The same volumes under another key: unchanged, and still filed under alpha
+    harvest = _run(db_path, FakeTransport({"gamma": 30}), ["gamma"])
+    assert harvest.errors == []
+    assert harvest.stats["written"] == 0
+    assert harvest.counts == {"unchanged": 30}
+
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT search_key, COUNT(*) FROM books GROUP BY 1").fetchall() == [("alpha", 30)]
@@ -0,0 +1,86 @@
+import json
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+import ingest
+
+
+def _load(db_path, path, batch_size=ingest.DEFAULT_BATCH_SIZE, progress=None):
+    loader = ingest.Loader(db_path, batch_size, progress)
+    try:
+        loader.load(path, restart=True)
+    finally:
+        loader.close()
+    return loader.counts
+
+
+# pandas column-oriented JSON, as cleaned_books_data.json
+def _write_columns(path, records):
+    columns = {column: {str(i): record.get(column) for i, record in enumerate(records)}
+               for column in ("book_id", "search_key", "book_title", "pageCount")}
+    path.write_text(json.dumps(columns))
+
+
+def test_delta_load_restores_the_journal_mode(books_db, tmp_path):
+    db_path = str(tmp_path / "books.db")
+    shutil.copy(books_db, db_path)
+    path = tmp_path / "books.jsonl"
+    path.write_text(json.dumps({"book_id": "new-book", "search_key": "tests", "book_title": "A New Book"}) + "\n")
+
+    assert _load(db_path, str(path)) == {"inserted": 1}
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+    assert not os.path.exists(db_path + "-wal")
+
+    # The same file again changes nothing, not even the database file
+    modified = os.stat(db_path).st_mtime_ns
+    assert _load(db_path, str(path)) == {"unchanged": 1}
+    assert os.stat(db_path).st_mtime_ns == modified
+
+
+def test_unchanged_columns_leave_the_database_alone(books_db, tmp_path):
+    db_path = str(tmp_path / "books.db")
+    shutil.copy(books_db, db_path)
+    path = tmp_path / "books.json"
+    _write_columns(path, [{"book_id": f"new-{i}", "search_key": "tests", "book_title": f"Book {i}", "pageCount": i}
+                          for i in range(5)])
+
+    assert _load(db_path, str(path), batch_size=2) == {"inserted": 5}
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM books WHERE search_key = 'tests'").fetchone()[0] == 5
+    assert not os.path.exists(ingest.staging_path(db_path))
+
+    # Staged in the sidecar file; nothing changed, so nothing is written
+    modified = os.stat(db_path).st_mtime_ns
+    assert _load(db_path, str(path), batch_size=2) == {"unchanged": 5}
+    assert os.stat(db_path).st_mtime_ns == modified
+    assert not os.path.exists(ingest.staging_path(db_path))
+
+
+def test_interrupted_columns_load_resumes(books_db, tmp_path):
+    db_path = str(tmp_path / "books.db")
+    shutil.copy(books_db, db_path)
+    path = tmp_path / "books.json"
+    _write_columns(path, [{"book_id": f"new-{i}", "search_key": "tests", "pageCount": i} for i in range(5)])
+
+    def interrupt(phase, done, total=None, final=False):
+        if phase == "loaded":
+            raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        _load(db_path, str(path), batch_size=2, progress=interrupt)
+    assert os.path.exists(ingest.staging_path(db_path))
+
+    loader = ingest.Loader(db_path, 2)
+    try:
+        assert loader.load(str(path)) == 5
+    finally:
+        loader.close()
+    # The first batch was committed before the interruption
+    assert loader.counts == {"inserted": 3}
+    assert not os.path.exists(ingest.staging_path(db_path))
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT SUM(pageCount) FROM books WHERE search_key = 'tests'").fetchone()[0] == 10
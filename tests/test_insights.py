@@ -0,0 +1,69 @@
+import json
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import insights
+import queries
+
+
+# A question's result over the books matching `where`, as the dashboard runs
+# it under the sidebar filters (queries.scoped_sql)
+def _scoped(db_path, question_id, where, params=None):
+    question = queries.QUESTIONS[question_id]
+    params = question.params if params is None else params
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        rowids = [rowid for rowid, in conn.execute(f"SELECT rowid FROM books WHERE {where}")]
+        cursor = conn.execute(queries.scoped_sql(question.sql), (json.dumps(rowids), *params))
+        if question.one:
+            return cursor.fetchone()
+        return pd.DataFrame(cursor.fetchall(), columns=question.columns)
+    finally:
+        conn.close()
+
+
+def test_formatters_accept_missing_values():
+    assert insights.number(None) == insights.number(float("nan"), 2) == "n/a"
+    assert insights.money(None) == insights.money(float("nan")) == "n/a"
+    assert insights.money(1234.5) == "\\$1,234.50"
+
+
+@pytest.mark.parametrize("question_id", ["q4", "q15"])
+def test_unpriced_selection(books_db, question_id):
+    result = _scoped(books_db, question_id, "saleability = 'NOT_FOR_SALE'")
+    assert len(result)
+    assert insights.analysis(question_id, result) == insights.INSIGHTS[question_id].empty
+
+
+def test_unrated_selection(books_db):
+    result = _scoped(books_db, "q3", "language = 'de'")
+    assert insights.analysis("q3", result) == insights.INSIGHTS["q3"].empty
+
+    frame = _scoped(books_db, "q12", "language = 'de'")
+    assert frame["Rating Count"].isna().all()
+    average = pd.to_numeric(frame["Rating Count"]).mean()
+    assert insights.analysis("q12", frame, average) == insights.INSIGHTS["q12"].empty
+
+
+def test_partly_priced_selection(books_db):
+    frame = _scoped(books_db, "q4", "saleability IN ('FOR_SALE', 'NOT_FOR_SALE')")
+    text = insights.analysis("q4", pd.concat([frame.assign(**{"Retail Price": None}).head(1), frame]))
+    assert f'"{frame.iloc[0]["Book Title"]}"' in text and "n/a" not in text
+
+
+@pytest.mark.parametrize("question_id", ["q4", "q5", "q6", "q9", "q10", "q11", "q13", "q15", "q17", "q19"])
+def test_empty_frames(books_db, question_id):
+    result = _scoped(books_db, question_id, "0")
+    assert result.empty
+    settings = queries.QUESTIONS[question_id].params if question_id == "q6" else ()
+    assert insights.analysis(question_id, result, *settings) == (insights.INSIGHTS[question_id].empty or "").format(*settings)
+
+
+# The q6 text names the minimum discount the books were queried with
+def test_discount_text_follows_threshold(books_db):
+    frame = _scoped(books_db, "q6", "1", (50,))
+    assert not frame.empty and (frame["Discount"] > 50).all()
+    assert f"{len(frame):,} books are offered at a discount above 50%" in insights.analysis("q6", frame, 50)
+    assert insights.analysis("q6", frame.head(0), 50) == "No books are discounted by more than 50%."
@@ -0,0 +1,107 @@
+import sqlite3
+import threading
+import time
+import urllib.request
+
+import pytest
+
+import instrumentation
+from instrumentation import Metrics, SamplingProfiler, Trace
+
+
+def test_prometheus_histogram():
+    metrics = Metrics(buckets=(0.01, 0.1))
+    for seconds in (0.005, 0.05, 0.05, 3.0):
+        metrics.observe("q1", "execute", seconds)
+    text = metrics.prometheus_text()
+    assert 'bookscape_stage_seconds_bucket{question="q1",stage="execute",le="0.01"} 1' in text
+    assert 'bookscape_stage_seconds_bucket{question="q1",stage="execute",le="0.1"} 3' in text
+    assert 'bookscape_stage_seconds_bucket{question="q1",stage="execute",le="+Inf"} 4' in text
+    assert 'bookscape_stage_seconds_count{question="q1",stage="execute"} 4' in text
+    assert metrics.snapshot()["stages"][("q1", "execute")]["sum"] == pytest.approx(3.105)
+
+
+def test_rows_and_cache_counters():
+    metrics = Metrics()
+    metrics.count_rows("q4", 5)
+    metrics.count_rows("q4", 5)
+    metrics.count_cache("q4", True)
+    metrics.count_cache("q4", False)
+    text = metrics.prometheus_text()
+    assert 'bookscape_rows_returned_total{question="q4"} 10' in text
+    assert 'bookscape_query_cache_total{question="q4",result="hit"} 1' in text
+    assert 'bookscape_query_cache_total{question="q4",result="miss"} 1' in text
+
+
+# Full scans of `books` are flagged; indexed lookups are not
+def test_plans(books_db):
+    metrics = Metrics()
+    conn = sqlite3.connect(f"file:{books_db}?mode=ro", uri=True)
+    try:
+        metrics.capture_plan("scan", conn, "SELECT * FROM books WHERE book_title LIKE ?", ("%x%",))
+        plan = metrics.capture_plan("seek", conn, "SELECT * FROM books WHERE book_id = ?", ("x",))
+    finally:
+        conn.close()
+    assert metrics.snapshot()["full_scans"] == {"scan": ["books"], "seek": []}
+    assert "books" in instrumentation.format_plan(plan)
+    text = metrics.prometheus_text()
+    assert 'bookscape_full_table_scan{question="scan",table="books"} 1' in text
+    assert 'bookscape_full_table_scan{question="seek",table="books"} 0' in text
+
+
+# A trace only sees the stages of its own thread
+def test_trace():
+    metrics = Metrics()
+    with Trace() as trace:
+        with metrics.stage("q2", "execute"):
+            time.sleep(0.01)
+        metrics.count_rows("q2", 1)
+        other = threading.Thread(target=metrics.observe, args=("q3", "execute", 1.0))
+        other.start()
+        other.join()
+    metrics.observe("q2", "execute", 1.0)
+    assert [(question, stage) for question, stage, _ in trace.stages] == [("q2", "execute")]
+    assert 0.01 <= trace.total("execute") < 1.0
+    assert trace.rows == {"q2": 1}
+    assert instrumentation.current_trace() is None
+
+
+def test_textfile_and_endpoint(tmp_path):
+    metrics = Metrics()
+    metrics.count_rows("q1", 2)
+    path = tmp_path / "bookscape.prom"
+    metrics.write_textfile(str(path))
+    assert path.read_text() == metrics.prometheus_text()
+    assert [p.name for p in tmp_path.iterdir()] == ["bookscape.prom"]
+
+    server = instrumentation.serve_metrics(metrics, 0)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        with urllib.request.urlopen(f"{url}/metrics") as response:
+            assert response.read().decode() == metrics.prometheus_text()
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f"{url}/other")
+    finally:
+        server.shutdown()
+
+
+def _busy(seconds):
+    stop = time.perf_counter() + seconds
+    while time.perf_counter() < stop:
+        pass
+
+
+def test_sampling_profiler():
+    with SamplingProfiler(interval=0.001) as profiler:
+        _busy(0.2)
+    assert profiler.samples > 0
+    # The busy loop is where the samples land ("self"); its callers all tie on "total"
+    hottest = max(profiler.top(1000), key=lambda entry: entry[1])
+    assert hottest[0].startswith("_busy ")
+    assert "_busy (test_instrumentation.py" in profiler.collapsed()
+
+
+def test_timed():
+    calls = []
+    result, seconds = instrumentation.timed(lambda: calls.append(1) or len(calls), 5)
+    assert result == 5 and len(calls) == 5 and seconds >= 0
@@ -0,0 +1,100 @@
+import shutil
+import sqlite3
+
+import pytest
+
+import migrations
+
+
+def _indexes(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return {name for name, in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    finally:
+        conn.close()
+
+
+def test_migrated_to_latest_version(books_db):
+    assert migrations.migrate(books_db) == migrations.MIGRATIONS[-1][0]
+
+
+# Step 9 drops the author-string index that step 1 created
+def test_author_string_index_dropped(books_db):
+    indexes = _indexes(books_db)
+    assert "idx_books_authors_year" not in indexes
+    assert {"idx_books_id_year", "idx_books_publisher_rating"} <= indexes
+
+
+@pytest.fixture
+def conn(books_db, tmp_path):
+    path = str(tmp_path / "books_database.db")
+    shutil.copy(books_db, path)
+    conn = sqlite3.connect(path)
+    yield conn
+    conn.close()
+
+
+def test_split_authors():
+    assert migrations.split_authors(" Ann Lee, Bo Wu,,Ann Lee ") == ["Ann Lee", "Bo Wu"]
+    assert migrations.split_authors("") == migrations.split_authors(None) == []
+
+
+# The author links, by name, and the counts kept with them
+def _author_state(conn):
+    links = conn.execute("""
+        SELECT ba.book_id, a.name, ba.position
+        FROM book_authors AS ba JOIN authors AS a ON a.author_id = ba.author_id
+        ORDER BY 1, 3
+    """).fetchall()
+    author_counts = conn.execute("SELECT book_id, author_count FROM books ORDER BY 1").fetchall()
+    book_counts = conn.execute("SELECT name, book_count FROM authors ORDER BY 1").fetchall()
+    return links, author_counts, book_counts
+
+
+def test_author_links(conn):
+    links, author_counts, book_counts = _author_state(conn)
+    expected = [
+        (book_id, name, position)
+        for book_id, book_authors in conn.execute("SELECT book_id, book_authors FROM books ORDER BY 1")
+        for position, name in enumerate(migrations.split_authors(book_authors))
+    ]
+    assert links == expected
+    per_book = {}
+    per_author = {}
+    for book_id, name, _ in links:
+        per_book[book_id] = per_book.get(book_id, 0) + 1
+        per_author[name] = per_author.get(name, 0) + 1
+    assert author_counts == [(book_id, per_book.get(book_id, 0)) for book_id, _ in author_counts]
+    assert book_counts == sorted(per_author.items())
+
+
+# Refreshing only the edited books leaves the same dimensions as a full refresh
+def test_scoped_refresh_matches_full(conn):
+    solo_book, solo_author = conn.execute("""
+        SELECT ba.book_id, a.name FROM authors AS a JOIN book_authors AS ba ON ba.author_id = a.author_id
+        WHERE a.book_count = 1 AND ba.book_id IN (SELECT book_id FROM books WHERE author_count = 1)
+        LIMIT 1
+    """).fetchone()
+    other_book, = conn.execute("SELECT book_id FROM books WHERE book_id != ? AND author_count > 0 LIMIT 1",
+                               (solo_book,)).fetchone()
+    edited = [solo_book, other_book]
+    with conn:
+        conn.execute("UPDATE books SET book_authors = 'New Author', book_publisher = 'N,e,w, ,P,r,e,s,s'"
+                     " WHERE book_id = ?", (solo_book,))
+        conn.execute("UPDATE books SET book_authors = book_authors || ', New Author', categories = 'New Shelf'"
+                     " WHERE book_id = ?", (other_book,))
+        migrations.refresh_dimensions(conn, edited)
+    scoped = _author_state(conn)
+    assert solo_author not in {name for name, _ in scoped[2]}
+    assert ("New Author", 2) in scoped[2]
+    assert conn.execute("SELECT p.name FROM books AS b JOIN publishers AS p ON p.publisher_id = b.publisher_id"
+                        " WHERE b.book_id = ?", (solo_book,)).fetchone() == ("New Press",)
+    assert conn.execute("SELECT c.name FROM books AS b JOIN categories AS c ON c.category_id = b.category_id"
+                        " WHERE b.book_id = ?", (other_book,)).fetchone() == ("New Shelf",)
+
+    dimensions = "SELECT name FROM {} ORDER BY name"
+    scoped_names = [conn.execute(dimensions.format(table)).fetchall() for table in ("publishers", "categories")]
+    with conn:
+        migrations.refresh_dimensions(conn)
+    assert _author_state(conn) == scoped
+    assert [conn.execute(dimensions.format(table)).fetchall() for table in ("publishers", "categories")] == scoped_names
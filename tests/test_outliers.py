@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+import outliers
+
+
+@pytest.fixture
+def values():
+    rng = np.random.default_rng(7)
+    values = rng.normal(3.5, 0.6, 1000)
+    values[[5, 50, 500]] = [0.5, 9.0, np.nan]
+    return values
+
+
+# Merging chunks gives the one-pass count, mean and M2
+def test_moments_match_numpy(values):
+    codes = np.arange(len(values)) % 3
+    count, mean, m2 = outliers.moments(values, codes, 3, chunk_size=64)
+    for group in range(3):
+        x = values[codes == group]
+        x = x[~np.isnan(x)]
+        assert count[group] == len(x)
+        assert mean[group] == pytest.approx(x.mean())
+        assert m2[group] == pytest.approx(((x - x.mean()) ** 2).sum())
+
+
+def test_zscore(values):
+    result = outliers.detect_outliers(values, "zscore", 2.0)
+    present = values[~np.isnan(values)]
+    expected = np.abs(values - present.mean()) > 2.0 * present.std()
+    np.testing.assert_array_equal(result.mask, expected)
+    assert result.mask[[5, 50]].all() and not result.mask[500]
+    assert result.center[0] == pytest.approx(present.mean())
+
+
+def test_mad(values):
+    result = outliers.detect_outliers(values, "mad")
+    present = values[~np.isnan(values)]
+    median = np.median(present)
+    spread = outliers.DEFAULT_K["mad"] * outliers.MAD_SCALE * np.median(np.abs(present - median))
+    np.testing.assert_array_equal(result.mask, np.abs(values - median) > spread)
+
+
+def test_iqr(values):
+    result = outliers.detect_outliers(values, "iqr", 1.5)
+    q1, q3 = np.quantile(values[~np.isnan(values)], [0.25, 0.75])
+    assert result.lower[0] == pytest.approx(q1 - 1.5 * (q3 - q1))
+    assert result.upper[0] == pytest.approx(q3 + 1.5 * (q3 - q1))
+
+
+# Each value is compared with its own group; a missing label is a group too
+def test_groups():
+    values = [1.0, 1.1, 0.9, 1.0, 5.0, 10.0, 10.1, 9.9, 10.1, 9.9, 7.0, 7.0]
+    groups = ["a"] * 5 + ["b"] * 5 + [None] * 2
+    result = outliers.detect_outliers(values, "zscore", 1.5, groups)
+    assert result.mask.tolist() == [False] * 4 + [True] + [False] * 7
+    assert result.center[-1] == 7.0
+
+
+def test_unknown_method():
+    with pytest.raises(ValueError):
+        outliers.detect_outliers([1.0], "grubbs")
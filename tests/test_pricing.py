@@ -0,0 +1,116 @@
+import shutil
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import pricing
+
+
+@pytest.fixture
+def conn(books_db, tmp_path):
+    path = str(tmp_path / "books_database.db")
+    shutil.copy(books_db, path)
+    conn = sqlite3.connect(path)
+    yield conn
+    conn.close()
+
+
+def _insert(conn, book_id, listed, list_currency, retail, retail_currency):
+    with conn:
+        conn.execute("""
+            INSERT INTO books (book_id, amount_listPrice, currencyCode_listPrice, amount_retailPrice, currencyCode_retailPrice)
+            VALUES (?, ?, ?, ?, ?)
+        """, (book_id, listed, list_currency, retail, retail_currency))
+
+
+def _prices(conn, book_id):
+    return conn.execute("SELECT price_usd, discount_pct FROM books WHERE book_id = ?", (book_id,)).fetchone()
+
+
+# The columns of the shipped books are what the triggers would write
+def test_installed_prices(conn):
+    assert pricing.reprice(conn) == 0
+    frame = pd.read_sql_query("SELECT * FROM books WHERE amount_retailPrice IS NOT NULL", conn)
+    rate = frame["currencyCode_retailPrice"].map(pricing.RATES)
+    assert frame["price_usd"].tolist() == pytest.approx((frame["amount_retailPrice"] * rate).tolist())
+    assert pricing.rates_version(conn) == pricing.RATES_VERSION
+
+
+def test_insert_trigger(conn):
+    _insert(conn, "eur", 10, "EUR", 8, "EUR")
+    _insert(conn, "mixed", 10, "USD", 8, "EUR")
+    # Integral prices still divide as reals
+    _insert(conn, "whole", 3, "USD", 2, "USD")
+    _insert(conn, "unpriced", None, None, None, None)
+    _insert(conn, "unknown", 10, "XXX", 8, "XXX")
+    _insert(conn, "free_list", 0, "USD", 0, "USD")
+    assert _prices(conn, "eur") == pytest.approx((8 * pricing.RATES["EUR"], 20.0))
+    assert _prices(conn, "mixed") == pytest.approx((8 * pricing.RATES["EUR"], (1 - 8 * pricing.RATES["EUR"] / 10) * 100))
+    assert _prices(conn, "whole") == pytest.approx((2.0, 100 / 3))
+    assert _prices(conn, "unpriced") == (None, None)
+    # Same-currency discounts need no rate
+    assert _prices(conn, "unknown") == pytest.approx((None, 20.0))
+    assert _prices(conn, "free_list") == (0.0, None)
+
+
+def test_update_trigger(conn):
+    _insert(conn, "book", 10, "USD", 8, "USD")
+    with conn:
+        conn.execute("UPDATE books SET currencyCode_retailPrice = 'GBP' WHERE book_id = 'book'")
+    assert _prices(conn, "book") == pytest.approx((8 * pricing.RATES["GBP"], (1 - 8 * pricing.RATES["GBP"] / 10) * 100))
+    with conn:
+        conn.execute("UPDATE books SET amount_retailPrice = 5, currencyCode_retailPrice = 'USD' WHERE book_id = 'book'")
+    assert _prices(conn, "book") == pytest.approx((5.0, 50.0))
+    with conn:
+        conn.execute("UPDATE books SET amount_listPrice = NULL WHERE book_id = 'book'")
+    assert _prices(conn, "book") == (5.0, None)
+    with conn:
+        conn.execute("UPDATE books SET amount_retailPrice = NULL WHERE book_id = 'book'")
+    assert _prices(conn, "book") == (None, None)
+
+
+# Only books in a currency whose rate changed are re-priced
+def test_update_rates(conn):
+    _insert(conn, "eur", 10, "EUR", 8, "EUR")
+    _insert(conn, "gbp", 10, "GBP", 9, "GBP")
+    _insert(conn, "mixed", 10, "EUR", 8, "USD")
+    gbp = _prices(conn, "gbp")
+    rates = dict(pricing.RATES, EUR=1.2)
+    with conn:
+        assert pricing.update_rates(conn, rates, "2099-01-01") == 2
+    assert pricing.rates_version(conn) == "2099-01-01"
+    assert _prices(conn, "eur") == pytest.approx((9.6, 20.0))
+    assert _prices(conn, "mixed") == pytest.approx((8.0, (1 - 8 / 12) * 100))
+    assert _prices(conn, "gbp") == gbp
+    with conn:
+        assert pricing.update_rates(conn, rates, "2099-01-01") == 0
+
+
+def test_bands(conn):
+    frame = pd.read_sql_query(pricing.PRICE_BANDS_SQL, conn)
+    prices = pd.read_sql_query("SELECT price_usd FROM books WHERE price_usd IS NOT NULL", conn)["price_usd"]
+    expected = pd.cut(prices, [*pricing.PRICE_EDGES, float("inf")], right=False).value_counts(sort=False)
+    assert frame["book_count"].tolist() == expected.tolist()
+
+    table = pricing.bands(frame, "$")
+    assert table["Band"].iloc[0] == "$0–5" and table["Band"].iloc[-1] == "$250+"
+    assert table["Share"].sum() == pytest.approx(100)
+
+    by_format = pricing.format_bands(pd.read_sql_query(pricing.FORMAT_PRICE_BANDS_SQL, conn))
+    assert (by_format["Physical Book Count"] + by_format["EBook Count"]).tolist() == expected.tolist()
+
+
+# Triggers installed before a change of the SQL are replaced
+def test_reinstall(conn):
+    with conn:
+        conn.execute("DROP TRIGGER books_price_update")
+        conn.execute("CREATE TRIGGER books_price_update AFTER UPDATE OF amount_retailPrice ON books"
+                     " BEGIN UPDATE books SET price_usd = -1 WHERE rowid = NEW.rowid; END")
+    _insert(conn, "book", 10, "USD", 8, "USD")
+    with conn:
+        conn.execute("UPDATE books SET amount_retailPrice = 5 WHERE book_id = 'book'")
+    assert _prices(conn, "book")[0] == -1
+    with conn:
+        pricing.reinstall(conn)
+    assert _prices(conn, "book") == pytest.approx((5.0, 50.0))
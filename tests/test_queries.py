@@ -0,0 +1,44 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import queries
+
+
+@pytest.fixture(scope="module")
+def conn(books_db):
+    conn = sqlite3.connect(f"file:{books_db}?mode=ro", uri=True)
+    yield conn
+    conn.close()
+
+
+def test_menu():
+    assert [question.id for question in queries.BY_TITLE.values()] == [f"q{n}" for n in range(1, 21)]
+    assert all(title.startswith(f"{question.id[1:]}. ") for title, question in queries.BY_TITLE.items())
+
+
+# Each question runs with its default parameters and has the columns it names
+@pytest.mark.parametrize("question_id", list(queries.QUESTIONS))
+def test_run(conn, question_id):
+    question = queries.QUESTIONS[question_id]
+    result = queries.run(conn, question_id)
+    if question.one:
+        assert isinstance(result, tuple) and len(result) == len(question.columns)
+    else:
+        assert isinstance(result, pd.DataFrame) and list(result.columns) == question.columns
+        assert len(result)
+
+
+def test_run_with_params(conn):
+    default = queries.run(conn, "q16")
+    longer = queries.run(conn, "q16", (4,))
+    assert len(longer) < len(default)
+    assert (longer["Consecutive Year Count"] >= 4).all()
+
+
+def test_main(books_db, capsys):
+    queries.main(["q2", "--db", books_db])
+    assert capsys.readouterr().out.startswith("== q2: 2. Publisher with the Most Books Published")
+    with pytest.raises(SystemExit):
+        queries.main(["q99", "--db", books_db])
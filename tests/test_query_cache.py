@@ -0,0 +1,31 @@
+import os
+import sqlite3
+
+from query_cache import Snapshot
+
+
+def _count(conn):
+    return conn.execute("SELECT COUNT(*) FROM t").fetchone()[0]
+
+
+# Rebuilt once the file changes, and only then; replaced values are discarded
+def test_snapshot_reloads_on_change(tmp_path):
+    path = str(tmp_path / "snapshot.db")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE t (x)")
+    discarded = []
+    snapshot = Snapshot(path, _count, check_interval=0, discard=discarded.append)
+
+    assert snapshot.get() == 0 and snapshot.get() == 0
+    assert snapshot.loads == 1
+
+    conn = sqlite3.connect(path)
+    conn.execute("INSERT INTO t VALUES (1)")
+    conn.commit()
+    conn.close()
+    os.utime(path, ns=(0, 0))
+    assert snapshot.get(str) == "1"
+    assert snapshot.loads == 2 and discarded == [0]
+
+    snapshot.close()
+    assert discarded == [0, 1]
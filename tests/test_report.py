@@ -0,0 +1,52 @@
+import shutil
+import textwrap
+
+import pandas as pd
+import pytest
+
+import queries
+import report
+
+AppTest = pytest.importorskip("streamlit.testing.v1").AppTest
+
+# Pages that only show text, no result table
+TEXT_ONLY = {"q1", "q2", "q3", "q20"}
+
+
+@pytest.fixture(scope="module")
+def db_path(books_db, tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("report") / "books_database.db")
+    shutil.copy(books_db, path)
+    return path
+
+
+@pytest.fixture(scope="module")
+def sections(db_path):
+    return {section.question.id: section for section in report.build_report(db_path, workers=1)}
+
+
+# Started after the report: build_report forks its chart workers, which must
+# not inherit the app's threads
+@pytest.fixture(scope="module")
+def app(db_path, sections):
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv("BOOKSCAPE_DB", db_path)
+        app = AppTest.from_file(report.__file__.replace("report.py", "bookscape_explorer.py"), default_timeout=120)
+        app.run()
+        yield app
+
+
+# Each report section shows the table and the analysis text of its page, at
+# the page's default settings
+@pytest.mark.parametrize("question_id", [question.id for question in queries.BY_TITLE.values()])
+def test_sections_match_pages(app, sections, question_id):
+    section = sections[question_id]
+    assert section.error is None
+    app.selectbox[0].select(section.question.title).run()
+    assert not app.exception
+
+    # Streamlit dedents markdown
+    assert section.text and textwrap.dedent(section.text).strip() in [markdown.value for markdown in app.markdown]
+    if question_id not in TEXT_ONLY:
+        shown = app.dataframe[0].value.reset_index(drop=True)
+        pd.testing.assert_frame_equal(shown, section.table.reset_index(drop=True), check_dtype=False)
@@ -0,0 +1,84 @@
+import shutil
+import sqlite3
+
+import pytest
+
+import search
+
+
+@pytest.fixture
+def conn(books_db, tmp_path):
+    path = str(tmp_path / "books_database.db")
+    shutil.copy(books_db, path)
+    conn = sqlite3.connect(path)
+    yield conn
+    conn.close()
+
+
+def _titles(conn, match):
+    return [title for title, _, _ in conn.execute(search.SEARCH_SQL, (match, 100))]
+
+
+# The external-content index agrees with `books` row for row
+def _assert_in_sync(conn):
+    conn.execute("INSERT INTO books_fts (books_fts, rank) VALUES ('integrity-check', 1)")
+
+
+# The triggers keep the index in step with inserts, updates and deletes
+def test_triggers(conn):
+    _assert_in_sync(conn)
+    with conn:
+        conn.execute("INSERT INTO books (book_id, book_title, book_description)"
+                     " VALUES ('fts-test', 'Zyzzyva Handbook', 'all about weevils')")
+    assert _titles(conn, "zyzzyva") == ["Zyzzyva Handbook"]
+    assert _titles(conn, "book_description : weevils") == ["Zyzzyva Handbook"]
+
+    with conn:
+        conn.execute("UPDATE books SET book_title = 'Quokka Handbook' WHERE book_id = 'fts-test'")
+    assert _titles(conn, "zyzzyva") == []
+    assert _titles(conn, "quokka") == ["Quokka Handbook"]
+    _assert_in_sync(conn)
+
+    with conn:
+        conn.execute("DELETE FROM books WHERE book_id = 'fts-test'")
+    assert _titles(conn, "quokka") == [] and _titles(conn, "weevils") == []
+    _assert_in_sync(conn)
+
+
+def test_title_matches_rank_first(books_db):
+    conn = sqlite3.connect(f"file:{books_db}?mode=ro", uri=True)
+    try:
+        rows = conn.execute(search.SEARCH_SQL, ("python", 20)).fetchall()
+    finally:
+        conn.close()
+    assert rows and "python" in rows[0][0].lower()
+    assert [rank for _, _, rank in rows] == sorted(rank for _, _, rank in rows)
+
+
+# The keyword counts partition the books and agree with the preset searches
+def test_keyword_counts(books_db):
+    conn = sqlite3.connect(f"file:{books_db}?mode=ro", uri=True)
+    try:
+        counts = conn.execute(search.KEYWORD_COUNTS_SQL,
+                              (search.PYTHON_IN_TITLE, search.DATA_SCIENCE_IN_TITLE)).fetchone()
+        total, = conn.execute("SELECT COUNT(*) FROM books").fetchone()
+        preset_counts = [
+            len(conn.execute(search.SEARCH_SQL, (search.KEYWORD_PRESETS[name], total)).fetchall())
+            for name in ("Python", "Data Science", "Python & Data Science")
+        ]
+    finally:
+        conn.close()
+    assert sum(counts) == total
+    assert list(counts[:3]) == preset_counts
+
+
+def test_invalid_syntax_falls_back_to_quoted_terms(books_db):
+    conn = sqlite3.connect(f"file:{books_db}?mode=ro", uri=True)
+    try:
+        with pytest.raises(sqlite3.OperationalError) as error:
+            conn.execute(search.SEARCH_SQL, ('c++ "unclosed', 10)).fetchall()
+        assert search.is_syntax_error(error.value)
+        assert search.quote_terms('c++ "unclosed') == '"c++" """unclosed"'
+        conn.execute(search.SEARCH_SQL, (search.quote_terms('c++ "unclosed'), 10)).fetchall()
+    finally:
+        conn.close()
@@ -0,0 +1,128 @@
+import shutil
+import sqlite3
+from contextlib import closing
+
+import numpy as np
+import pytest
+
+import ingest
+import migrations
+import similarity
+
+
+def _copy(books_db, path):
+    shutil.copy(books_db, path)
+    return str(path)
+
+
+# Rows of books with a description, as BOOK_COLUMNS tuples
+def _rows(db_path, n):
+    with closing(sqlite3.connect(db_path)) as conn:
+        return conn.execute(
+            f"SELECT {', '.join(migrations.BOOK_COLUMNS)} FROM books"
+            " WHERE length(book_description) > 200 ORDER BY rowid LIMIT ?", (n,),
+        ).fetchall()
+
+
+# The same edit through the loader: a book takes the text of another, a copy
+# of a third is added under a new id, and a fourth is deleted
+def _edit(db_path):
+    first, second, third, fourth = _rows(db_path, 4)
+    edited = list(first)
+    for column in similarity.TEXT_WEIGHTS:
+        position = migrations.BOOK_COLUMNS.index(column)
+        edited[position] = second[position]
+    added = ("new-book",) + third[1:]
+    loader = ingest.Loader(db_path)
+    try:
+        loader.write_rows([tuple(edited), added])
+    finally:
+        loader.close()
+    with closing(sqlite3.connect(db_path)) as conn, conn:
+        conn.execute("DELETE FROM books WHERE book_id = ?", (fourth[0],))
+        migrations.refresh_dimensions(conn)
+    return first[0], second[0], third[0], fourth[0]
+
+
+# Every book's neighbours from the stored vectors by brute force: the dot
+# products of the dense matrix, best k above zero
+def _brute_force(db_path, k):
+    with closing(sqlite3.connect(similarity.index_path(db_path))) as index:
+        vectors = index.execute("SELECT doc, book_id, features, weights FROM vectors ORDER BY doc").fetchall()
+        stored = index.execute("""
+            SELECT v.book_id, n.rank, other.book_id, n.score
+            FROM neighbors AS n JOIN vectors AS v ON v.doc = n.doc JOIN vectors AS other ON other.doc = n.neighbor
+        """).fetchall()
+    features = [np.frombuffer(row[2], dtype=np.int32) for row in vectors]
+    columns = {feature: column for column, feature in enumerate(np.unique(np.concatenate(features)).tolist())}
+    dense = np.zeros((len(vectors), len(columns)))
+    for row, (doc_features, (_, _, _, weights)) in enumerate(zip(features, vectors)):
+        dense[row, [columns[feature] for feature in doc_features.tolist()]] = np.frombuffer(weights, dtype=np.float32)
+    scores = dense @ dense.T
+    np.fill_diagonal(scores, 0)
+    book_ids = [row[1] for row in vectors]
+    expected = {}
+    for row, book_id in enumerate(book_ids):
+        best = sorted(scores[row][scores[row] > 1e-6], reverse=True)[:k]
+        expected[book_id] = best
+    position = {book_id: row for row, book_id in enumerate(book_ids)}
+    return expected, scores, position, stored
+
+
+def _check_index(db_path, k=similarity.K):
+    expected, scores, position, stored = _brute_force(db_path, k)
+    lists = {}
+    for book_id, rank, other, score in stored:
+        # Each stored score is the product of the stored vectors
+        assert score == pytest.approx(scores[position[book_id], position[other]], abs=1e-5)
+        lists.setdefault(book_id, {})[rank] = score
+    for book_id, best in expected.items():
+        found = lists.get(book_id, {})
+        assert [found[rank] for rank in sorted(found)] == pytest.approx(best, abs=1e-5)
+
+
+@pytest.fixture
+def built(books_db, tmp_path):
+    path = _copy(books_db, tmp_path / "books_database.db")
+    similarity.build(path, workers=1)
+    return path
+
+
+def test_build(built):
+    _check_index(built)
+    book_id = _rows(built, 1)[0][0]
+    neighbours = similarity.similar(built, book_id)
+    assert len(neighbours) == similarity.K
+    assert [score for _, score in neighbours] == sorted((score for _, score in neighbours), reverse=True)
+    assert similarity.update(built, workers=1) == similarity.Update(0, 0, 0, 0)
+
+
+def test_not_built(books_db, tmp_path):
+    path = _copy(books_db, tmp_path / "books_database.db")
+    assert not similarity.available(path)
+    assert similarity.similar(path, "any") is None
+
+
+# An incremental update after a loader-driven edit keeps every list the best
+# k of the stored vectors, and the edited books find what a full build finds.
+# Document frequencies drift from a full build's until the next rebuild (a
+# word of the twin's that only it had was left out of its vector), so the
+# neighbours are compared rather than the scores.
+def test_update_matches_build(books_db, built, tmp_path):
+    edited, twin, copied, deleted = _edit(built)
+    result = similarity.update(built, workers=1)
+    assert (result.added, result.changed, result.removed) == (1, 1, 1)
+    _check_index(built)
+    assert similarity.update(built, workers=1) == similarity.Update(0, 0, 0, 0)
+
+    fresh = _copy(books_db, tmp_path / "fresh.db")
+    _edit(fresh)
+    similarity.build(fresh, workers=1)
+    for book_id in (edited, "new-book"):
+        updated, rebuilt = similarity.similar(built, book_id), similarity.similar(fresh, book_id)
+        assert [other for other, _ in updated[:3]] == [other for other, _ in rebuilt[:3]]
+        assert len({other for other, _ in updated} & {other for other, _ in rebuilt}) >= similarity.K - 2
+    assert similarity.similar(built, edited)[0][0] == twin
+    assert similarity.similar(built, "new-book")[0][0] == copied
+    assert similarity.similar(built, deleted) == []
+    assert all(other != deleted for book_id in (twin, copied) for other, _ in similarity.similar(built, book_id))
@@ -0,0 +1,62 @@
+import shutil
+import sqlite3
+
+import pytest
+
+import summaries
+
+
+@pytest.fixture
+def conn(books_db, tmp_path):
+    path = str(tmp_path / "books_database.db")
+    shutil.copy(books_db, path)
+    conn = sqlite3.connect(path)
+    yield conn
+    conn.close()
+
+
+# Rows keyed by (dimension, group_key), sums rounded off the float drift of
+# adding and removing deltas
+def _rows(conn, sql):
+    return {
+        row[:2]: tuple(round(value, 6) if isinstance(value, float) else value for value in row[2:])
+        for row in conn.execute(sql)
+    }
+
+
+def _assert_fresh(conn):
+    assert _rows(conn, "SELECT * FROM book_summary") == _rows(conn, summaries.SUMMARY_ROWS_SQL)
+
+
+def test_columns():
+    assert summaries.METRIC_COLUMNS == ["rating_n", "rating_sum", "pages_n", "pages_sum", "price_n", "price_sum"]
+
+
+# The triggers keep book_summary equal to a fresh GROUP BY through inserts,
+# updates of every source column and deletes
+def test_triggers_match_group_by(conn):
+    _assert_fresh(conn)
+    book_ids = [book_id for book_id, in conn.execute("SELECT book_id FROM books ORDER BY book_id LIMIT 4")]
+    publisher_id, = conn.execute("SELECT MAX(publisher_id) FROM books").fetchone()
+    with conn:
+        conn.execute("""
+            INSERT INTO books (book_id, book_title, pageCount, averageRating, isEbook,
+                               amount_retailPrice, currencyCode_retailPrice, year)
+            VALUES ('summary-test', 'A New Book', 321, 4.5, 1, 10, 'EUR', '1999')
+        """)
+        conn.execute("UPDATE books SET averageRating = 1.5, pageCount = NULL WHERE book_id = ?", book_ids[:1])
+        conn.execute("UPDATE books SET year = '1850', isEbook = 1 - isEbook WHERE book_id = ?", book_ids[1:2])
+        conn.execute("UPDATE books SET publisher_id = ?, category_id = NULL WHERE book_id = ?",
+                     (publisher_id, book_ids[2]))
+        conn.execute("UPDATE books SET amount_retailPrice = 99.5, currencyCode_retailPrice = 'INR'"
+                     " WHERE book_id = ?", book_ids[3:4])
+        conn.execute("DELETE FROM books WHERE book_id = ?", book_ids[:1])
+    _assert_fresh(conn)
+    assert conn.execute("SELECT price_usd FROM books WHERE book_id = 'summary-test'").fetchone()[0] > 10
+    assert conn.execute("SELECT COUNT(*) FROM book_summary WHERE book_count <= 0").fetchone() == (0,)
+
+
+def test_rebuild(conn):
+    conn.execute("UPDATE book_summary SET rating_sum = 0, book_count = book_count + 1")
+    summaries.rebuild(conn)
+    _assert_fresh(conn)
@@ -0,0 +1,106 @@
+"""
+What each question's page shows, computed from the question's result: the
+table, the Analysis text, and the values its chart and captions need.
+
+The dashboard pages and the headless report (report.py) both go through
+`view()`, so a report section shows what the page shows: the rating
+outliers rather than every rated book, the books above the average ratings
+count rather than all of them, and the same analysis text.
+"""
+
+from collections import namedtuple
+
+import pandas as pd
+
+import figures
+import insights
+import outliers
+import queries
+
+
+# `table` is the result as the page lists it, `text` the Analysis markdown and
+# `data` what else the page draws or prints (counts, an average, a center)
+View = namedtuple("View", ["table", "text", "data"], defaults=[None])
+
+
+# A result as a DataFrame: single-row results become a frame of one row
+def result_frame(question_id, result):
+    if isinstance(result, pd.DataFrame):
+        return result
+    return pd.DataFrame([result] if result else [], columns=queries.QUESTIONS[question_id].columns)
+
+
+# 1. The (isEbook, count) rows as the two format counts
+def _ebook_view(result):
+    rows = result.itertuples(index=False, name=None) if isinstance(result, pd.DataFrame) else result
+    counts = figures.ebook_counts(list(rows))
+    table = pd.DataFrame({"Format": list(counts), "Book Count": list(counts.values())})
+    return View(table, insights.analysis("q1", counts), counts)
+
+
+# 6. The text names the minimum discount the result was queried with
+def _discount_view(frame, min_discount=queries.QUESTIONS["q6"].params[0]):
+    return View(frame, insights.analysis("q6", frame, min_discount))
+
+
+def _page_count_view(frame):
+    table = figures.label_book_types(frame)
+    return View(table, insights.analysis("q7", table))
+
+
+# 12. The books rated more often than the average book
+def _above_average_view(frame):
+    counts = pd.to_numeric(frame["Rating Count"], errors="coerce")
+    average = counts.mean()
+    return View(frame[counts > average], insights.analysis("q12", frame, average), average)
+
+
+def _same_year_view(frame):
+    table = frame.dropna(subset=["Authors", "Year"])
+    return View(table, insights.analysis("q13", table))
+
+
+# 14. Search results with the relevance higher-is-better (bm25() is
+# lower-is-better); the text is about the keyword counts
+def _keyword_view(frame, counts=None):
+    table = frame.assign(Relevance=-frame["Relevance"])
+    return View(table, insights.analysis("q14", counts), counts)
+
+
+def _streak_view(frame, min_years=queries.QUESTIONS["q16"].params[0]):
+    return View(frame, insights.analysis("q16", frame, min_years))
+
+
+# 19. The rated books outside `k` spreads of `method` (outliers.py), compared
+# within `group_by` (a column) or against all books. `data` is the reference
+# rating, when there is a single one.
+def _rating_outlier_view(frame, method="zscore", k=None, group_by=None):
+    groups = None if group_by is None else frame[group_by]
+    detected = outliers.detect_outliers(frame["Average Rating"].to_numpy(dtype=float), method, k, groups)
+    table = frame[detected.mask].reset_index(drop=True)
+    center = None
+    if groups is None:
+        table = table[["Title", "Average Rating", "Ratings Count"]]
+        center = float(detected.center[0]) if len(frame) else None
+    return View(table, insights.analysis("q19", table, center), center)
+
+
+# Question id -> view(result, *page settings); the others list their result
+# as it is
+VIEWS = {
+    "q1": _ebook_view,
+    "q6": _discount_view,
+    "q7": _page_count_view,
+    "q12": _above_average_view,
+    "q13": _same_year_view,
+    "q14": _keyword_view,
+    "q16": _streak_view,
+    "q19": _rating_outlier_view,
+}
+
+
+def view(question_id, result, *settings):
+    build = VIEWS.get(question_id)
+    if build is None:
+        return View(result_frame(question_id, result), insights.analysis(question_id, result))
+    return build(result, *settings)